@@ -1,25 +1,467 @@
-from flask import Flask, render_template
-from blueprints.users import users_bp
-from blueprints.movies import movies_bp
-from blueprints.reviews import reviews_bp
+import time
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'a_very_secret_key'
+# Start of the import of this module and everything it imports, reported
+# as the "import" startup phase by create_app. Taken before the imports it
+# measures, hence their "noqa: E402".
+_IMPORT_STARTED = time.perf_counter()
 
-app.register_blueprint(users_bp)
-app.register_blueprint(movies_bp)
-app.register_blueprint(reviews_bp)
+import logging  # noqa: E402
+import os  # noqa: E402
+import threading  # noqa: E402
+from collections import defaultdict  # noqa: E402
+
+import click  # noqa: E402
+from flask import (  # noqa: E402
+    Flask, render_template, jsonify, Response, current_app)
+from flask.cli import with_appcontext  # noqa: E402
+from werkzeug.local import LocalProxy  # noqa: E402
+from blueprints.users import users_bp  # noqa: E402
+from blueprints.movies import movies_bp  # noqa: E402
+from blueprints.reviews import reviews_bp  # noqa: E402
+from blueprints.search import search_bp  # noqa: E402
+from blueprints.browse import browse_bp  # noqa: E402
+from blueprints.posters import posters_bp  # noqa: E402
+from blueprints.api import api_bp  # noqa: E402
+from datamanager.sqlite_data_manager import SQLiteDataManager  # noqa: E402
+from datamanager.query_plans import check_query_plans  # noqa: E402
+from static.omdb_cache import OMDbCache  # noqa: E402
+from static.omdb_client import OMDbClient, Unavailable  # noqa: E402
+from static.omdb_guard import CircuitBreaker, TokenBucket  # noqa: E402
+from static.utils import OMDB_API_KEY, OMDB_API_URL  # noqa: E402
+from static.library_import import (  # noqa: E402
+    read_titles, import_library, split_genres, register_import)
+from static.posters import PosterStore  # noqa: E402
+from page_cache import PageCache, LRUBackend, SQLiteBackend  # noqa: E402
+from instrumentation import Instrumentation  # noqa: E402
+from jobs import (  # noqa: E402
+    JobQueue, MemoryBackend, SQLiteBackend as JobStore)
+from static.enrichment import register_enrichment  # noqa: E402
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+# Settings holding SQLite file names, resolved against the app's directory
+# when relative so the app works from any working directory
+DATABASE_SETTINGS = ('DATABASE', 'OMDB_CACHE_DATABASE', 'PAGE_CACHE_DATABASE',
+                     'JOB_QUEUE_DATABASE')
+
+
+def configure(app, config=None):
+    """
+    Fill in the app's configuration: the defaults below, then the FLASK_*
+    environment overrides, then `config`.
+    """
+    app.config['SECRET_KEY'] = 'a_very_secret_key'
+    app.config['DATABASE'] = 'db/moviwebapp.db'
+
+    # Connection pool and SQLite tuning shared by every blueprint
+    app.config['DB_POOL_SIZE'] = 5
+    app.config['DB_MAX_OVERFLOW'] = 10
+    app.config['DB_POOL_TIMEOUT'] = 30
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = 5000
+    app.config['SQLITE_MMAP_SIZE'] = 256 * 1024 * 1024
+    app.config['SQLITE_CACHE_SIZE_KIB'] = 64 * 1024
+
+    # OMDb response cache: per-process LRU in front of a shared SQLite file
+    app.config['OMDB_CACHE_DATABASE'] = 'db/omdb_cache.db'
+    app.config['OMDB_CACHE_MAX_ENTRIES'] = 1024
+    app.config['OMDB_CACHE_TTL'] = 7 * 24 * 3600
+    app.config['OMDB_CACHE_NEGATIVE_TTL'] = 3600
+
+    # OMDb client: keep-alive pool, timeouts, retries and batch concurrency
+    app.config['OMDB_API_KEY'] = OMDB_API_KEY
+    app.config['OMDB_API_URL'] = OMDB_API_URL
+    app.config['OMDB_CONNECT_TIMEOUT'] = 3.05
+    app.config['OMDB_READ_TIMEOUT'] = 10
+    app.config['OMDB_RETRIES'] = 2
+    app.config['OMDB_POOL_SIZE'] = 16
+    app.config['OMDB_MAX_WORKERS'] = 8
+
+    # OMDb protection (see static.omdb_guard). OMDB_DAILY_QUOTA is the
+    # number of requests per day the API key allows this process (divide
+    # the key's quota among the workers), up to OMDB_QUOTA_BURST of them
+    # at once; None disables the quota. The defaults fit a patron key
+    # (100,000 a day) and let a 2,000-title import run in one go; for a
+    # free key (1,000 a day) set both, e.g. 1000 and 200. Lookups beyond
+    # the quota are not lost: imports and enrichment jobs wait for it.
+    # The circuit breaker opens for OMDB_BREAKER_RESET_SECONDS when at
+    # least OMDB_BREAKER_FAILURE_RATE of the last OMDB_BREAKER_WINDOW
+    # requests failed or took longer than OMDB_BREAKER_SLOW_SECONDS; an
+    # OMDB_BREAKER_WINDOW of None disables it.
+    app.config['OMDB_DAILY_QUOTA'] = 100000
+    app.config['OMDB_QUOTA_BURST'] = 5000
+    app.config['OMDB_BREAKER_WINDOW'] = 20
+    app.config['OMDB_BREAKER_MIN_CALLS'] = 10
+    app.config['OMDB_BREAKER_FAILURE_RATE'] = 0.5
+    app.config['OMDB_BREAKER_SLOW_SECONDS'] = 5.0
+    app.config['OMDB_BREAKER_RESET_SECONDS'] = 30.0
+
+    # Local poster mirror (content-addressed files + thumbnails)
+    app.config['POSTER_STORE'] = os.path.join(app.root_path, 'media',
+                                              'posters')
+
+    # Rendered-page cache: 'memory' (per process), 'sqlite' (shared by all
+    # workers through PAGE_CACHE_DATABASE) or None to disable it
+    app.config['PAGE_CACHE_BACKEND'] = 'memory'
+    app.config['PAGE_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+    app.config['PAGE_CACHE_DATABASE'] = 'db/page_cache.db'
+
+    # Background jobs (OMDb enrichment of movies added by title): 'memory'
+    # keeps the queue in the process, 'sqlite' in JOB_QUEUE_DATABASE, where
+    # queued jobs survive restarts. Failing jobs are retried JOB_MAX_ATTEMPTS
+    # times with a backoff starting at JOB_RETRY_DELAY seconds and doubling
+    # up to JOB_MAX_RETRY_DELAY, about three hours in all; lookups held
+    # back by the OMDb quota or circuit breaker wait without using up
+    # attempts. A job running from the 'sqlite' queue holds a lease of
+    # JOB_LEASE seconds, renewed while it runs; a job whose worker died or
+    # stalled for longer is handed to another worker (jobs run at least
+    # once).
+    app.config['JOB_QUEUE_BACKEND'] = 'memory'
+    app.config['JOB_QUEUE_DATABASE'] = 'db/jobs.db'
+    app.config['JOB_WORKERS'] = 4
+    app.config['JOB_MAX_ATTEMPTS'] = 10
+    app.config['JOB_RETRY_DELAY'] = 30
+    app.config['JOB_MAX_RETRY_DELAY'] = 3600
+    app.config['JOB_LEASE'] = 300
+
+    # Logging and slow-request reporting: requests running more than
+    # SLOW_REQUEST_QUERIES statements or taking longer than SLOW_REQUEST_MS
+    # are logged with their slowest statements (None disables a limit)
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+    app.config['SLOW_REQUEST_QUERIES'] = None
+    app.config['SLOW_REQUEST_MS'] = None
+    if app.debug:
+        app.config['SLOW_REQUEST_QUERIES'] = 20
+        app.config['SLOW_REQUEST_MS'] = 200
+
+    # Any setting can be overridden from the environment, e.g.
+    # FLASK_DATABASE=/tmp/bench.db or FLASK_PAGE_CACHE_BACKEND=null
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+
+    for key in DATABASE_SETTINGS:
+        if app.config[key]:
+            app.config[key] = os.path.join(app.root_path, app.config[key])
+
+
+def open_data_manager(app):
+    """
+    Open the app's SQLiteDataManager (migrating the database if needed),
+    instrumented and wired to the page cache.
+    """
+    started = time.perf_counter()
+    data_manager = SQLiteDataManager(
+        app.config['DATABASE'],
+        pool_size=app.config['DB_POOL_SIZE'],
+        max_overflow=app.config['DB_MAX_OVERFLOW'],
+        pool_timeout=app.config['DB_POOL_TIMEOUT'],
+        busy_timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'],
+        mmap_size=app.config['SQLITE_MMAP_SIZE'],
+        cache_size=app.config['SQLITE_CACHE_SIZE_KIB'])
+    instrumentation = app.extensions['instrumentation']
+    instrumentation.instrument_data_manager(data_manager)
+    page_cache = app.extensions.get('page_cache')
+    if page_cache is not None:
+        data_manager.add_invalidation_listener(page_cache.invalidate)
+    instrumentation.record_startup('data_layer',
+                                   time.perf_counter() - started)
+    return data_manager
+
+
+def lazy_data_manager(app):
+    """
+    Return a proxy to the app's data manager that opens it on first use
+    (normally the first request), so creating the app, and forking workers
+    from it, touches no database.
+    """
+    lock = threading.Lock()
+    opened = []
+
+    def get_data_manager():
+        if not opened:
+            with lock:
+                if not opened:
+                    opened.append(open_data_manager(app))
+        return opened[0]
+
+    return LocalProxy(get_data_manager)
+
+
+def create_app(config=None):
+    """
+    Create the application.
+
+    Only cheap, fork-safe objects are built here: the data manager opens
+    its engines on first use (see lazy_data_manager), and the engines drop
+    the pooled connections they hold when a worker is forked. The SQLite
+    files of the OMDb cache, the page cache and the job queue are opened
+    on first use too, by each process and thread for itself (see
+    datamanager.sqlite_engine.LocalConnections).
+
+    :param config: Optional mapping of settings overriding the defaults
+    and the FLASK_* environment (see configure).
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+    configure(app, config)
+
+    logging.basicConfig(
+        level=app.config['LOG_LEVEL'],
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    instrumentation = Instrumentation(
+        slow_request_queries=app.config['SLOW_REQUEST_QUERIES'],
+        slow_request_ms=app.config['SLOW_REQUEST_MS'])
+    instrumentation.init_app(app)
+
+    quota = None
+    if app.config['OMDB_DAILY_QUOTA'] is not None:
+        quota = TokenBucket.daily(app.config['OMDB_DAILY_QUOTA'],
+                                  app.config['OMDB_QUOTA_BURST'])
+    circuit_breaker = None
+    if app.config['OMDB_BREAKER_WINDOW'] is not None:
+        circuit_breaker = CircuitBreaker(
+            window=app.config['OMDB_BREAKER_WINDOW'],
+            min_calls=app.config['OMDB_BREAKER_MIN_CALLS'],
+            failure_rate=app.config['OMDB_BREAKER_FAILURE_RATE'],
+            slow_call_seconds=app.config['OMDB_BREAKER_SLOW_SECONDS'],
+            reset_seconds=app.config['OMDB_BREAKER_RESET_SECONDS'])
+    app.extensions['omdb_client'] = OMDbClient(
+        app.config['OMDB_API_KEY'],
+        base_url=app.config['OMDB_API_URL'],
+        cache=OMDbCache(app.config['OMDB_CACHE_DATABASE'],
+                        max_entries=app.config['OMDB_CACHE_MAX_ENTRIES'],
+                        ttl=app.config['OMDB_CACHE_TTL'],
+                        negative_ttl=app.config['OMDB_CACHE_NEGATIVE_TTL']),
+        connect_timeout=app.config['OMDB_CONNECT_TIMEOUT'],
+        read_timeout=app.config['OMDB_READ_TIMEOUT'],
+        retries=app.config['OMDB_RETRIES'],
+        pool_size=app.config['OMDB_POOL_SIZE'],
+        max_workers=app.config['OMDB_MAX_WORKERS'],
+        quota=quota,
+        circuit_breaker=circuit_breaker)
+    app.extensions['omdb_client'].add_request_listener(
+        instrumentation.record_omdb_request)
+    app.extensions['omdb_client'].add_event_listener(
+        instrumentation.record_omdb_event)
+    app.extensions['poster_store'] = PosterStore(app.config['POSTER_STORE'])
+    app.jinja_env.globals['poster_widths'] = \
+        app.extensions['poster_store'].widths
+
+    if app.config['PAGE_CACHE_BACKEND'] == 'sqlite':
+        page_cache = PageCache(SQLiteBackend(
+            app.config['PAGE_CACHE_DATABASE'],
+            max_bytes=app.config['PAGE_CACHE_MAX_BYTES']))
+    elif app.config['PAGE_CACHE_BACKEND'] == 'memory':
+        page_cache = PageCache(LRUBackend(
+            max_bytes=app.config['PAGE_CACHE_MAX_BYTES']))
+    else:
+        page_cache = None
+    if page_cache is not None:
+        app.extensions['page_cache'] = page_cache
+
+    # Opened on first use, once the page cache it notifies is set up
+    app.extensions['data_manager'] = lazy_data_manager(app)
+
+    if app.config['JOB_QUEUE_BACKEND'] == 'sqlite':
+        job_backend = JobStore(app.config['JOB_QUEUE_DATABASE'],
+                               lease=app.config['JOB_LEASE'])
+    else:
+        job_backend = MemoryBackend()
+    job_queue = JobQueue(job_backend, workers=app.config['JOB_WORKERS'],
+                         max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+                         retry_delay=app.config['JOB_RETRY_DELAY'],
+                         max_retry_delay=app.config['JOB_MAX_RETRY_DELAY'])
+    job_queue.init_app(app)
+    register_enrichment(job_queue, app.extensions['data_manager'],
+                        app.extensions['omdb_client'],
+                        app.extensions['poster_store'])
+    register_import(job_queue, app.extensions['data_manager'],
+                    app.extensions['omdb_client'])
+
+    app.register_blueprint(users_bp)
+    app.register_blueprint(movies_bp)
+    app.register_blueprint(reviews_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(browse_bp)
+    app.register_blueprint(posters_bp)
+    app.register_blueprint(api_bp)
+    app.add_url_rule('/', view_func=home)
+    app.add_url_rule('/cache/stats', view_func=cache_stats)
+    app.add_url_rule('/jobs/stats', view_func=job_stats)
+    app.add_url_rule('/metrics', view_func=metrics)
+    app.register_error_handler(404, page_not_found)
+    for command in COMMANDS:
+        app.cli.add_command(command)
+
+    instrumentation.record_startup('import', _IMPORT_SECONDS)
+    instrumentation.record_startup('create_app',
+                                   time.perf_counter() - started)
+    return app
 
 
-@app.route('/')
 def home():
     return render_template("home.html")
 
 
-@app.errorhandler(404)
+def cache_stats():
+    page_cache = current_app.extensions.get('page_cache')
+    omdb_client = current_app.extensions['omdb_client']
+    return jsonify({
+        'pages': page_cache.stats() if page_cache else None,
+        'omdb': omdb_client.cache.stats() if omdb_client.cache else None,
+        'omdb_client': omdb_client.stats(),
+    })
+
+
+def job_stats():
+    return jsonify(current_app.extensions['job_queue'].stats())
+
+
+def metrics():
+    return Response(current_app.extensions['instrumentation'].render(),
+                    mimetype='text/plain; version=0.0.4')
+
+
 def page_not_found(e):
     return render_template('404.html'), 404
 
 
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """Fail if any data-manager query needs a full table scan."""
+    problems = check_query_plans()
+    for name, statement, scans in problems:
+        click.echo(f"{name}: {'; '.join(scans)}\n    {statement}")
+    if problems:
+        raise click.ClickException(
+            f"{len(problems)} queries scan a table")
+    click.echo("All data-manager queries use an index.")
+
+
+@click.command('import-library')
+@with_appcontext
+@click.argument('user_id', type=int)
+@click.argument('import_file', type=click.File('rb'))
+def import_library_command(user_id, import_file):
+    """Import a CSV/JSON export of titles into a user's library."""
+    titles = read_titles(import_file, import_file.name)
+    data_manager = current_app.extensions['data_manager']
+    omdb_client = current_app.extensions['omdb_client']
+
+    def progress(report):
+        click.echo(f"Resolved {report['done']}/{report['total']} titles")
+
+    report = import_library(data_manager, omdb_client, user_id, titles,
+                            progress=progress)
+    while report['deferred']:
+        # Held back by the OMDb quota or circuit breaker
+        delay = max(1.0, omdb_client.retry_after())
+        click.echo(f"OMDb unavailable, retrying {len(report['deferred'])} "
+                   f"titles in {delay:.0f} s")
+        time.sleep(delay)
+        report = import_library(data_manager, omdb_client, user_id,
+                                report['deferred'], progress=progress,
+                                report=report)
+    for failure in report['failures']:
+        click.echo(f"  {failure['title']}: {failure['error']}")
+    click.echo(f"Imported {report['imported']} of {report['total']} titles.")
+
+
+@click.command('backfill-genres')
+@with_appcontext
+@click.option('--batch-size', default=200, show_default=True)
+def backfill_genres_command(batch_size):
+    """Link movies added before genres were stored to their OMDb genres."""
+    data_manager = current_app.extensions['data_manager']
+    omdb_client = current_app.extensions['omdb_client']
+
+    after_id, checked, linked = 0, 0, 0
+    while True:
+        movies = data_manager.get_movies_missing_genres(after_id, batch_size)
+        if not movies:
+            break
+        resolved = omdb_client.fetch_many(title for _, title in movies)
+        if any(isinstance(data, Unavailable) for data in resolved.values()):
+            # Held back by the OMDb quota or circuit breaker: the batch
+            # is looked up again (the found titles from the cache)
+            delay = max(1.0, omdb_client.retry_after())
+            click.echo(f"OMDb unavailable, retrying in {delay:.0f} s")
+            time.sleep(delay)
+            continue
+        after_id = movies[-1][0]
+        linked += data_manager.add_movie_genres({
+            movie_id: split_genres(resolved[title].get('Genre'))
+            for movie_id, title in movies if resolved.get(title)})
+        checked += len(movies)
+        click.echo(f"Checked {checked} movies, added {linked} genre links")
+
+
+@click.command('refresh-recommendations')
+@with_appcontext
+@click.option('--full', is_flag=True,
+              help='Recompute every movie, not only those with new ratings.')
+def refresh_recommendations_command(full):
+    """Recompute the similar movies shown on the movie pages."""
+    # NumPy/SciPy are only loaded by the commands needing them
+    from static.recommendations import refresh_similarities, \
+        SPARSE_AVAILABLE
+
+    if not SPARSE_AVAILABLE:
+        click.echo("numpy/scipy are not installed, using the slower "
+                   "pure-Python fallback (pip install -r "
+                   "requirements-optional.txt).", err=True)
+    result = refresh_similarities(current_app.extensions['data_manager'],
+                                  full=full)
+    if not result.movies and not result.patched:
+        click.echo("No rating changes since the last refresh.")
+        return
+    click.echo(f"Stored {result.neighbours} similar movies of "
+               f"{result.movies} recomputed and {result.patched} updated "
+               f"movies in {result.seconds:.1f} s ({result.backend}).")
+
+
+@click.command('requeue-dead-jobs')
+@with_appcontext
+def requeue_dead_jobs_command():
+    """Queue the dead-lettered jobs of the SQLite job queue again."""
+    count = current_app.extensions['job_queue'].requeue_dead()
+    click.echo(f"Requeued {count} jobs; the app's workers will run them.")
+
+
+@click.command('rebuild-aggregates')
+@with_appcontext
+def rebuild_aggregates_command():
+    """Recompute the movie and user rating aggregates from the reviews."""
+    current_app.extensions['data_manager'].rebuild_rating_aggregates()
+    click.echo("Rating aggregates rebuilt.")
+
+
+@click.command('backfill-posters')
+@with_appcontext
+def backfill_posters_command():
+    """Mirror the posters of movies added before the local poster store."""
+    data_manager = current_app.extensions['data_manager']
+    poster_store = current_app.extensions['poster_store']
+
+    movies_by_url = defaultdict(list)
+    for movie_id, url in data_manager.get_movies_missing_posters():
+        movies_by_url[url].append(movie_id)
+
+    for done, (url, movie_ids) in enumerate(movies_by_url.items(), 1):
+        digest = poster_store.mirror(url)
+        if digest:
+            data_manager.set_poster_hash(movie_ids, digest)
+        click.echo(f"[{done}/{len(movies_by_url)}] {url}: "
+                   f"{digest or 'failed'}")
+
+
+COMMANDS = [check_query_plans_command, import_library_command,
+            backfill_genres_command, refresh_recommendations_command,
+            requeue_dead_jobs_command, rebuild_aggregates_command,
+            backfill_posters_command]
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,138 @@
+"""
+Concurrent-request throughput of the async data layer against the
+threaded synchronous one.
+
+    python -m benchmarks.async_load /tmp/bench.db --concurrency 1 8 32
+
+On a seeded database (see benchmarks.seed), at each concurrency level:
+--requests simulated movie-page requests (the movie, its reviews and its
+similar movies, plus an OMDb lookup answered by a stub server after
+--omdb-latency seconds), run by a thread pool of that size over
+SQLiteDataManager and by that many tasks of one event loop over
+AsyncSQLiteDataManager (whose OMDb lookups still run on the client's
+thread pool, see OMDbClient.fetch_async).
+
+The async measurements need aiosqlite; they are skipped without it.
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import random
+import sqlite3
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_omdb import StubOMDbServer
+from datamanager.async_data_manager import AsyncSQLiteDataManager
+from datamanager.sqlite_data_manager import SQLiteDataManager
+from static.omdb_client import OMDbClient
+
+
+def _sample_ids(db_file_name, table, count, rng):
+    connection = sqlite3.connect(db_file_name)
+    ids = [row_id for (row_id,) in connection.execute(
+        f'SELECT id FROM {table}')]
+    connection.close()
+    return [rng.choice(ids) for _ in range(count)]
+
+
+def _summary(elapsed, latencies):
+    latencies = sorted(latencies)
+    return (len(latencies) / elapsed, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.95) - 1] * 1000)
+
+
+def sync_requests(data_manager, omdb_client, movie_ids, concurrency):
+    """The simulated requests on a thread pool, one query after the other."""
+
+    def handle(movie_id):
+        started = time.perf_counter()
+        data_manager.get_movie(movie_id)
+        data_manager.get_movie_reviews(movie_id)
+        data_manager.get_similar_movies(movie_id)
+        omdb_client.fetch(f'Load {movie_id}')
+        return time.perf_counter() - started
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(handle, movie_ids))
+    return _summary(time.perf_counter() - began, latencies)
+
+
+async def async_requests(data_manager, omdb_client, movie_ids,
+                         concurrency):
+    """The simulated requests as tasks of one event loop, each awaiting
+    its queries and lookup concurrently."""
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def handle(movie_id):
+        async with in_flight:
+            started = time.perf_counter()
+            await asyncio.gather(
+                data_manager.get_movie(movie_id),
+                data_manager.get_movie_reviews(movie_id),
+                data_manager.get_similar_movies(movie_id),
+                omdb_client.fetch_async(f'Load {movie_id}'))
+            return time.perf_counter() - started
+
+    began = time.perf_counter()
+    latencies = await asyncio.gather(*map(handle, movie_ids))
+    return _summary(time.perf_counter() - began, latencies)
+
+
+def _print(mode, concurrency, result):
+    rate, p50, p95 = result
+    print(f"{mode:<24} {concurrency:>5} {rate:>9.1f} {p50:>9.2f} "
+          f"{p95:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('database', help='Seeded database')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--omdb-latency', type=float, default=0.05,
+                        help='Stub OMDb latency per request in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    has_aiosqlite = importlib.util.find_spec('aiosqlite') is not None
+    if not has_aiosqlite:
+        print("aiosqlite is not installed: skipping the async runs")
+
+    db_file_name = os.path.abspath(args.database)
+    # Opens (and migrates) the database before the IDs are sampled
+    data_manager = SQLiteDataManager(db_file_name)
+    rng = random.Random(args.seed)
+    movie_ids = _sample_ids(db_file_name, 'movies', args.requests, rng)
+
+    print(f"{'mode':<24} {'conc':>5} {'req/s':>9} {'p50 ms':>9} "
+          f"{'p95 ms':>9}")
+    with StubOMDbServer(latency=args.omdb_latency) as omdb:
+        for concurrency in args.concurrency:
+            omdb_client = OMDbClient('bench', base_url=omdb.url,
+                                     pool_size=concurrency,
+                                     max_workers=concurrency)
+            _print('data layer: threads', concurrency, sync_requests(
+                data_manager, omdb_client, movie_ids, concurrency))
+            if has_aiosqlite:
+                async def run():
+                    async_data_manager = await AsyncSQLiteDataManager.open(
+                        db_file_name, pool_size=concurrency)
+                    try:
+                        return await async_requests(
+                            async_data_manager, omdb_client, movie_ids,
+                            concurrency)
+                    finally:
+                        await async_data_manager.dispose()
+
+                _print('data layer: asyncio', concurrency, asyncio.run(run()))
+            omdb_client.close()
+    data_manager.dispose()
+
+
+if __name__ == '__main__':
+    main()
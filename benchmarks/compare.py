@@ -0,0 +1,76 @@
+"""
+Compare two benchmarks.harness result files.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Prints p50/p95/p99 and throughput of every case present in both runs
+with the relative change; changes beyond --threshold percent are
+flagged. Exits with status 1 when any case got slower by more than the
+threshold at p50 or p95, so it can gate a CI job.
+"""
+import argparse
+import json
+
+
+def _change(before, after):
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before, after, threshold):
+    """
+    :return: (rows, regressions) where rows are printable lines and
+    regressions the names of the cases slower by more than `threshold`.
+    """
+    rows, regressions = [], []
+    for name, old in before['results'].items():
+        new = after['results'].get(name)
+        if new is None:
+            continue
+        changes = {metric: _change(old[metric], new[metric])
+                   for metric in ('p50_ms', 'p95_ms', 'p99_ms')}
+        flags = ''
+        if any(change is not None and change > threshold
+               for metric, change in changes.items()
+               if metric in ('p50_ms', 'p95_ms')):
+            regressions.append(name)
+            flags = ' SLOWER'
+        elif all(change is not None and change < -threshold
+                 for metric, change in changes.items()
+                 if metric in ('p50_ms', 'p95_ms')):
+            flags = ' faster'
+        cells = ''.join(
+            f" {new[metric]:>9.2f} {changes[metric] or 0:>+7.1f}%"
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'))
+        rows.append(f"{name:<42}{cells}{flags}")
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='Percent change reported as a regression')
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+
+    print(f"{'case':<42} {'p50 ms':>9} {'change':>8} {'p95 ms':>9} "
+          f"{'change':>8} {'p99 ms':>9} {'change':>8}")
+    rows, regressions = compare(before, after, args.threshold)
+    print('\n'.join(rows))
+    only = set(before['results']) ^ set(after['results'])
+    if only:
+        print(f"{len(only)} cases ran in only one of the two runs")
+    if regressions:
+        raise SystemExit(f"{len(regressions)} cases slower by more than "
+                         f"{args.threshold:g}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Latency of the faceted browse queries on a large synthetic catalog.
+
+    python -m benchmarks.facets --movies 1000000
+
+Times SQLiteDataManager.get_facets (one grouped statement) against the
+naive alternative of one COUNT query per genre, decade and rating band,
+and find_movies narrowed to a genre.
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from datamanager.normalize import name_key
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+GENRES = ['Drama', 'Comedy', 'Action', 'Thriller', 'Romance', 'Crime',
+          'Adventure', 'Horror', 'Sci-Fi', 'Mystery', 'Fantasy', 'Family',
+          'Biography', 'Animation', 'History', 'War', 'Music', 'Sport',
+          'Documentary', 'Western', 'Musical', 'Film-Noir', 'News',
+          'Short']
+
+
+def populate(db_file_name, movies, seed=42, batch_size=10000):
+    """Fill a migrated database with `movies` movies linked to 1-3 genres."""
+    rng = random.Random(seed)
+    genre_ids = list(range(1, len(GENRES) + 1))
+    # Zipf-like skew so a few genres are on most movies
+    weights = list(itertools.accumulate(
+        1 / rank for rank in range(1, len(GENRES) + 1)))
+
+    connection = sqlite3.connect(db_file_name)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.execute("INSERT INTO users (name, lastname) VALUES ('b', 'b')")
+    connection.executemany(
+        'INSERT INTO directors (id, name, name_key) VALUES (?, ?, ?)',
+        [(i, f'Director {i}', name_key(f'Director {i}'))
+         for i in range(1, 5001)])
+    connection.executemany('INSERT INTO genres (id, name) VALUES (?, ?)',
+                           zip(genre_ids, GENRES))
+    for start in range(0, movies, batch_size):
+        rows, links = [], []
+        for movie_id in range(start + 1,
+                              start + min(batch_size, movies - start) + 1):
+            year = rng.randint(1920, 2024)
+            rating = round(rng.uniform(1, 10), 1)
+            rows.append((movie_id, f'Movie {movie_id}',
+                         rng.randint(1, 5000), str(year), year, year,
+                         f'{rating:.1f}', rating))
+            links.extend((movie_id, genre_id) for genre_id in set(
+                rng.choices(genre_ids, cum_weights=weights,
+                            k=rng.randint(1, 3))))
+        connection.executemany(
+            'INSERT INTO movies (id, title, director_id, year, year_start,'
+            ' year_end, rating, imdb_rating)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        connection.executemany(
+            'INSERT INTO movie_genre (movie_id, genre_id) VALUES (?, ?)',
+            links)
+        connection.commit()
+    connection.execute('ANALYZE')
+    connection.commit()
+    connection.close()
+    return genre_ids
+
+
+def count_per_value(connection, genre_id=None, min_rating=None):
+    """The facet counts with one COUNT query per genre, decade and band."""
+    conditions, parameters = ['1'], []
+    if genre_id is not None:
+        conditions.append('id IN (SELECT movie_id FROM movie_genre'
+                          ' WHERE genre_id = ?)')
+        parameters.append(genre_id)
+    if min_rating is not None:
+        conditions.append('imdb_rating >= ?')
+        parameters.append(min_rating)
+    where = ' AND '.join(conditions)
+    counts = {}
+    for (value,) in connection.execute('SELECT id FROM genres').fetchall():
+        counts['genre', value] = connection.execute(
+            'SELECT count(*) FROM movie_genre JOIN movies'
+            ' ON movies.id = movie_genre.movie_id'
+            f' WHERE movie_genre.genre_id = ? AND {where}',
+            [value] + parameters).fetchone()[0]
+    for decade in range(1920, 2030, 10):
+        counts['decade', decade] = connection.execute(
+            f'SELECT count(*) FROM movies WHERE {where}'
+            ' AND year_start BETWEEN ? AND ?',
+            parameters + [decade, decade + 9]).fetchone()[0]
+    for band in range(1, 10):
+        counts['rating', band] = connection.execute(
+            f'SELECT count(*) FROM movies WHERE {where}'
+            ' AND imdb_rating >= ? AND imdb_rating < ?',
+            parameters + [band, band + 1]).fetchone()[0]
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--movies', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file_name = os.path.join(tmp_dir, 'facets.db')
+        SQLiteDataManager(db_file_name).dispose()
+
+        start = time.perf_counter()
+        genre_ids = populate(db_file_name, args.movies)
+        print(f"Populated {args.movies} movies in "
+              f"{time.perf_counter() - start:.1f} s")
+
+        data_manager = SQLiteDataManager(db_file_name)
+        connection = sqlite3.connect(db_file_name)
+        rng = random.Random(7)
+        # Rare genres are where an unindexed genre filter hurts most
+        cases = {
+            'get_facets': lambda: data_manager.get_facets(),
+            'get_facets(genre, rating)': lambda: data_manager.get_facets(
+                genre_id=rng.choice(genre_ids), min_rating=7),
+            'count per value': lambda: count_per_value(connection),
+            'count per value(genre, rating)': lambda: count_per_value(
+                connection, genre_id=rng.choice(genre_ids), min_rating=7),
+            'find_movies(genre)': lambda: data_manager.find_movies(
+                genre_id=rng.choice(genre_ids)),
+            'find_movies(rare genre, 90s)': lambda: data_manager.find_movies(
+                genre_id=rng.choice(genre_ids[-5:]), min_year=1990,
+                max_year=1999, sort='year'),
+        }
+        print(f"{'query':<32} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+        for name, run in cases.items():
+            timings = []
+            for _ in range(args.queries):
+                began = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - began) * 1000)
+            timings.sort()
+            print(f"{name:<32} {statistics.median(timings):>9.2f} "
+                  f"{timings[int(len(timings) * 0.95) - 1]:>9.2f} "
+                  f"{timings[-1]:>9.2f}")
+        connection.close()
+        data_manager.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,539 @@
+"""
+End-to-end benchmark of every route and SQLiteDataManager method.
+
+    python -m benchmarks.seed /tmp/bench.db --scale medium
+    python -m benchmarks.harness /tmp/bench.db --out before.json
+    ... change something ...
+    python -m benchmarks.harness /tmp/bench.db --out after.json
+    python -m benchmarks.compare before.json after.json
+
+Routes are driven through the Flask test client of the real app, with
+OMDb replaced by benchmarks.stub_omdb. Each case runs until it reached
+--iterations calls or --max-seconds; the report gives p50/p95/p99
+latency and throughput per case. Write cases create their own targets
+(the review they delete, ...) outside the timed call, but they do change
+the database: benchmark a copy of the seeded file.
+"""
+import argparse
+import inspect
+import io
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from benchmarks.stub_omdb import StubOMDbServer
+
+# prepare() runs untimed and returns the arguments of the timed run()
+Case = namedtuple('Case', ['name', 'run', 'prepare', 'ok'])
+
+
+def case(name, run, prepare=None, ok=(200,)):
+    return Case(name, run, prepare, ok)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1,
+                       round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings, elapsed, errors):
+    timings = sorted(timings)
+    return {
+        'n': len(timings),
+        'errors': errors,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'mean_ms': sum(timings) / len(timings) * 1000,
+        'max_ms': timings[-1] * 1000,
+        'ops_per_s': len(timings) / elapsed if elapsed else None,
+    }
+
+
+def run_case(bench_case, iterations, max_seconds, warmup=3):
+    """Time one case; returns its summary dict."""
+    timings, errors = [], 0
+    deadline = time.perf_counter() + max_seconds
+    total = 0.0
+    for index in range(warmup + iterations):
+        args = bench_case.prepare() if bench_case.prepare else ()
+        started = time.perf_counter()
+        result = bench_case.run(*args)
+        elapsed = time.perf_counter() - started
+        status = getattr(result, 'status_code', None)
+        if index >= warmup:
+            timings.append(elapsed)
+            total += elapsed
+            if status is not None and status not in bench_case.ok:
+                errors += 1
+        if time.perf_counter() > deadline and timings:
+            break
+    return summarize(timings, total, errors)
+
+
+class _Ids:
+    """Random existing row IDs of the benchmarked database."""
+
+    def __init__(self, db_file_name, rng, sample=2000):
+        self.rng = rng
+        connection = sqlite3.connect(db_file_name)
+        try:
+            self.pools = {
+                table: self._sample(connection, table, sample)
+                for table in ('users', 'movies', 'reviews', 'directors',
+                              'genres')}
+            self.director_names = [row[0] for row in connection.execute(
+                'SELECT name FROM directors WHERE id IN (%s)' % ','.join(
+                    map(str, self.pools['directors'][:200])))]
+        finally:
+            connection.close()
+        empty = [table for table, ids in self.pools.items() if not ids]
+        if empty:
+            raise SystemExit(f"No rows in {', '.join(empty)}; "
+                             f"fill the database with benchmarks.seed")
+
+    def _sample(self, connection, table, sample):
+        top = connection.execute(
+            f'SELECT coalesce(max(id), 0) FROM {table}').fetchone()[0]
+        if not top:
+            return []
+        candidates = {self.rng.randint(1, top) for _ in range(sample)}
+        return [row[0] for row in connection.execute(
+            f'SELECT id FROM {table} WHERE id IN '
+            f'({",".join(map(str, candidates))})')]
+
+    def pick(self, table):
+        return self.rng.choice(self.pools[table])
+
+    def user(self):
+        return self.pick('users')
+
+    def movie(self):
+        return self.pick('movies')
+
+    def review(self):
+        return self.pick('reviews')
+
+    def director(self):
+        return self.pick('directors')
+
+    def genre(self):
+        return self.pick('genres')
+
+
+def _poster_bytes():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 450), (120, 40, 90)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def route_cases(app, ids, rng):
+    """Cases driving every route through the test client."""
+    from models import Review, User
+
+    client = app.test_client()
+    data_manager = app.extensions['data_manager']
+    job_queue = app.extensions['job_queue']
+    digest = app.extensions['poster_store'].store(_poster_bytes())
+    counter = iter(range(10 ** 9))
+    words = ['plan', 'the', 'night', 'love', 'man', 'war', 'city', 'star']
+
+    def new_movie():
+        user_id = ids.user()
+        client.post(f'/users/{user_id}/add_movie',
+                    data={'title': f'Bench Movie {next(counter)}'})
+        page = data_manager.get_user_movies_page(user_id, sort='added',
+                                                 limit=1)
+        return user_id, page.items[0].id
+
+    def new_review():
+        return (data_manager.add_review(Review(
+            user_id=ids.user(), movie_id=ids.movie(),
+            review_text='benchmark review', rating=7)),)
+
+    def drained(response):
+        # Streamed bodies are only produced while they are read
+        response.get_data()
+        return response
+
+    def validator(path):
+        etag = client.get(path).headers.get('ETag')
+        return path, {'If-None-Match': etag}
+
+    yield case('GET /', lambda: client.get('/'))
+    yield case('GET /users', lambda: client.get('/users'))
+    yield case('GET /users?after=<cursor>',
+               lambda cursor: client.get('/users', query_string={
+                   'after': cursor} if cursor else {}),
+               lambda: (data_manager.get_users_page().next_cursor,))
+    for sort in ('title', 'year', 'rating', 'added', 'community'):
+        yield case(f'GET /users/<id>?sort={sort}', lambda sort=sort:
+                   client.get(f'/users/{ids.user()}?sort={sort}'))
+    yield case('GET /users/<id> filtered', lambda: client.get(
+        f'/users/{ids.user()}?sort=year&min_year=1990&max_year=2010'
+        f'&min_rating=7'))
+    yield case('GET /users/<id> 304',
+               lambda path, headers: client.get(path, headers=headers),
+               lambda: validator(f'/users/{ids.user()}'), ok=(304,))
+    yield case('GET /movies/<id>/reviews', lambda: client.get(
+        f'/movies/{ids.movie()}/reviews'))
+    yield case('GET /movies/<id>/reviews 304',
+               lambda path, headers: client.get(path, headers=headers),
+               lambda: validator(f'/movies/{ids.movie()}/reviews'),
+               ok=(304,))
+    yield case('GET /search', lambda: client.get(
+        f'/search?q={rng.choice(words)}'))
+    yield case('GET /browse', lambda: client.get('/browse'))
+    yield case('GET /browse filtered', lambda: client.get(
+        f'/browse?genre_id={ids.genre()}&min_year=1990&max_year=1999'
+        f'&min_rating=7'))
+    yield case('GET /posters/<digest>/<variant>', lambda: client.get(
+        f'/posters/{digest}/w185.webp'))
+    yield case('GET /api/v1/users', lambda: client.get('/api/v1/users'))
+    yield case('GET /api/v1/users/<id>/movies?fields=id,title',
+               lambda: client.get(f'/api/v1/users/{ids.user()}/movies',
+                                  query_string={'fields': 'id,title'}))
+    yield case('GET /api/v1/movies', lambda: client.get(
+        '/api/v1/movies?min_rating=7'))
+    yield case('GET /api/v1/movies/<id>', lambda: client.get(
+        f'/api/v1/movies/{ids.movie()}'))
+    yield case('GET /api/v1/movies/<id>/reviews', lambda: client.get(
+        f'/api/v1/movies/{ids.movie()}/reviews'))
+    yield case('GET /api/v1/directors', lambda: client.get(
+        '/api/v1/directors'))
+    yield case('GET /api/v1/users/<id>/movies.ndjson', lambda: drained(
+        client.get(f'/api/v1/users/{ids.user()}/movies.ndjson')))
+    yield case('GET /api/v1/reviews.ndjson?fields=id,movie_id,rating',
+               lambda: drained(client.get(
+                   '/api/v1/reviews.ndjson?fields=id,movie_id,rating')))
+    yield case('GET /cache/stats', lambda: client.get('/cache/stats'))
+    yield case('GET /jobs/stats', lambda: client.get('/jobs/stats'))
+    yield case('GET /metrics', lambda: client.get('/metrics'))
+    yield case('GET /missing', lambda: client.get('/no/such/page'),
+               ok=(404,))
+    yield case('GET /add_user', lambda: client.get('/add_user'))
+    yield case('GET /users/<id>/add_movie', lambda: client.get(
+        f'/users/{ids.user()}/add_movie'))
+    yield case('GET /users/<id>/import', lambda: client.get(
+        f'/users/{ids.user()}/import'))
+    yield case('GET /users/<id>/update_movie/<id>',
+               lambda user_id, movie_id: client.get(
+                   f'/users/{user_id}/update_movie/{movie_id}'),
+               new_movie)
+    yield case('GET /reviews/<id>/edit', lambda: client.get(
+        f'/reviews/{ids.review()}/edit'))
+
+    yield case('POST /add_user', lambda: client.post(
+        '/add_user', data={'name': 'Bench', 'lastname': 'User'}), ok=(302,))
+    yield case('POST /users/<id>/delete',
+               lambda user_id: client.post(f'/users/{user_id}/delete'),
+               lambda: (data_manager.add_user(User(name='Bench',
+                                                   lastname='Deleted')),),
+               ok=(302,))
+    yield case('POST /users/<id>/add_movie', lambda: client.post(
+        f'/users/{ids.user()}/add_movie',
+        data={'title': f'Bench Movie {next(counter)}'}), ok=(302,))
+    # Until the movie's OMDb details are in (the background job included)
+    yield case('POST /users/<id>/add_movie + enrichment', lambda: (
+        client.post(f'/users/{ids.user()}/add_movie',
+                    data={'title': f'Bench Movie {next(counter)}'}),
+        job_queue.join(timeout=30))[0], ok=(302,))
+    # Until the import job finished
+    yield case('POST /users/<id>/import (20 titles)', lambda: (
+        client.post(f'/users/{ids.user()}/import', data={'file': (io.BytesIO(
+            '\n'.join(['title'] + [f'Bench Import {next(counter)}'
+                                   for _ in range(20)]).encode()),
+            'import.csv')}),
+        job_queue.join(timeout=30))[0], ok=(302,))
+    yield case('POST /users/<id>/update_movie/<id>',
+               lambda user_id, movie_id: client.post(
+                   f'/users/{user_id}/update_movie/{movie_id}',
+                   data={'user_rating': '6.5', 'notes': 'bench'}),
+               new_movie, ok=(302,))
+    yield case('POST /users/<id>/delete_movie/<id>',
+               lambda user_id, movie_id: client.post(
+                   f'/users/{user_id}/delete_movie/{movie_id}'),
+               new_movie, ok=(302,))
+    yield case('POST /movies/<id>/reviews', lambda: client.post(
+        f'/movies/{ids.movie()}/reviews',
+        data={'user_id': ids.user(), 'review_text': 'bench', 'rating': 8}),
+        ok=(302,))
+    yield case('POST /reviews/<id>/edit',
+               lambda review_id: client.post(
+                   f'/reviews/{review_id}/edit',
+                   data={'review_text': 'edited', 'rating': 5}),
+               new_review, ok=(302,))
+    yield case('POST /reviews/<id>/delete',
+               lambda review_id: client.post(f'/reviews/{review_id}/delete'),
+               new_review, ok=(302,))
+
+
+def data_manager_cases(data_manager, ids, rng):
+    """Cases calling every public SQLiteDataManager method."""
+    from models import Director, Movie, Review, User
+    from static.recommendations import refresh_similarities
+
+    counter = iter(range(10 ** 9))
+
+    def movie_row():
+        return Movie(title=f'Bench {next(counter)}',
+                     director_id=ids.director(), year='2001', rating='7.1',
+                     poster='N/A', plot='Benchmark plot')
+
+    def own_movie():
+        return (data_manager.add_movie(ids.user(), movie_row()),)
+
+    def library_movie():
+        user_id = ids.user()
+        return user_id, data_manager.add_movie(user_id, movie_row())
+
+    def populated_user():
+        # A large library and some reviews of shared movies
+        user_id = data_manager.add_user(User(name='Bench',
+                                             lastname='Deleted'))
+        data_manager.add_user_movies(user_id,
+                                     [ids.movie() for _ in range(1000)])
+        for _ in range(20):
+            data_manager.add_review(Review(
+                user_id=user_id, movie_id=ids.movie(), review_text='bench',
+                rating=5))
+        return (user_id,)
+
+    def own_review():
+        return (data_manager.add_review(Review(
+            user_id=ids.user(), movie_id=ids.movie(),
+            review_text='bench', rating=6)),)
+
+    def loaded(getter, table):
+        return lambda: (getter(ids.pick(table)),)
+
+    yield case('get_all_users', data_manager.get_all_users)
+    yield case('get_users_page', data_manager.get_users_page)
+    yield case('get_user_list_page', data_manager.get_user_list_page)
+    yield case('get_user', lambda: data_manager.get_user(ids.user()))
+    yield case('get_user_movies',
+               lambda: data_manager.get_user_movies(ids.user()))
+    for sort in ('title', 'year', 'rating', 'added', 'community'):
+        yield case(f'get_user_movies_page({sort})', lambda sort=sort:
+                   data_manager.get_user_movies_page(ids.user(), sort=sort))
+        yield case(f'get_library_page({sort})', lambda sort=sort:
+                   data_manager.get_library_page(ids.user(), sort=sort))
+    for sort in ('rating', 'year'):
+        yield case(f'find_movies({sort})', lambda sort=sort:
+                   data_manager.find_movies(min_year=1990, max_year=2010,
+                                            min_rating=7, sort=sort))
+    yield case('find_movies(genre)', lambda: data_manager.find_movies(
+        genre_id=ids.genre()))
+    yield case('get_facets', data_manager.get_facets)
+    yield case('get_facets(filtered)', lambda: data_manager.get_facets(
+        genre_id=ids.genre(), min_year=1990, max_year=1999, min_rating=7))
+    yield case('get_movies_missing_genres',
+               data_manager.get_movies_missing_genres)
+    yield case('get_users_version', data_manager.get_users_version)
+    yield case('get_user_version',
+               lambda: data_manager.get_user_version(ids.user()))
+    yield case('get_movie_version',
+               lambda: data_manager.get_movie_version(ids.movie()))
+    yield case('get_movie', lambda: data_manager.get_movie(ids.movie()))
+    yield case('search', lambda: data_manager.search(
+        rng.choice(['plan', 'night', 'lov', 'the man'])))
+    yield case('get_movies_missing_posters',
+               data_manager.get_movies_missing_posters)
+    yield case('get_director',
+               lambda: data_manager.get_director(ids.director()))
+    yield case('get_director_by_name', lambda: data_manager
+               .get_director_by_name(rng.choice(ids.director_names)))
+    yield case('get_all_directors', data_manager.get_all_directors)
+    yield case('get_directors_page', data_manager.get_directors_page)
+    yield case('get_or_create_director', lambda: data_manager
+               .get_or_create_director(rng.choice(ids.director_names)))
+    yield case('get_or_create_directors(50 new)', lambda: data_manager
+               .get_or_create_directors([f'Bench Director {next(counter)}'
+                                         for _ in range(50)]))
+    yield case('get_review', lambda: data_manager.get_review(ids.review()))
+    yield case('get_movie_reviews',
+               lambda: data_manager.get_movie_reviews(ids.movie()))
+    yield case('get_movie_reviews_page',
+               lambda: data_manager.get_movie_reviews_page(ids.movie()))
+    yield case('get_similar_movies',
+               lambda: data_manager.get_similar_movies(ids.movie()))
+    yield case('get_similarity_changes', data_manager.get_similarity_changes)
+    yield case('get_movies_listing_similar', lambda: data_manager
+               .get_movies_listing_similar([ids.movie() for _ in range(20)]))
+    yield case('get_similarities', lambda: data_manager
+               .get_similarities([ids.movie() for _ in range(500)]))
+    yield case('iter_user_movies', lambda: sum(
+        1 for _ in data_manager.iter_user_movies(ids.user())))
+    yield case('iter_reviews', lambda: sum(
+        1 for _ in data_manager.iter_reviews(['id', 'rating'])))
+
+    yield case('add_user', lambda: data_manager.add_user(
+        User(name='Bench', lastname='User')))
+    yield case('delete_user(1000 movies)', data_manager.delete_user,
+               populated_user)
+    yield case('add_movie', lambda: data_manager.add_movie(
+        ids.user(), movie_row()))
+    yield case('bulk_add_movies(100)', lambda: data_manager.bulk_add_movies(
+        ids.user(), [{'title': f'Bulk {next(counter)}',
+                      'director': f'Bulk Director {i % 10}', 'year': '1999',
+                      'rating': '6.0', 'poster': 'N/A', 'plot': 'bulk',
+                      'genres': ['Drama', 'Comedy']} for i in range(100)]))
+    yield case('add_pending_movie', lambda: data_manager.add_pending_movie(
+        ids.user(), f'Bench Pending {next(counter)}'))
+    yield case('enrich_movie', lambda movie_id: data_manager.enrich_movie(
+        movie_id, {'title': 'Bench Enriched', 'year': '2003',
+                   'director': rng.choice(ids.director_names),
+                   'rating': '7.7', 'genres': ['Drama', 'Comedy']}),
+               lambda: (data_manager.add_pending_movie(
+                   ids.user(), f'Bench Pending {next(counter)}'),))
+    yield case('add_movie_genres', lambda movie_id: data_manager
+               .add_movie_genres({movie_id: ['Drama', 'Bench Genre']}),
+               own_movie)
+    yield case('set_enrichment_status', lambda movie_id: data_manager
+               .set_enrichment_status(movie_id, 'failed'),
+               lambda: (data_manager.add_pending_movie(
+                   ids.user(), f'Bench Pending {next(counter)}'),))
+    yield case('update_movie', data_manager.update_movie,
+               loaded(data_manager.get_movie, 'movies'))
+    yield case('delete_movie', data_manager.delete_movie, own_movie)
+    yield case('delete_movies(20)', data_manager.delete_movies,
+               lambda: ([own_movie()[0] for _ in range(20)],))
+    yield case('get_movie_ids_by_imdb_id(100)', lambda: data_manager
+               .get_movie_ids_by_imdb_id([f'tt{ids.movie():07d}'
+                                          for _ in range(100)]))
+    yield case('add_user_movies(20)', lambda: data_manager.add_user_movies(
+        ids.user(), [ids.movie() for _ in range(20)]))
+    yield case('remove_user_movie', data_manager.remove_user_movie,
+               library_movie)
+    yield case('set_poster_hash', lambda movie_id: data_manager
+               .set_poster_hash([movie_id], '0' * 64), own_movie)
+    yield case('add_director', lambda: data_manager.add_director(
+        Director(name=f'Bench Director {next(counter)}')))
+    yield case('update_director', data_manager.update_director,
+               loaded(data_manager.get_director, 'directors'))
+    yield case('delete_director', data_manager.delete_director,
+               lambda: (data_manager.add_director(
+                   Director(name=f'Bench Director {next(counter)}')),))
+    yield case('add_review', lambda: data_manager.add_review(Review(
+        user_id=ids.user(), movie_id=ids.movie(), review_text='bench',
+        rating=7)))
+    yield case('update_review', data_manager.update_review,
+               loaded(data_manager.get_review, 'reviews'))
+    yield case('delete_review', data_manager.delete_review, own_review)
+    yield case('delete_reviews(20)', data_manager.delete_reviews,
+               lambda: ([own_review()[0] for _ in range(20)],))
+    yield case('replace_similarities', lambda movie_id: data_manager
+               .replace_similarities([(movie_id, ids.movie(), 0.5)],
+                                     [movie_id]),
+               lambda: (ids.movie(),))
+    # Incremental refresh after one new rating (static.recommendations)
+    yield case('refresh_similarities(1 new review)',
+               lambda review_id: refresh_similarities(data_manager),
+               own_review)
+    yield case('rebuild_rating_aggregates',
+               data_manager.rebuild_rating_aggregates)
+
+
+def uncovered_methods(data_manager, cases):
+    """Public data-manager methods no case exercises."""
+    covered = {bench_case.name.split('(')[0] for bench_case in cases}
+    covered |= {'add_invalidation_listener', 'dispose'}
+    return sorted(
+        name for name, _ in inspect.getmembers(type(data_manager),
+                                               inspect.isfunction)
+        if not name.startswith('_') and name not in covered)
+
+
+def build_app(db_file_name, work_dir, omdb_url, page_cache):
+    """Create the application configured for a benchmark run."""
+    from app import create_app
+    return create_app({
+        'DATABASE': db_file_name,
+        'OMDB_API_URL': omdb_url,
+        'OMDB_CACHE_DATABASE': os.path.join(work_dir, 'omdb.db'),
+        # Every case may look titles up, far beyond a real key's quota
+        'OMDB_DAILY_QUOTA': None,
+        'POSTER_STORE': os.path.join(work_dir, 'posters'),
+        'PAGE_CACHE_BACKEND': page_cache,
+        'PAGE_CACHE_DATABASE': os.path.join(work_dir, 'pages.db'),
+        'JOB_QUEUE_DATABASE': os.path.join(work_dir, 'jobs.db'),
+        'LOG_LEVEL': 'ERROR',
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('database', help='Seeded database (will be written)')
+    parser.add_argument('--out', help='Write the results to this JSON file')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--max-seconds', type=float, default=10,
+                        help='Time budget per case')
+    parser.add_argument('--only', help='Regex selecting the cases to run')
+    parser.add_argument('--skip', help='Regex of cases to leave out')
+    parser.add_argument('--page-cache', choices=['memory', 'sqlite', 'none'],
+                        default='none')
+    parser.add_argument('--omdb-latency', type=float, default=0.0,
+                        help='Stub OMDb latency per request in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as work_dir, \
+            StubOMDbServer(latency=args.omdb_latency) as omdb:
+        app = build_app(
+            os.path.abspath(args.database), work_dir, omdb.url,
+            None if args.page_cache == 'none' else args.page_cache)
+        # Opens (and migrates) the database, which may merge or drop rows,
+        # before the IDs are sampled
+        data_manager = app.extensions['data_manager']._get_current_object()
+        ids = _Ids(args.database, rng)
+        method_cases = list(data_manager_cases(data_manager, ids, rng))
+        for name in uncovered_methods(data_manager, method_cases):
+            print(f"warning: no benchmark case for {name}")
+        cases = [*route_cases(app, ids, rng), *method_cases]
+        if args.only:
+            cases = [c for c in cases if re.search(args.only, c.name)]
+        if args.skip:
+            cases = [c for c in cases if not re.search(args.skip, c.name)]
+
+        results = {}
+        print(f"{'case':<42} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'ops/s':>9} {'err':>4}")
+        for bench_case in cases:
+            result = run_case(bench_case, args.iterations, args.max_seconds)
+            results[bench_case.name] = result
+            print(f"{bench_case.name:<42} {result['n']:>5} "
+                  f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                  f"{result['p99_ms']:>9.2f} {result['ops_per_s']:>9.1f} "
+                  f"{result['errors']:>4}")
+        data_manager.dispose()
+
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump({
+                'meta': {
+                    'started': datetime.now(timezone.utc).isoformat(),
+                    'database': args.database,
+                    'python': platform.python_version(),
+                    'sqlite': sqlite3.sqlite_version,
+                    'options': vars(args),
+                },
+                'results': results,
+            }, file, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
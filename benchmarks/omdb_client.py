@@ -0,0 +1,49 @@
+"""
+Throughput of OMDbClient.fetch_many against concurrency.
+
+Runs a stub OMDb server with a fixed per-request latency and resolves the
+same number of distinct titles at increasing fetch_many concurrency.
+
+    python -m benchmarks.omdb_client --titles 200 --latency 0.05
+"""
+import argparse
+import time
+
+from benchmarks.stub_omdb import StubOMDbServer
+from static.omdb_client import OMDbClient
+
+
+def run(titles, latency, concurrency_levels):
+    results = []
+    with StubOMDbServer(latency=latency) as server:
+        for workers in concurrency_levels:
+            client = OMDbClient('bench', base_url=server.url,
+                                pool_size=max(workers, 1),
+                                max_workers=workers)
+            names = [f'Bench {workers} {i}' for i in range(titles)]
+            start = time.perf_counter()
+            resolved = client.fetch_many(names)
+            elapsed = time.perf_counter() - start
+            client.close()
+            results.append((workers, elapsed, titles / elapsed,
+                            sum(1 for data in resolved.values() if data)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--titles', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Stub server latency per request in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'seconds':>9} {'titles/s':>10} {'resolved':>9}")
+    for workers, elapsed, rate, resolved in run(
+            args.titles, args.latency, args.concurrency):
+        print(f"{workers:>8} {elapsed:>9.3f} {rate:>10.1f} {resolved:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+OMDb request coalescing, quota and circuit breaker under load.
+
+    python -m benchmarks.omdb_resilience --lookups 200 --latency 0.05
+
+Three scenarios against the stub OMDb server:
+
+* trending title: --threads threads look the same uncached title up at
+  once, and share one request;
+* outage: the server answers 503 to everything and fetch_many resolves
+  --lookups titles whose cache entries expired, without and with the
+  circuit breaker (which fails fast and serves the stale entries);
+* quota: fetch_many resolves --lookups new titles through a daily quota
+  whose burst is --burst.
+"""
+import argparse
+import logging
+import threading
+import time
+
+from benchmarks.stub_omdb import StubOMDbServer
+from static.omdb_cache import OMDbCache
+from static.omdb_client import OMDbClient
+from static.omdb_guard import CircuitBreaker, TokenBucket
+
+
+def _client(server, **options):
+    return OMDbClient('bench', base_url=server.url, retries=1,
+                      backoff_factor=0.1, pool_size=32, max_workers=8,
+                      **options)
+
+
+def trending(server, threads):
+    client = _client(server, cache=OMDbCache())
+    barrier = threading.Barrier(threads)
+
+    def lookup():
+        barrier.wait()
+        client.fetch('Trending Title')
+
+    sent = server.requests
+    workers = [threading.Thread(target=lookup) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    client.close()
+    return elapsed, server.requests - sent, client.stats()
+
+
+def outage(server, lookups, with_breaker):
+    titles = [f'Outage {i}' for i in range(lookups)]
+    # Entries expire at once, as if cached a week ago
+    cache = OMDbCache(ttl=0)
+    warm = _client(server, cache=cache)
+    warm.fetch_many(titles)
+    warm.close()
+
+    client = _client(server, cache=cache, circuit_breaker=CircuitBreaker(
+        reset_seconds=60) if with_breaker else None)
+    server.status = 503
+    sent = server.requests
+    started = time.perf_counter()
+    resolved = client.fetch_many(titles)
+    elapsed = time.perf_counter() - started
+    server.status = 200
+    client.close()
+    stats = client.stats()
+    stats['resolved'] = sum(1 for data in resolved.values() if data)
+    return elapsed, server.requests - sent, stats
+
+
+def quota(server, lookups, burst):
+    client = _client(server, quota=TokenBucket.daily(1000, burst))
+    sent = server.requests
+    started = time.perf_counter()
+    resolved = client.fetch_many(f'Quota {i}' for i in range(lookups))
+    elapsed = time.perf_counter() - started
+    client.close()
+    stats = client.stats()
+    stats['resolved'] = sum(1 for data in resolved.values() if data)
+    return elapsed, server.requests - sent, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--burst', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Stub server latency per request in seconds')
+    args = parser.parse_args()
+    # One warning per failed lookup during the outage
+    logging.getLogger('static.omdb_client').setLevel(logging.ERROR)
+
+    print(f"{'scenario':<24} {'seconds':>8} {'requests':>9}  counters")
+    with StubOMDbServer(latency=args.latency) as server:
+        runs = [
+            ('trending title', trending(server, args.threads)),
+            ('outage: no breaker', outage(server, args.lookups, False)),
+            ('outage: breaker', outage(server, args.lookups, True)),
+            ('quota', quota(server, args.lookups, args.burst)),
+        ]
+    for name, (elapsed, requests, stats) in runs:
+        counters = ' '.join(f'{key}={value}' for key, value in stats.items()
+                            if value and key != 'quota_available')
+        print(f"{name:<24} {elapsed:>8.2f} {requests:>9}  {counters}")
+
+
+if __name__ == '__main__':
+    main()
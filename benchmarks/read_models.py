@@ -0,0 +1,146 @@
+"""
+Read throughput and memory of the list-page read models against the ORM.
+
+    python -m benchmarks.read_models --rows 10000
+
+Fills a scratch database with a user whose library holds --rows movies,
+--rows users and a movie with --rows reviews, then reads each listing
+whole through the Core-select read models (get_user_movies,
+get_all_users, get_movie_reviews) and through the ORM queries they
+replace (detached instances, directors and reviewers joined in). Reports
+the median rows per second, the peak Python memory of one read and the
+memory the returned rows hold (tracemalloc).
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy.orm import joinedload
+
+from datamanager.migrations import create_search_index, \
+    drop_search_triggers
+from datamanager.normalize import name_key
+from datamanager.sqlite_data_manager import SQLiteDataManager
+from models import Review, User
+
+DIRECTORS = 500
+
+
+def populate(db_file_name, rows, seed=42):
+    """
+    Fill a migrated database with `rows` users, `rows` movies all in the
+    library of user 1, and `rows` reviews of movie 1.
+    """
+    rng = random.Random(seed)
+    connection = sqlite3.connect(db_file_name)
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.executemany(
+        'INSERT INTO users (id, name, lastname) VALUES (?, ?, ?)',
+        [(i, f'User {i}', 'Bench') for i in range(1, rows + 1)])
+    connection.executemany(
+        'INSERT INTO directors (id, name, name_key) VALUES (?, ?, ?)',
+        [(i, f'Director {i}', name_key(f'Director {i}'))
+         for i in range(1, DIRECTORS + 1)])
+    movies = []
+    for movie_id in range(1, rows + 1):
+        year = rng.randint(1920, 2024)
+        rating = round(rng.uniform(1, 10), 1)
+        movies.append((movie_id, f'tt{movie_id:07d}', f'Movie {movie_id}',
+                       rng.randint(1, DIRECTORS), str(year), year, year,
+                       f'{rating:.1f}', rating,
+                       f'https://example.com/posters/{movie_id}.jpg',
+                       'A synthetic plot, long enough to be realistic. ' * 4))
+    connection.executemany(
+        'INSERT INTO movies (id, imdb_id, title, director_id, year,'
+        ' year_start, year_end, rating, imdb_rating, poster, plot)'
+        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', movies)
+    connection.executemany(
+        'INSERT INTO user_movies (user_id, movie_id) VALUES (1, ?)',
+        [(movie_id,) for movie_id in range(1, rows + 1)])
+    connection.executemany(
+        'INSERT INTO reviews (user_id, movie_id, review_text, rating)'
+        ' VALUES (?, 1, ?, ?)',
+        [(user_id, f'Review {user_id}: worth a watch.',
+          rng.randint(1, 10)) for user_id in range(1, rows + 1)])
+    connection.commit()
+    connection.close()
+
+
+def _orm(data_manager, build):
+    """Read the ORM query `build(session)` into detached instances."""
+
+    def read():
+        session = data_manager.ReadSession()
+        try:
+            return build(session).all()
+        finally:
+            session.close()
+
+    return read
+
+
+def measure(read, repeat):
+    """
+    :return: (rows, median seconds, peak bytes, held bytes) of `read`.
+    """
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        rows = read()
+        timings.append(time.perf_counter() - began)
+    del rows
+
+    tracemalloc.start()
+    rows = read()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(rows), statistics.median(timings), peak, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file_name = os.path.join(tmp_dir, 'read_models.db')
+        data_manager = SQLiteDataManager(db_file_name)
+
+        # The search triggers re-read every review of a movie per insert
+        with data_manager.engine.begin() as connection:
+            drop_search_triggers(connection)
+        populate(db_file_name, args.rows)
+        with data_manager.engine.begin() as connection:
+            create_search_index(connection)
+
+        cases = {
+            'library: read models': lambda: data_manager.get_user_movies(1),
+            'library: ORM': _orm(data_manager, lambda session: (
+                SQLiteDataManager._library(session, 1))),
+            'users: read models': data_manager.get_all_users,
+            'users: ORM': _orm(data_manager,
+                               lambda session: session.query(User)),
+            'reviews: read models':
+                lambda: data_manager.get_movie_reviews(1),
+            'reviews: ORM': _orm(data_manager, lambda session: (
+                session.query(Review).options(joinedload(Review.user))
+                .filter_by(movie_id=1))),
+        }
+        print(f"{'listing':<22} {'rows':>6} {'rows/s':>10} {'ms':>8} "
+              f"{'peak MiB':>9} {'held MiB':>9}")
+        for name, read in cases.items():
+            rows, seconds, peak, held = measure(read, args.repeat)
+            print(f"{name:<22} {rows:>6} {rows / seconds:>10.0f} "
+                  f"{seconds * 1000:>8.1f} {peak / 2 ** 20:>9.2f} "
+                  f"{held / 2 ** 20:>9.2f}")
+        data_manager.dispose()
+
+
+if __name__ == '__main__':
+    main()
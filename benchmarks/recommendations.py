@@ -0,0 +1,176 @@
+"""
+Build time and memory of the similar-movies index on a large catalog.
+
+    python -m benchmarks.recommendations --reviews 1000000
+
+Fills a scratch database with synthetic reviews whose ratings follow a
+hidden taste structure, then times each stage of a full build of
+movie_similarities (reading the reviews, building the rating matrix, the
+top-K products, storing them), its peak Python memory (tracemalloc, which
+NumPy reports to), an incremental refresh after a few new reviews and
+the movie-page lookup.
+"""
+import argparse
+import itertools
+import os
+import random
+import resource
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from datamanager.migrations import create_search_index, \
+    drop_search_triggers
+from datamanager.sqlite_data_manager import SQLiteDataManager
+from models import Review
+from static import recommendations
+from static.recommendations import rating_matrix, refresh_similarities
+
+# Hidden "genres" the synthetic tastes are drawn from
+CLUSTERS = 20
+
+
+def populate(db_file_name, reviews, seed=42, batch_size=50000):
+    """
+    Fill a migrated database with `reviews` reviews by reviews / 50 users
+    of reviews / 20 movies, with Zipf-like movie popularity and user
+    activity. Users rate movies of their favourite clusters higher.
+
+    :return: The number of users and of movies.
+    """
+    rng = random.Random(seed)
+    users, movies = max(reviews // 50, 10), max(reviews // 20, 10)
+    movie_weights = list(itertools.accumulate(
+        1 / rank for rank in range(1, movies + 1)))
+    user_weights = list(itertools.accumulate(
+        1 / rank ** 0.7 for rank in range(1, users + 1)))
+    movie_cluster = [rng.randrange(CLUSTERS) for _ in range(movies + 1)]
+    favourites = [set(rng.sample(range(CLUSTERS), 3))
+                  for _ in range(users + 1)]
+
+    connection = sqlite3.connect(db_file_name)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.executemany(
+        'INSERT INTO users (id, name, lastname) VALUES (?, ?, ?)',
+        [(i, 'Bench', str(i)) for i in range(1, users + 1)])
+    connection.executemany(
+        "INSERT INTO movies (id, title, year, rating)"
+        " VALUES (?, ?, '2000', '7.0')",
+        [(i, f'Movie {i}') for i in range(1, movies + 1)])
+    for start in range(0, reviews, batch_size):
+        rows = []
+        for _ in range(min(batch_size, reviews - start)):
+            user_id = rng.choices(range(1, users + 1),
+                                  cum_weights=user_weights)[0]
+            movie_id = rng.choices(range(1, movies + 1),
+                                   cum_weights=movie_weights)[0]
+            liked = movie_cluster[movie_id] in favourites[user_id]
+            rating = min(10, max(1, round(rng.gauss(7.5 if liked else 4.5,
+                                                    1.5))))
+            rows.append((user_id, movie_id, 'bench', rating))
+        connection.executemany(
+            'INSERT INTO reviews (user_id, movie_id, review_text, rating)'
+            ' VALUES (?, ?, ?, ?)', rows)
+        connection.commit()
+    connection.execute(
+        'INSERT INTO similarity_changes (movie_id)'
+        ' SELECT DISTINCT movie_id FROM reviews')
+    connection.commit()
+    connection.close()
+    return users, movies
+
+
+def _timed(label, func):
+    began = time.perf_counter()
+    result = func()
+    print(f"{label:<28} {time.perf_counter() - began:>8.2f} s")
+    return result
+
+
+def _full_refresh(data_manager, rows, top_k, last_change_id):
+    """Time the steps of a full refresh from the review `rows`."""
+    ratings = _timed('build rating matrix', lambda: rating_matrix(rows))
+    neighbours = _timed('top-K neighbours', lambda: (
+        ratings.top_neighbours(ratings.movie_ids(), top_k)))
+    _timed('store', lambda: data_manager.replace_similarities(
+        neighbours, None, last_change_id))
+    print(f"{len(neighbours)} neighbours of "
+          f"{len(ratings.movie_ids())} movies ({ratings.backend})")
+
+
+def _build_peak(rows, top_k):
+    """Return the peak memory (bytes) of building the neighbour lists."""
+    tracemalloc.start()
+    ratings = rating_matrix(rows)
+    ratings.top_neighbours(ratings.movie_ids(), top_k)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--reviews', type=int, default=1000000)
+    parser.add_argument('--top-k', type=int, default=recommendations.TOP_K)
+    parser.add_argument('--new-reviews', type=int, default=100,
+                        help='Reviews added before the incremental refresh')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--python', action='store_true',
+                        help='Use the pure-Python fallback even when NumPy '
+                             'and SciPy are installed')
+    args = parser.parse_args()
+    if args.python:
+        recommendations.np = recommendations.sparse = None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file_name = os.path.join(tmp_dir, 'recommendations.db')
+        data_manager = SQLiteDataManager(db_file_name)
+
+        # The search triggers re-read every review of a movie per insert
+        start = time.perf_counter()
+        with data_manager.engine.begin() as connection:
+            drop_search_triggers(connection)
+        users, movies = populate(db_file_name, args.reviews)
+        with data_manager.engine.begin() as connection:
+            create_search_index(connection)
+        print(f"Populated {args.reviews} reviews by {users} users of "
+              f"{movies} movies in {time.perf_counter() - start:.1f} s")
+
+        last_change_id, _ = data_manager.get_similarity_changes()
+        rows = _timed('read reviews', lambda: [tuple(row) for row in (
+            data_manager.iter_reviews(['user_id', 'movie_id', 'rating'],
+                                      batch_size=10000))])
+        _full_refresh(data_manager, rows, args.top_k, last_change_id)
+        peak = _build_peak(rows, args.top_k)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"peak memory of the build    {peak / 2 ** 20:>8.1f} MiB "
+              f"(process max RSS {max_rss / 1024:.0f} MiB)")
+
+        rng = random.Random(7)
+        for _ in range(args.new_reviews):
+            data_manager.add_review(Review(
+                user_id=rng.randint(1, users),
+                movie_id=rng.randint(1, min(movies, 1000)),
+                review_text='new', rating=rng.randint(1, 10)))
+        result = _timed(f'refresh after {args.new_reviews} reviews',
+                        lambda: refresh_similarities(data_manager,
+                                                     top_k=args.top_k))
+        print(f"recomputed {result.movies} movies, updated "
+              f"{result.patched} stored lists in place")
+
+        timings = []
+        for _ in range(args.queries):
+            began = time.perf_counter()
+            data_manager.get_similar_movies(rng.randint(1, movies))
+            timings.append((time.perf_counter() - began) * 1000)
+        timings.sort()
+        print(f"get_similar_movies p50 {statistics.median(timings):.2f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms")
+        data_manager.dispose()
+
+
+if __name__ == '__main__':
+    main()
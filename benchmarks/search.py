@@ -0,0 +1,101 @@
+"""
+Query latency of SQLiteDataManager.search on a large synthetic catalog.
+
+    python -m benchmarks.search --movies 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from datamanager.normalize import name_key
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+
+def _vocabulary(rng, size):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(4, 9)))
+            for _ in range(size)]
+
+
+def populate(db_file_name, movies, seed=42, batch_size=10000):
+    """Fill a migrated database with `movies` random movies (and FTS rows)."""
+    rng = random.Random(seed)
+    words = _vocabulary(rng, 20000)
+    # Zipf-like skew so some words are common and most are rare
+    weights = list(itertools.accumulate(
+        1 / (rank + 1) for rank in range(len(words))))
+
+    connection = sqlite3.connect(db_file_name)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=OFF')
+    connection.execute("INSERT INTO users (name, lastname) VALUES ('b', 'b')")
+    connection.executemany(
+        'INSERT INTO directors (id, name, name_key) VALUES (?, ?, ?)',
+        [(i, name, name_key(name)) for i, name in (
+            (i, f'{rng.choice(words)} {rng.choice(words)} {i}')
+            for i in range(1, 5001))])
+    for start in range(0, movies, batch_size):
+        rows = []
+        for _ in range(min(batch_size, movies - start)):
+            title = ' '.join(rng.choices(words, cum_weights=weights,
+                                         k=rng.randint(1, 4)))
+            plot = ' '.join(rng.choices(words, cum_weights=weights, k=20))
+            rows.append((title, rng.randint(1, 5000),
+                         str(rng.randint(1920, 2024)),
+                         f'{rng.uniform(1, 10):.1f}', plot))
+        connection.executemany(
+            'INSERT INTO movies (title, director_id, year, rating, plot)'
+            ' VALUES (?, ?, ?, ?, ?)', rows)
+        connection.commit()
+    connection.execute(
+        "INSERT INTO movie_search (movie_search) VALUES ('optimize')")
+    connection.commit()
+    connection.close()
+    return words
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--movies', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file_name = os.path.join(tmp_dir, 'search.db')
+        SQLiteDataManager(db_file_name).dispose()
+
+        start = time.perf_counter()
+        words = populate(db_file_name, args.movies)
+        print(f"Populated {args.movies} movies in "
+              f"{time.perf_counter() - start:.1f} s")
+
+        data_manager = SQLiteDataManager(db_file_name)
+        rng = random.Random(7)
+        cases = {
+            'common word': lambda: rng.choice(words[:50]),
+            'rare word': lambda: rng.choice(words[5000:]),
+            'prefix': lambda: rng.choice(words[:2000])[:3],
+            'two words': lambda: ' '.join(rng.sample(words[:500], 2)),
+        }
+        print(f"{'query':<12} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        for name, make_query in cases.items():
+            timings = []
+            for _ in range(args.queries):
+                query = make_query()
+                began = time.perf_counter()
+                data_manager.search(query)
+                timings.append((time.perf_counter() - began) * 1000)
+            timings.sort()
+            print(f"{name:<12} {statistics.median(timings):>8.2f} "
+                  f"{timings[int(len(timings) * 0.95) - 1]:>8.2f} "
+                  f"{timings[-1]:>8.2f}")
+        data_manager.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+Fill a database with a synthetic, realistically skewed dataset.
+
+    python -m benchmarks.seed db/bench.db --scale large
+    python -m benchmarks.seed db/bench.db --users 1000 --movies 50000
+
+Director popularity, genres, library sizes, shared library entries and
+review counts follow Zipf-like distributions (a few prolific directors,
+popular genres, heavy users and blockbusters); years lean recent and
+some ratings/years carry OMDb's "N/A" and series ranges. The schema
+comes from the app's own migrations, and the denormalized data (rating
+aggregates, search index) is rebuilt once at the end instead of per row.
+The same seed always produces the same database.
+"""
+import argparse
+import itertools
+import random
+import time
+
+from sqlalchemy import event
+
+from datamanager.migrations import (REBUILD_RATING_AGGREGATES,
+                                    create_search_index,
+                                    drop_search_triggers,
+                                    rebuild_search_index)
+from datamanager.normalize import normalized_columns, name_key
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+SCALES = {
+    'small': {'users': 1000, 'movies': 50000, 'reviews': 200000},
+    'medium': {'users': 10000, 'movies': 500000, 'reviews': 2000000},
+    'large': {'users': 100000, 'movies': 5000000, 'reviews': 20000000},
+}
+
+GENRES = ['Drama', 'Comedy', 'Action', 'Thriller', 'Romance', 'Crime',
+          'Adventure', 'Horror', 'Sci-Fi', 'Mystery', 'Fantasy',
+          'Animation', 'Family', 'Biography', 'History', 'War', 'Music',
+          'Documentary', 'Sport', 'Western', 'Musical', 'Film-Noir',
+          'Short', 'News']
+FIRST_NAMES = ['James', 'Mary', 'John', 'Linda', 'Akira', 'Agnes', 'Wong',
+               'Sofia', 'Pedro', 'Chloe', 'Satyajit', 'Greta', 'Spike',
+               'Jane', 'Bong', 'Claire', 'Wim', 'Kathryn', 'Park', 'Ingmar']
+LAST_NAMES = ['Smith', 'Kurosawa', 'Varda', 'Kar-wai', 'Coppola',
+              'Almodovar', 'Zhao', 'Ray', 'Gerwig', 'Lee', 'Campion',
+              'Joon-ho', 'Denis', 'Wenders', 'Bigelow', 'Chan-wook',
+              'Bergman', 'Nolan', 'Sciamma', 'Haneke']
+
+
+def zipf_weights(size, exponent=1.0):
+    """Cumulative weights of a Zipf distribution over `size` ranks."""
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+def _vocabulary(rng, size):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9)))
+            for _ in range(size)]
+
+
+class _Generator:
+    def __init__(self, rng, users, movies, directors):
+        self.rng = rng
+        self.words = _vocabulary(rng, 20000)
+        self.word_weights = zipf_weights(len(self.words))
+        self.genre_weights = zipf_weights(len(GENRES), 1.2)
+        self.director_weights = zipf_weights(directors, 0.9)
+        self.user_weights = zipf_weights(users, 0.8)
+        self.movie_weights = zipf_weights(movies, 0.9)
+        self.users = users
+        self.movies = movies
+        self.directors = directors
+        # Genre row IDs in GENRES order, filled in by seed()
+        self.genre_ids = []
+
+    def text(self, words):
+        return ' '.join(self.rng.choices(self.words,
+                                         cum_weights=self.word_weights,
+                                         k=words))
+
+    def person(self, index):
+        return (f'{self.rng.choice(FIRST_NAMES)} '
+                f'{self.rng.choice(LAST_NAMES)} {index}')
+
+    def year(self):
+        rng = self.rng
+        roll = rng.random()
+        if roll < 0.01:
+            return 'N/A'
+        start = int(rng.triangular(1920, 2025, 2015))
+        if roll < 0.04:
+            # Series: finished range or still running
+            if rng.random() < 0.5:
+                return f'{start}–'
+            return f'{start}–{min(2025, start + rng.randint(1, 8))}'
+        return str(start)
+
+    def rating(self):
+        if self.rng.random() < 0.02:
+            return 'N/A'
+        return f'{min(10.0, max(1.0, self.rng.gauss(6.5, 1.2))):.1f}'
+
+    def movie(self, movie_id, director_id):
+        year, rating = self.year(), self.rating()
+        return (movie_id, f'tt{movie_id:07d}',
+                self.text(self.rng.randint(1, 4)).title(), director_id,
+                year, rating, 'N/A', self.text(14),
+                *normalized_columns(year, rating).values())
+
+    def movie_genres(self, movie_id):
+        genres = self.rng.choices(self.genre_ids,
+                                  cum_weights=self.genre_weights,
+                                  k=self.rng.randint(1, 3))
+        return [(movie_id, genre_id) for genre_id in set(genres)]
+
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+def seed(db_file_name, users, movies, reviews, directors=None,
+         random_seed=42, batch_size=20000, search_index=True,
+         progress=print):
+    """
+    Create (or extend) a database with synthetic users, directors,
+    genres, movies and reviews.
+
+    :param db_file_name: SQLite file to fill; migrated first.
+    :param directors: Number of directors, defaults to movies / 25.
+    :param search_index: Rebuild the FTS index (slow at large scale).
+    :param progress: Callable receiving progress messages.
+    """
+    directors = directors or max(1, movies // 25)
+    rng = random.Random(random_seed)
+    generator = _Generator(rng, users, movies, directors)
+
+    data_manager = SQLiteDataManager(db_file_name)
+    engine = data_manager.engine
+    # Durability is pointless while loading a throwaway dataset
+    engine.dispose()
+    event.listen(engine, 'connect', lambda dbapi_connection, record:
+                 dbapi_connection.execute('PRAGMA synchronous=OFF'))
+    started = time.perf_counter()
+
+    def report(message):
+        progress(f'[{time.perf_counter() - started:7.1f} s] {message}')
+
+    def insert(sql, rows):
+        with engine.begin() as connection:
+            connection.exec_driver_sql(sql, rows)
+
+    with engine.begin() as connection:
+        drop_search_triggers(connection)
+        user_offset = connection.exec_driver_sql(
+            'SELECT coalesce(max(id), 0) FROM users').scalar()
+        director_offset = connection.exec_driver_sql(
+            'SELECT coalesce(max(id), 0) FROM directors').scalar()
+        movie_offset = connection.exec_driver_sql(
+            'SELECT coalesce(max(id), 0) FROM movies').scalar()
+        genre_ids = dict(connection.exec_driver_sql(
+            'SELECT name, min(id) FROM genres GROUP BY name').all())
+        missing = [(name,) for name in GENRES if name not in genre_ids]
+        if missing:
+            connection.exec_driver_sql(
+                'INSERT INTO genres (name) VALUES (?)', missing)
+            genre_ids = dict(connection.exec_driver_sql(
+                'SELECT name, min(id) FROM genres GROUP BY name').all())
+    generator.genre_ids = [genre_ids[name] for name in GENRES]
+
+    for start, count in _batches(users, batch_size):
+        insert('INSERT INTO users (id, name, lastname) VALUES (?, ?, ?)',
+               [(user_offset + i + 1, rng.choice(FIRST_NAMES),
+                 f'{rng.choice(LAST_NAMES)} {user_offset + i + 1}')
+                for i in range(start, start + count)])
+    report(f'{users} users')
+
+    for start, count in _batches(directors, batch_size):
+        names = [generator.person(director_offset + i + 1)
+                 for i in range(start, start + count)]
+        insert('INSERT INTO directors (id, name, name_key) VALUES (?, ?, ?)',
+               [(director_offset + start + i + 1, name, name_key(name))
+                for i, name in enumerate(names)])
+    report(f'{directors} directors')
+
+    for start, count in _batches(movies, batch_size):
+        owners = rng.choices(range(1, users + 1),
+                             cum_weights=generator.user_weights, k=count)
+        makers = rng.choices(range(1, directors + 1),
+                             cum_weights=generator.director_weights,
+                             k=count)
+        rows = [generator.movie(movie_offset + start + i + 1,
+                                director_offset + maker)
+                for i, maker in enumerate(makers)]
+        insert('INSERT INTO movies (id, imdb_id, title, director_id, year,'
+               ' rating, poster, plot, year_start, year_end, imdb_rating)'
+               ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        insert('INSERT INTO movie_genre (movie_id, genre_id) VALUES (?, ?)',
+               [link for row in rows
+                for link in generator.movie_genres(row[0])])
+        # Every movie is in the library of the user who added it, and
+        # popular movies in a few more
+        shared = rng.choices(range(1, start + count + 1),
+                             cum_weights=generator.movie_weights[
+                                 :start + count],
+                             k=count // 4)
+        holders = rng.choices(range(1, users + 1),
+                              cum_weights=generator.user_weights,
+                              k=len(shared))
+        insert('INSERT OR IGNORE INTO user_movies (user_id, movie_id)'
+               ' VALUES (?, ?)',
+               [(user_offset + owner, row[0])
+                for owner, row in zip(owners, rows)]
+               + [(user_offset + holder, movie_offset + movie)
+                  for holder, movie in zip(holders, shared)])
+        if (start // batch_size) % 25 == 0:
+            report(f'{start + count}/{movies} movies')
+    report(f'{movies} movies')
+
+    for start, count in _batches(reviews, batch_size):
+        targets = rng.choices(range(1, movies + 1),
+                              cum_weights=generator.movie_weights, k=count)
+        authors = rng.choices(range(1, users + 1),
+                              cum_weights=generator.user_weights, k=count)
+        insert('INSERT INTO reviews (user_id, movie_id, review_text, rating)'
+               ' VALUES (?, ?, ?, ?)',
+               [(user_offset + author, movie_offset + target,
+                 generator.text(rng.randint(5, 30)),
+                 float(min(10, max(1, round(rng.gauss(6.5, 2))))))
+                for author, target in zip(authors, targets)])
+        if (start // batch_size) % 50 == 0:
+            report(f'{start + count}/{reviews} reviews')
+    report(f'{reviews} reviews')
+
+    with engine.begin() as connection:
+        for statement in REBUILD_RATING_AGGREGATES:
+            connection.exec_driver_sql(statement)
+    report('rating aggregates')
+
+    with engine.begin() as connection:
+        if search_index:
+            rebuild_search_index(connection)
+            connection.exec_driver_sql(
+                "INSERT INTO movie_search (movie_search) VALUES ('optimize')")
+        create_search_index(connection)
+    if search_index:
+        report('search index')
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+    data_manager.dispose()
+    report('done')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('database', help='SQLite file to create or extend')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--movies', type=int)
+    parser.add_argument('--reviews', type=int)
+    parser.add_argument('--directors', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-search-index', action='store_true',
+                        help='Leave the FTS index empty (faster)')
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    seed(args.database, directors=args.directors, random_seed=args.seed,
+         search_index=not args.no_search_index, **sizes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Local stand-in for the OMDb API used by the benchmarks.
+
+Answers ``?t=<title>`` and ``?i=<imdbID>`` lookups with a deterministic
+fake movie after an optional artificial latency. Titles starting with
+"missing" answer "Movie not found!"; setting `status` to an HTTP error
+status makes every lookup fail with it (an OMDb outage).
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+GENRES = ['Drama', 'Comedy', 'Action', 'Thriller', 'Sci-Fi', 'Romance',
+          'Horror', 'Animation', 'Documentary', 'Crime']
+
+
+def fake_movie(title):
+    """Return a deterministic OMDb-shaped response for a title."""
+    digest = int(hashlib.sha1(title.casefold().encode()).hexdigest(), 16)
+    return {
+        'Response': 'True',
+        'Title': title,
+        'Year': str(1950 + digest % 75),
+        'imdbID': f'tt{digest % 10 ** 7:07d}',
+        'Director': f'Director {digest % 5000}',
+        'Genre': ', '.join(GENRES[(digest >> shift) % len(GENRES)]
+                           for shift in (0, 8)),
+        'imdbRating': f'{1 + digest % 90 / 10:.1f}',
+        'Poster': 'N/A',
+        'Plot': f'A synthetic plot for {title}.',
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class StubOMDbServer:
+    """Threaded HTTP server answering OMDb lookups, run in the background."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.status = 200
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                query = parse_qs(urlparse(self.path).query)
+                title = (query.get('t') or query.get('i') or [''])[0]
+                if server.status != 200:
+                    data = {'Response': 'False', 'Error': 'Unavailable'}
+                elif not title or title.casefold().startswith('missing'):
+                    data = {'Response': 'False', 'Error': 'Movie not found!'}
+                else:
+                    data = fake_movie(title)
+                body = json.dumps(data).encode()
+                self.send_response(server.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = _Server(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}/'
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever,
+                         daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,15 @@
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+# The application owns a single SQLiteDataManager (see app.py); blueprints
+# reach it through this proxy so all of them share one engine and pool.
+data_manager = LocalProxy(lambda: current_app.extensions['data_manager'])
+
+# Pooled OMDb client (with its response cache), also owned by the app
+omdb_client = LocalProxy(lambda: current_app.extensions['omdb_client'])
+
+# Local poster mirror
+poster_store = LocalProxy(lambda: current_app.extensions['poster_store'])
+
+# Background job queue (OMDb enrichment of added movies)
+job_queue = LocalProxy(lambda: current_app.extensions['job_queue'])
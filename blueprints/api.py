@@ -0,0 +1,180 @@
+"""
+JSON API (/api/v1) over users, movies, directors and reviews.
+
+List endpoints are keyset paginated (?after= / ?before= cursors and
+?limit=) and every endpoint accepts ?fields=a,b,c to return only some
+fields. The .ndjson exports stream a whole library or the whole review
+table one JSON object per line, in constant memory.
+"""
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from blueprints import data_manager
+from datamanager.sqlite_data_manager import MOVIE_COLUMNS, REVIEW_COLUMNS
+from models import Director
+
+api_bp = Blueprint('api_bp', __name__, url_prefix='/api/v1')
+
+USER_FIELDS = ('id', 'name', 'lastname', 'review_count', 'avg_rating',
+               'version', 'updated_at')
+MOVIE_FIELDS = tuple(MOVIE_COLUMNS)
+REVIEW_FIELDS = tuple(REVIEW_COLUMNS)
+DIRECTOR_FIELDS = ('id', 'name')
+
+# Lines buffered into one chunk of a streamed export
+EXPORT_CHUNK_LINES = 500
+
+
+@api_bp.errorhandler(HTTPException)
+def json_error(error):
+    return jsonify({'error': error.description}), error.code
+
+
+def _requested_fields(allowed):
+    """Return the ?fields= selection, validated against `allowed`."""
+    requested = request.args.get('fields')
+    if not requested:
+        return list(allowed)
+    fields = list(dict.fromkeys(
+        name.strip() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        abort(400, description=f"Unknown fields: {', '.join(unknown)}; "
+                               f"available: {', '.join(allowed)}")
+    return fields
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Director):
+        return value.name
+    return value
+
+
+def _serialize(item, fields):
+    return {name: _json_value(getattr(item, name)) for name in fields}
+
+
+def _one(item, allowed):
+    if item is None:
+        abort(404, description="Not found")
+    return jsonify(_serialize(item, _requested_fields(allowed)))
+
+
+def _page(fetch, allowed, **kwargs):
+    """Run a keyset-paginated data-manager query and render the page."""
+    fields = _requested_fields(allowed)
+    try:
+        page = fetch(after=request.args.get('after'),
+                     before=request.args.get('before'),
+                     limit=request.args.get('limit', type=int), **kwargs)
+    except ValueError as e:
+        abort(400, description=str(e))
+    return jsonify({
+        'data': [_serialize(item, fields) for item in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+def _ndjson(rows, filename):
+    """Stream rows as NDJSON, a few hundred lines per chunk."""
+
+    def generate():
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(
+                {name: _json_value(value)
+                 for name, value in row._mapping.items()},
+                separators=(',', ':')))
+            if len(lines) >= EXPORT_CHUNK_LINES:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename="{filename}"'
+    return response
+
+
+def _movie_filters():
+    return {
+        'genre_id': request.args.get('genre_id', type=int),
+        'min_year': request.args.get('min_year', type=int),
+        'max_year': request.args.get('max_year', type=int),
+        'min_rating': request.args.get('min_rating', type=float),
+    }
+
+
+@api_bp.route('/users')
+def list_users():
+    return _page(data_manager.get_users_page, USER_FIELDS)
+
+
+@api_bp.route('/users/<int:user_id>')
+def get_user(user_id):
+    return _one(data_manager.get_user(user_id), USER_FIELDS)
+
+
+@api_bp.route('/users/<int:user_id>/movies')
+def user_movies(user_id):
+    if data_manager.get_user_version(user_id) is None:
+        abort(404, description=f"User with ID {user_id} not found")
+    return _page(data_manager.get_user_movies_page, MOVIE_FIELDS,
+                 user_id=user_id, sort=request.args.get('sort', 'title'),
+                 **_movie_filters())
+
+
+@api_bp.route('/users/<int:user_id>/movies.ndjson')
+def export_user_movies(user_id):
+    if data_manager.get_user_version(user_id) is None:
+        abort(404, description=f"User with ID {user_id} not found")
+    fields = _requested_fields(MOVIE_FIELDS)
+    return _ndjson(data_manager.iter_user_movies(user_id, fields),
+                   f'user-{user_id}-movies.ndjson')
+
+
+@api_bp.route('/movies')
+def find_movies():
+    return _page(data_manager.find_movies, MOVIE_FIELDS,
+                 sort=request.args.get('sort', 'rating'), **_movie_filters())
+
+
+@api_bp.route('/movies/<int:movie_id>')
+def get_movie(movie_id):
+    return _one(data_manager.get_movie(movie_id), MOVIE_FIELDS)
+
+
+@api_bp.route('/movies/<int:movie_id>/reviews')
+def movie_reviews(movie_id):
+    if data_manager.get_movie_version(movie_id) is None:
+        abort(404, description=f"Movie with ID {movie_id} not found")
+    return _page(data_manager.get_movie_reviews_page, REVIEW_FIELDS,
+                 movie_id=movie_id)
+
+
+@api_bp.route('/directors')
+def list_directors():
+    return _page(data_manager.get_directors_page, DIRECTOR_FIELDS)
+
+
+@api_bp.route('/directors/<int:director_id>')
+def get_director(director_id):
+    return _one(data_manager.get_director(director_id), DIRECTOR_FIELDS)
+
+
+@api_bp.route('/reviews/<int:review_id>')
+def get_review(review_id):
+    return _one(data_manager.get_review(review_id), REVIEW_FIELDS)
+
+
+@api_bp.route('/reviews.ndjson')
+def export_reviews():
+    fields = _requested_fields(REVIEW_FIELDS)
+    return _ndjson(data_manager.iter_reviews(fields), 'reviews.ndjson')
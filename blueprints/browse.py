@@ -0,0 +1,35 @@
+from flask import Blueprint, render_template, request, abort
+from blueprints import data_manager
+
+browse_bp = Blueprint('browse_bp', __name__, template_folder='templates')
+
+
+@browse_bp.route('/browse')
+def browse():
+    """Movies of all users, narrowed by genre, years and IMDb rating."""
+    filters = {
+        'genre_id': request.args.get('genre_id', type=int),
+        'min_year': request.args.get('min_year', type=int),
+        'max_year': request.args.get('max_year', type=int),
+        'min_rating': request.args.get('min_rating', type=float),
+    }
+    sort = request.args.get('sort', 'rating')
+    try:
+        facets = data_manager.get_facets(**filters)
+        page = data_manager.find_movies(
+            sort=sort, after=request.args.get('after'),
+            before=request.args.get('before'),
+            limit=request.args.get('limit', type=int), **filters)
+    except ValueError as e:
+        abort(400, description=str(e))
+    filters = {name: value for name, value in filters.items()
+               if value is not None}
+
+    def without(*names):
+        # The active filters minus some, for the facet links
+        return {name: value for name, value in filters.items()
+                if name not in names}
+
+    return render_template('browse.html', facets=facets, movies=page.items,
+                           page=page, sort=sort, filters=filters,
+                           without=without)
@@ -0,0 +1,23 @@
+from flask import Blueprint, abort, send_file
+from blueprints import poster_store
+
+posters_bp = Blueprint('posters_bp', __name__)
+
+# Poster files are content-addressed, so they can be cached forever
+POSTER_MAX_AGE = 365 * 24 * 3600
+
+
+@posters_bp.route('/posters/<digest>/<variant>')
+def poster(digest, variant):
+    path = poster_store.path(digest, variant)
+    if not path:
+        abort(404)
+    try:
+        response = send_file(path, mimetype=poster_store.mimetype(path),
+                             etag=f'{digest}-{variant}',
+                             max_age=POSTER_MAX_AGE, conditional=True)
+    except FileNotFoundError:
+        abort(404)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
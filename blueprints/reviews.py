@@ -1,32 +1,65 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from datamanager.sqlite_data_manager import SQLiteDataManager
+from blueprints import data_manager
 from models import Review
+from conditional import conditional_page
+from page_cache import cached_page
 
 reviews_bp = Blueprint('reviews_bp', __name__,
                        template_folder='templates')
 
-data_manager = SQLiteDataManager('db/moviwebapp.db')
+
+def movie_page_tags(movie_id):
+    """
+    Cache tags of a movie page. Opened from a library (?user_id=), the
+    page carries the review form of that user, so it is also dropped
+    when the user is.
+    """
+    tags = [f'movie:{movie_id}', 'directors']
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None:
+        tags.append(f'user:{user_id}')
+    return tags
 
 
 @reviews_bp.route('/movies/<int:movie_id>/reviews',
                   methods=['GET', 'POST'])
+@conditional_page(lambda movie_id: data_manager.get_movie_version(movie_id))
+@cached_page(movie_page_tags)
 def movie_reviews(movie_id):
     movie = data_manager.get_movie(movie_id)
-    reviews = data_manager.get_movie_reviews(movie_id)
+    if movie is None:
+        # Merged into another catalog movie or removed by its last holder
+        return f"Movie with ID {movie_id} not found", 404
     if request.method == 'POST':
+        # Reviews reference their author, so unknown users are refused
+        # rather than left to the foreign key
+        user_id = request.form.get('user_id', type=int)
+        if user_id is None or data_manager.get_user(user_id) is None:
+            return "A valid user_id is required", 400
         review_text = request.form['review_text']
         rating = request.form['rating']
         review = Review(
-            user_id=request.form['user_id'],
+            user_id=user_id,
             movie_id=movie_id,
             review_text=review_text,
             rating=rating
         )
         data_manager.add_review(review)
         return redirect(url_for('reviews_bp.movie_reviews',
-                                movie_id=movie_id))
+                                movie_id=movie_id, user_id=user_id))
+    reviews = data_manager.get_movie_reviews(movie_id)
     return render_template('movie_details.html',
-                           movie=movie, reviews=reviews)
+                           movie=movie, reviews=reviews,
+                           reviewer=_reviewer(),
+                           similar=data_manager.get_similar_movies(movie_id))
+
+
+def _reviewer():
+    """The user whose library the movie page was opened from, if any."""
+    user_id = request.args.get('user_id', type=int)
+    if user_id is None:
+        return None
+    return data_manager.get_user(user_id)
 
 
 @reviews_bp.route('/reviews/<int:review_id>/edit', methods=['GET', 'POST'])
@@ -57,7 +90,7 @@ def edit_review(review_id):
 
 @reviews_bp.route('/reviews/<int:review_id>/delete', methods=['POST'])
 def delete_review(review_id):
-    review = data_manager.get_review(review_id)
-    data_manager.delete_review(review_id)
-    return redirect(
-        url_for('reviews_bp.movie_reviews', movie_id=review.movie_id))
+    movie_id = data_manager.delete_review(review_id)
+    if movie_id is None:
+        return f"Review with ID {review_id} not found", 404
+    return redirect(url_for('reviews_bp.movie_reviews', movie_id=movie_id))
@@ -0,0 +1,11 @@
+from flask import Blueprint, render_template, request
+from blueprints import data_manager
+
+search_bp = Blueprint('search_bp', __name__, template_folder='templates')
+
+
+@search_bp.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    results = data_manager.search(query) if query else []
+    return render_template('search.html', query=query, results=results)
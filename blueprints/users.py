@@ -1,26 +1,81 @@
-from flask import Blueprint, render_template, request, redirect, url_for
-from datamanager.sqlite_data_manager import SQLiteDataManager
-from models import User, Movie, Director
-from static.utils import _fetch_movie_data
+import csv
+
+from flask import Blueprint, render_template, request, redirect, url_for, \
+    jsonify, abort, g
+from blueprints import data_manager, job_queue
+from datamanager.sqlite_data_manager import MOVIE_SORTS
+from models import User
+from conditional import conditional_page
+from page_cache import cached_page
+from static.enrichment import enqueue_enrichment
+from static.library_import import read_titles, enqueue_import
 
 
 users_bp = Blueprint('users_bp', __name__, template_folder='templates')
 
-data_manager = SQLiteDataManager('db/moviwebapp.db')
+
+def library_page_tags(user_id):
+    """
+    Cache tags of a library page: the user, and the movies it lists,
+    whose community ratings it shows (see remember_library_movies).
+    Sorted by community rating, the page changes with any rating.
+    """
+    tags = [f'user:{user_id}', 'directors']
+    tags += [f'movie:{movie_id}'
+             for movie_id in g.get('library_movie_ids', ())]
+    if request.args.get('sort') == 'community':
+        tags.append('ratings')
+    return tags
+
+
+def remember_library_movies(page):
+    """Keep the movies of a rendered library page for its cache tags."""
+    g.library_movie_ids = [movie.id for movie in page.items]
 
 
 @users_bp.route('/users')
+@conditional_page(lambda: data_manager.get_users_version())
+@cached_page(lambda: ['users'])
 def list_users():
-    users = data_manager.get_all_users()
-    return render_template('users.html', users=users)
+    try:
+        page = data_manager.get_user_list_page(
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            limit=request.args.get('limit', type=int))
+    except ValueError as e:
+        abort(400, description=str(e))
+    return render_template('users.html', users=page.items, page=page)
 
 
 @users_bp.route('/users/<int:user_id>')
+@conditional_page(lambda user_id: data_manager.get_user_version(user_id))
+@cached_page(library_page_tags)
 def user_movies(user_id):
     user = data_manager.get_user(user_id)
-    movies = data_manager.get_user_movies(user_id)
+    if not user:
+        return f"User with ID {user_id} not found", 404
+
+    sort = request.args.get('sort', 'title')
+    filters = {
+        'min_year': request.args.get('min_year', type=int),
+        'max_year': request.args.get('max_year', type=int),
+        'min_rating': request.args.get('min_rating', type=float),
+    }
+    try:
+        page = data_manager.get_library_page(
+            user_id, sort=sort,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            limit=request.args.get('limit', type=int),
+            **filters)
+    except ValueError as e:
+        abort(400, description=str(e))
+    remember_library_movies(page)
+    filters = {name: value for name, value in filters.items()
+               if value is not None}
     return render_template('user_movies.html', user=user,
-                           movies=movies)
+                           movies=page.items, page=page, sort=sort,
+                           sorts=MOVIE_SORTS, filters=filters)
 
 
 @users_bp.route('/add_user', methods=['GET', 'POST'])
@@ -33,6 +88,13 @@ def add_user():
     return render_template('add_user.html')
 
 
+@users_bp.route('/users/<int:user_id>/delete', methods=['POST'])
+def delete_user(user_id):
+    if not data_manager.delete_user(user_id):
+        return f"User with ID {user_id} not found", 404
+    return redirect(url_for('users_bp.list_users'))
+
+
 @users_bp.route('/users/<int:user_id>/add_movie', methods=['GET', 'POST'])
 def add_movie(user_id):
     user = data_manager.get_user(user_id)
@@ -41,43 +103,67 @@ def add_movie(user_id):
         return f"User with ID {user_id} not found", 404
 
     if request.method == 'POST':
-        title = request.form['title']
-        movie_data = _fetch_movie_data(title)
-
-        if movie_data:
-            director_name = movie_data.get('Director')
-            if not director_name:
-                return "Director not found", 404
-
-            director = data_manager.get_director_by_name(director_name)
-            if not director:
-                director = Director(name=director_name)
-                data_manager.add_director(director)
-
-            movie = Movie(
-                title=movie_data.get('Title'),
-                director_id=director.id,
-                year=movie_data.get('Year'),
-                rating=float(movie_data.get('imdbRating')),
-                poster=movie_data.get('Poster'),
-                plot=movie_data.get('Plot'),
-                user_id=user_id
-            )
-
-            print(movie)  # Debug output
-            movie_id = data_manager.add_movie(user_id, movie)
-            if movie_id:
-                return redirect(url_for('users_bp.user_movies', user_id=user_id))
-            else:
-                return "Failed to add movie", 500
-        else:
-            return "Movie not found", 404
+        title = request.form['title'].strip()
+        if not title:
+            return "Title is required", 400
+
+        # The OMDb details are filled in by a background job; the library
+        # shows the movie as pending until then
+        movie_id = data_manager.add_pending_movie(user_id, title)
+        if not movie_id:
+            return "Failed to add movie", 500
+        enqueue_enrichment(job_queue, movie_id, title)
+        return redirect(url_for('users_bp.user_movies', user_id=user_id))
 
     return render_template('add_movie.html', user=user)
 
 
+@users_bp.route('/users/<int:user_id>/import', methods=['GET', 'POST'])
+def import_movies(user_id):
+    user = data_manager.get_user(user_id)
+
+    if not user:
+        return f"User with ID {user_id} not found", 404
+
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return "No file uploaded", 400
+        try:
+            titles = read_titles(upload.stream, upload.filename)
+        except (ValueError, csv.Error) as e:
+            return f"Could not read import file: {e}", 400
+
+        # Run by a job worker; the progress page follows it
+        import_id = enqueue_import(job_queue, data_manager, user_id, titles)
+        status_url = url_for('users_bp.import_progress', user_id=user_id,
+                             import_id=import_id)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'import_id': import_id,
+                            'status_url': status_url}), 202, \
+                {'Location': status_url}
+        return redirect(status_url)
+
+    return render_template('import_library.html', user=user, report=None)
+
+
+@users_bp.route('/users/<int:user_id>/imports/<int:import_id>')
+def import_progress(user_id, import_id):
+    user = data_manager.get_user(user_id)
+    report = data_manager.get_library_import(import_id)
+    if not user or report is None or report.user_id != user_id:
+        return f"Import with ID {import_id} not found", 404
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(report._asdict())
+    return render_template('import_library.html', user=user,
+                           report=report)
+
+
 @users_bp.route('/users/<int:user_id>/delete_movie/<int:movie_id>',
                 methods=['POST'])
 def delete_movie(user_id, movie_id):
-    data_manager.delete_movie(movie_id)
+    # Only takes the movie out of this user's library: the catalog movie
+    # and its reviews stay for the other users
+    data_manager.remove_user_movie(user_id, movie_id)
     return redirect(url_for('users_bp.user_movies', user_id=user_id))
@@ -0,0 +1,75 @@
+"""
+Conditional GET (ETag / Last-Modified) for the read routes.
+
+Each page is validated by a PageVersion (see SQLiteDataManager
+get_*_version), a single indexed lookup. When the client's
+If-None-Match / If-Modified-Since still matches, the view answers 304
+without loading the page's data or rendering its template.
+"""
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+
+def _etag(version):
+    # The full path is part of the tag: every sort order, filter and page
+    # of a listing is a different representation
+    raw = f'{request.full_path}|{version.version}|{version.updated_at}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional_page(version):
+    """
+    Decorator answering conditional GETs of a view with 304.
+
+    Place it above @cached_page so a revalidated page skips the page
+    cache as well.
+
+    :param version: Callable receiving the view arguments and returning
+    the page's PageVersion, or None when the entity does not exist (the
+    view then runs and produces its own 404).
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # Pages with pending flash messages are rendered per user
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(**kwargs)
+            current = version(**kwargs)
+            if current is None:
+                return view(**kwargs)
+
+            etag = _etag(current)
+            last_modified = None
+            if current.updated_at is not None:
+                # HTTP dates have a resolution of one second
+                last_modified = current.updated_at.replace(
+                    tzinfo=timezone.utc, microsecond=0)
+
+            if _not_modified(etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # Caches may keep the page but must revalidate it on each use
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,109 @@
+"""
+asyncio data layer: the SQLiteDataManager operations as coroutines, on
+SQLAlchemy's async engine with the aiosqlite driver.
+
+The statements are SQLiteDataManager's own. Every coroutine runs the
+synchronous method in a greenlet (greenlet_spawn, the bridge AsyncSession
+is built on), where each database call awaits aiosqlite instead of
+blocking, so one event loop overlaps the queries of many requests. The
+streaming exports (iter_user_movies, iter_reviews) become async iterators
+fetching a batch of rows per await.
+
+Requires the aiosqlite package (``pip install aiosqlite``).
+"""
+import functools
+import inspect
+import itertools
+
+from sqlalchemy.util import greenlet_spawn
+
+from datamanager.sqlite_data_manager import SQLiteDataManager
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+
+class AsyncSQLiteDataManager:
+    """
+    Coroutine counterpart of every public SQLiteDataManager method (and
+    so of the DataManagerInterface operations), e.g.
+    ``await data_manager.get_movie(movie_id)``.
+
+    Create one with ``await AsyncSQLiteDataManager.open(db_file_name)``.
+    """
+
+    def __init__(self, data_manager):
+        """
+        :param data_manager: SQLiteDataManager created with
+        async_driver=True, whose methods the coroutines run.
+        """
+        self.sync = data_manager
+
+    @classmethod
+    async def open(cls, db_file_name, **engine_options):
+        """
+        Open the database (migrating it if needed).
+
+        :param db_file_name: Name of the SQLite database file.
+        :param engine_options: Pool and pragma settings passed on to
+        create_sqlite_engines; pooled=False when the data manager is used
+        from more than one event loop (e.g. Flask async views, which run
+        each request in its own loop).
+        """
+        if aiosqlite is None:
+            raise RuntimeError("AsyncSQLiteDataManager requires the "
+                               "aiosqlite package (pip install aiosqlite)")
+        return cls(await greenlet_spawn(SQLiteDataManager, db_file_name,
+                                        async_driver=True, **engine_options))
+
+    def add_invalidation_listener(self, listener):
+        """See SQLiteDataManager.add_invalidation_listener."""
+        self.sync.add_invalidation_listener(listener)
+
+    def iter_user_movies(self, user_id, fields=None, batch_size=1000):
+        """
+        Async iterator over a user's whole library (see
+        SQLiteDataManager.iter_user_movies).
+        """
+        return self._stream(self.sync.iter_user_movies(
+            user_id, fields, batch_size), batch_size)
+
+    def iter_reviews(self, fields=None, batch_size=1000):
+        """
+        Async iterator over every review (see SQLiteDataManager.iter_reviews).
+        """
+        return self._stream(self.sync.iter_reviews(fields, batch_size),
+                            batch_size)
+
+    @staticmethod
+    async def _stream(rows, batch_size):
+        """Yield the rows of a SQLiteDataManager generator, a batch per
+        greenlet."""
+        try:
+            while True:
+                batch = await greenlet_spawn(
+                    lambda: list(itertools.islice(rows, batch_size)))
+                if not batch:
+                    return
+                for row in batch:
+                    yield row
+        finally:
+            # Closes the generator's read session
+            await greenlet_spawn(rows.close)
+
+
+def _coroutine(method):
+    @functools.wraps(method)
+    async def coroutine(self, *args, **kwargs):
+        return await greenlet_spawn(method, self.sync, *args, **kwargs)
+
+    return coroutine
+
+
+for _name, _method in inspect.getmembers(SQLiteDataManager,
+                                         inspect.isfunction):
+    if not _name.startswith('_') and \
+            _name not in vars(AsyncSQLiteDataManager):
+        setattr(AsyncSQLiteDataManager, _name, _coroutine(_method))
@@ -15,14 +15,68 @@ class DataManagerInterface(ABC):
         """Retrieve all movies associated with a specific user."""
         pass
 
+    @abstractmethod
+    def get_users_page(self, after=None, before=None, limit=None):
+        """Retrieve one keyset-paginated page of users."""
+        pass
+
+    @abstractmethod
+    def get_user_movies_page(self, user_id, sort='title', after=None,
+                             before=None, limit=None):
+        """Retrieve one keyset-paginated page of a user's movies."""
+        pass
+
+    @abstractmethod
+    def get_user_list_page(self, after=None, before=None, limit=None):
+        """Retrieve one keyset-paginated page of user read models."""
+        pass
+
+    @abstractmethod
+    def get_library_page(self, user_id, sort='title', after=None,
+                         before=None, limit=None):
+        """Retrieve one keyset-paginated page of a user's movies as read
+        models."""
+        pass
+
+    @abstractmethod
+    def get_users_version(self):
+        """Return the (version, updated_at) validator of the user list."""
+        pass
+
+    @abstractmethod
+    def get_user_version(self, user_id):
+        """Return the (version, updated_at) validator of a user's page."""
+        pass
+
+    @abstractmethod
+    def get_movie_version(self, movie_id):
+        """Return the (version, updated_at) validator of a movie's page."""
+        pass
+
     @abstractmethod
     def add_user(self, user):
         """Add a new user to the database."""
         pass
 
+    @abstractmethod
+    def delete_user(self, user_id):
+        """Delete a user with their reviews and library."""
+        pass
+
     @abstractmethod
     def add_movie(self, user_id, movie):
-        """Add a new movie to a specific user's movie list."""
+        """Add a movie to the catalog (once) and to a user's library."""
+        pass
+
+    @abstractmethod
+    def remove_user_movie(self, user_id, movie_id):
+        """Remove a movie from a user's library."""
+        pass
+
+    @abstractmethod
+    def update_library_entry(self, user_id, movie_id, user_rating=None,
+                             notes=None):
+        """Set a user's own rating and notes of a movie in their library."""
         pass
 
     @abstractmethod
@@ -32,5 +86,5 @@ class DataManagerInterface(ABC):
 
     @abstractmethod
     def delete_movie(self, movie_id):
-        """Delete a specific movie from the database."""
+        """Delete a movie from the catalog and every library."""
         pass
@@ -0,0 +1,582 @@
+"""
+Versioned schema migrations for the SQLite database.
+
+The schema version is stored in SQLite's ``PRAGMA user_version``. A fresh
+database gets every table from ``Base.metadata.create_all`` and is then
+walked through all migrations; an existing database only runs the ones
+newer than its stored version. Every migration therefore has to be
+idempotent (``IF NOT EXISTS``, column checks) so it is a no-op when the
+models already created what it adds.
+"""
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+
+from models import Base
+from datamanager.normalize import normalized_columns, name_key
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register the decorated function as the migration to `version`."""
+
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+
+    return register
+
+
+def latest_version():
+    """Return the version the database is at after all migrations."""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(connection):
+    """Return the schema version stored in the database."""
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def upgrade(engine):
+    """
+    Bring the database behind `engine` up to the latest schema version.
+
+    An up-to-date database is detected without taking any lock, so workers
+    starting on it return at once. Otherwise the migrations run in one
+    BEGIN IMMEDIATE transaction, so when several workers start at once
+    only the first one migrates and the others see the new version.
+    Foreign keys are not enforced meanwhile, since table rebuilds drop
+    tables other tables refer to (which would cascade); they are checked
+    before the transaction commits instead.
+
+    :param engine: The read-write engine of the database.
+    :return: The schema version after the upgrade.
+    """
+    with engine.connect() as connection:
+        # Read on the DBAPI connection, outside the BEGIN IMMEDIATE the
+        # engine's begin hook would open
+        dbapi_connection = connection.connection.dbapi_connection
+        version = _pragma(dbapi_connection, 'PRAGMA user_version')[0]
+        if version >= latest_version():
+            return version
+
+        # PRAGMA foreign_keys is a no-op inside a transaction
+        _pragma(dbapi_connection, 'PRAGMA foreign_keys=OFF')
+        try:
+            with connection.begin():
+                version = current_version(connection)
+                if version >= latest_version():
+                    return version
+
+                Base.metadata.create_all(connection)
+                for target, description, func in MIGRATIONS:
+                    if target <= version:
+                        continue
+                    func(connection)
+                    connection.exec_driver_sql(
+                        f'PRAGMA user_version={target}')
+                    version = target
+                violations = connection.exec_driver_sql(
+                    'PRAGMA foreign_key_check').all()
+                if violations:
+                    raise RuntimeError(
+                        f"Migration left {len(violations)} rows referring "
+                        f"to missing rows, e.g. {tuple(violations[0])}")
+        finally:
+            _pragma(dbapi_connection, 'PRAGMA foreign_keys=ON')
+    return version
+
+
+# --- Helpers ---
+
+def _pragma(dbapi_connection, statement):
+    # Through a cursor, which aiosqlite's DBAPI adapter has as well
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(statement)
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def _create_index(connection, name, table, columns, unique=False):
+    # Indexes on columns a later migration dropped (e.g. movies.user_id)
+    # are skipped, since a fresh database never had them
+    if not set(columns) <= _column_names(connection, table):
+        return
+    unique_sql = 'UNIQUE ' if unique else ''
+    connection.exec_driver_sql(
+        f'CREATE {unique_sql}INDEX IF NOT EXISTS {name} '
+        f'ON {table} ({", ".join(columns)})')
+
+
+def _column_names(connection, table):
+    return {row[1] for row in connection.exec_driver_sql(
+        f'PRAGMA table_info({table})')}
+
+
+def _add_column(connection, table, name, definition):
+    if name not in _column_names(connection, table):
+        connection.exec_driver_sql(
+            f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+
+def _not_null_columns(connection, table):
+    return {row[1] for row in connection.exec_driver_sql(
+        f'PRAGMA table_info({table})') if row[3]}
+
+
+def _rebuild_table(connection, name, drop=()):
+    """
+    Recreate a table from its current model definition, keeping its rows.
+
+    ALTER TABLE cannot change the constraints of existing columns, so the
+    new table is created under a temporary name, the columns both versions
+    share are copied, and it replaces the old one; columns the old table
+    lacks get their defaults. Columns the model no longer has are kept
+    as they are (a later migration may still read them) unless listed in
+    `drop`. The model's indexes are recreated. Triggers of other tables
+    referring to this one have to be dropped beforehand (the rename fails
+    otherwise) and recreated afterwards.
+    """
+    table = Base.metadata.tables[name]
+    temporary = f'_{name}_rebuild'
+    existing = _column_names(connection, name)
+    kept = {}
+    for _, column, type_, not_null, default, _ in \
+            connection.exec_driver_sql(f'PRAGMA table_info({name})'):
+        if column not in table.columns and column not in drop:
+            kept[column] = ' '.join(
+                [column, type_] + (['NOT NULL'] if not_null else [])
+                + ([f'DEFAULT {default}'] if default is not None else []))
+    ddl = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.exec_driver_sql(ddl.replace(
+        f'CREATE TABLE {name} (',
+        f'CREATE TABLE {temporary} (' + ''.join(
+            f'{definition}, ' for definition in kept.values()), 1))
+
+    columns = ', '.join([column.name for column in table.columns
+                         if column.name in existing] + list(kept))
+    connection.exec_driver_sql(
+        f'INSERT INTO {temporary} ({columns}) SELECT {columns} FROM {name}')
+    connection.exec_driver_sql(f'DROP TABLE {name}')
+    connection.exec_driver_sql(f'ALTER TABLE {temporary} RENAME TO {name}')
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+# --- Migrations ---
+
+@migration(1, 'Baseline schema')
+def _baseline(connection):
+    # The tables themselves are created by create_all in upgrade()
+    pass
+
+
+@migration(2, 'Indexes on foreign keys and unique director names')
+def _foreign_key_indexes(connection):
+    # Merge duplicate directors into the oldest row before the unique
+    # index on the name can be created.
+    connection.exec_driver_sql(
+        'UPDATE movies SET director_id = ('
+        '  SELECT MIN(d2.id) FROM directors d1'
+        '  JOIN directors d2 ON d2.name = d1.name'
+        '  WHERE d1.id = movies.director_id)')
+    connection.exec_driver_sql(
+        'DELETE FROM directors WHERE id NOT IN ('
+        '  SELECT MIN(id) FROM directors GROUP BY name)')
+
+    _create_index(connection, 'ix_movies_user_id', 'movies', ['user_id'])
+    _create_index(connection, 'ix_movies_director_id', 'movies',
+                  ['director_id'])
+    _create_index(connection, 'ix_reviews_movie_id', 'reviews',
+                  ['movie_id'])
+    _create_index(connection, 'ix_reviews_user_id', 'reviews', ['user_id'])
+    _create_index(connection, 'ix_directors_name', 'directors', ['name'],
+                  unique=True)
+
+
+@migration(3, 'Indexes for keyset pagination of users and libraries')
+def _pagination_indexes(connection):
+    _create_index(connection, 'ix_users_name', 'users', ['name'])
+    _create_index(connection, 'ix_movies_user_title', 'movies',
+                  ['user_id', 'title'])
+    _create_index(connection, 'ix_movies_user_year', 'movies',
+                  ['user_id', 'year'])
+    _create_index(connection, 'ix_movies_user_rating', 'movies',
+                  ['user_id', 'rating'])
+
+
+def create_search_index(connection):
+    """
+    Create the movie_search FTS5 table and the triggers keeping it in sync.
+
+    One row per movie (rowid = movies.id) holds the title, plot, director
+    name and the concatenated review texts. Also used to restore the
+    triggers after a table rebuild.
+    """
+    connection.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS movie_search USING fts5("
+        " title, plot, director, reviews,"
+        " tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+
+    movie_row = (
+        "INSERT INTO movie_search (rowid, title, plot, director, reviews)"
+        " SELECT NEW.id, NEW.title, coalesce(NEW.plot, ''),"
+        " coalesce((SELECT name FROM directors"
+        "           WHERE id = NEW.director_id), ''),"
+        " coalesce((SELECT group_concat(review_text, ' ') FROM reviews"
+        "           WHERE movie_id = NEW.id), '');")
+    reviews_of = (
+        "UPDATE movie_search SET reviews = coalesce("
+        " (SELECT group_concat(review_text, ' ') FROM reviews"
+        "  WHERE movie_id = {row}.movie_id), '')"
+        " WHERE rowid = {row}.movie_id;")
+
+    triggers = {
+        'movie_search_movie_insert':
+            f"AFTER INSERT ON movies BEGIN {movie_row} END",
+        'movie_search_movie_update':
+            "AFTER UPDATE OF title, plot, director_id ON movies BEGIN"
+            " DELETE FROM movie_search WHERE rowid = OLD.id;"
+            f" {movie_row} END",
+        'movie_search_movie_delete':
+            "AFTER DELETE ON movies BEGIN"
+            " DELETE FROM movie_search WHERE rowid = OLD.id; END",
+        'movie_search_director_update':
+            "AFTER UPDATE OF name ON directors BEGIN"
+            " UPDATE movie_search SET director = NEW.name WHERE rowid IN"
+            " (SELECT id FROM movies WHERE director_id = NEW.id); END",
+        'movie_search_review_insert':
+            f"AFTER INSERT ON reviews BEGIN {reviews_of.format(row='NEW')}"
+            " END",
+        'movie_search_review_update':
+            "AFTER UPDATE OF review_text, movie_id ON reviews BEGIN"
+            f" {reviews_of.format(row='OLD')} {reviews_of.format(row='NEW')}"
+            " END",
+        'movie_search_review_delete':
+            f"AFTER DELETE ON reviews BEGIN {reviews_of.format(row='OLD')}"
+            " END",
+    }
+    for name, body in triggers.items():
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+    # Default ranking for ORDER BY rank: bm25 weighted towards titles
+    # (columns: title, plot, director, reviews)
+    connection.exec_driver_sql(
+        "INSERT INTO movie_search (movie_search, rank)"
+        " VALUES ('rank', 'bm25(10.0, 1.0, 5.0, 0.5)')")
+
+
+def drop_search_triggers(connection):
+    """
+    Drop the triggers maintaining movie_search, e.g. before a bulk load
+    that is followed by rebuild_search_index and create_search_index.
+    """
+    names = [row[0] for row in connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master"
+        " WHERE type = 'trigger' AND name LIKE 'movie_search_%'")]
+    for name in names:
+        connection.exec_driver_sql(f'DROP TRIGGER {name}')
+
+
+def rebuild_search_index(connection):
+    """Refill movie_search from the movies, directors and reviews."""
+    connection.exec_driver_sql('DELETE FROM movie_search')
+    connection.exec_driver_sql(
+        "INSERT INTO movie_search (rowid, title, plot, director, reviews)"
+        " SELECT m.id, m.title, coalesce(m.plot, ''), coalesce(d.name, ''),"
+        " coalesce((SELECT group_concat(review_text, ' ') FROM reviews r"
+        "           WHERE r.movie_id = m.id), '')"
+        " FROM movies m LEFT JOIN directors d ON d.id = m.director_id")
+
+
+@migration(4, 'FTS5 search index over titles, plots, directors, reviews')
+def _search_index(connection):
+    create_search_index(connection)
+    rebuild_search_index(connection)
+
+
+# Recompute every rating aggregate from the reviews table; used by
+# migration 5 and by SQLiteDataManager.rebuild_rating_aggregates.
+REBUILD_RATING_AGGREGATES = (
+    "UPDATE movies SET"
+    " review_count = (SELECT count(*) FROM reviews"
+    "                 WHERE movie_id = movies.id),"
+    " rating_sum = (SELECT coalesce(sum(rating), 0) FROM reviews"
+    "               WHERE movie_id = movies.id),"
+    " avg_rating = (SELECT coalesce(avg(rating), 0) FROM reviews"
+    "               WHERE movie_id = movies.id)",
+    "UPDATE users SET"
+    " review_count = (SELECT count(*) FROM reviews"
+    "                 WHERE user_id = users.id),"
+    " rating_sum = (SELECT coalesce(sum(rating), 0) FROM reviews"
+    "               WHERE user_id = users.id),"
+    " avg_rating = (SELECT coalesce(avg(rating), 0) FROM reviews"
+    "               WHERE user_id = users.id)",
+)
+
+
+@migration(5, 'Per-movie and per-user rating aggregates')
+def _rating_aggregates(connection):
+    for table in ('movies', 'users'):
+        _add_column(connection, table, 'review_count',
+                    "INTEGER NOT NULL DEFAULT 0")
+        _add_column(connection, table, 'rating_sum',
+                    "FLOAT NOT NULL DEFAULT 0")
+        _add_column(connection, table, 'avg_rating',
+                    "FLOAT NOT NULL DEFAULT 0")
+    _create_index(connection, 'ix_movies_user_avg_rating', 'movies',
+                  ['user_id', 'avg_rating'])
+    for statement in REBUILD_RATING_AGGREGATES:
+        connection.exec_driver_sql(statement)
+
+
+@migration(6, 'Typed year_start/year_end/imdb_rating columns')
+def _typed_year_and_rating(connection):
+    _add_column(connection, 'movies', 'year_start', 'INTEGER')
+    _add_column(connection, 'movies', 'year_end', 'INTEGER')
+    _add_column(connection, 'movies', 'imdb_rating', 'FLOAT')
+
+    rows = connection.exec_driver_sql(
+        'SELECT id, year, rating FROM movies').all()
+    updates = [dict(normalized_columns(year, rating), id=movie_id)
+               for movie_id, year, rating in rows]
+    if updates:
+        connection.execute(text(
+            'UPDATE movies SET year_start = :year_start,'
+            ' year_end = :year_end, imdb_rating = :imdb_rating'
+            ' WHERE id = :id'), updates)
+
+    _create_index(connection, 'ix_movies_user_year_start', 'movies',
+                  ['user_id', 'year_start'])
+    _create_index(connection, 'ix_movies_user_imdb_rating', 'movies',
+                  ['user_id', 'imdb_rating'])
+    _create_index(connection, 'ix_movies_year_start', 'movies',
+                  ['year_start'])
+    _create_index(connection, 'ix_movies_imdb_rating', 'movies',
+                  ['imdb_rating'])
+
+
+@migration(7, 'Local poster mirror digest')
+def _poster_hash(connection):
+    _add_column(connection, 'movies', 'poster_hash', 'VARCHAR(64)')
+
+
+@migration(8, 'Row versions and update times for HTTP validators')
+def _row_versions(connection):
+    for table in ('users', 'movies', 'reviews'):
+        _add_column(connection, table, 'version',
+                    "INTEGER NOT NULL DEFAULT 1")
+        # ALTER TABLE only accepts constant defaults, so existing rows
+        # get the migration time
+        _add_column(connection, table, 'updated_at', 'DATETIME')
+        connection.exec_driver_sql(
+            f"UPDATE {table} SET updated_at = datetime('now')"
+            f" WHERE updated_at IS NULL")
+    _create_index(connection, 'ix_users_updated_at', 'users',
+                  ['updated_at'])
+
+
+@migration(9, 'Normalized unique director name keys')
+def _director_name_keys(connection):
+    _add_column(connection, 'directors', 'name_key', 'VARCHAR')
+    rows = connection.exec_driver_sql(
+        'SELECT id, name FROM directors WHERE name_key IS NULL').all()
+    if rows:
+        connection.execute(
+            text('UPDATE directors SET name_key = :key WHERE id = :id'),
+            [{'key': name_key(name), 'id': director_id}
+             for director_id, name in rows])
+
+    # Directors differing only in case or spacing are one director: move
+    # their movies to the oldest row and drop the others
+    duplicates = ('SELECT id FROM directors WHERE id NOT IN'
+                  ' (SELECT MIN(id) FROM directors GROUP BY name_key)')
+    connection.exec_driver_sql(
+        'UPDATE movies SET director_id = ('
+        '  SELECT MIN(d2.id) FROM directors d1'
+        '  JOIN directors d2 ON d2.name_key = d1.name_key'
+        '  WHERE d1.id = movies.director_id)'
+        f' WHERE director_id IN ({duplicates})')
+    connection.exec_driver_sql(
+        f'DELETE FROM directors WHERE id IN ({duplicates})')
+    _create_index(connection, 'ix_directors_name_key', 'directors',
+                  ['name_key'], unique=True)
+
+
+@migration(10, 'Placeholder movies: nullable details, enrichment status')
+def _movie_enrichment_status(connection):
+    # Movies added by title are stored before OMDb has been asked for
+    # their director, year and rating
+    if _not_null_columns(connection, 'movies') & {
+            'director_id', 'year', 'rating'}:
+        drop_search_triggers(connection)
+        _rebuild_table(connection, 'movies')
+        create_search_index(connection)
+    _add_column(connection, 'movies', 'enrichment_status',
+                "VARCHAR NOT NULL DEFAULT 'done'")
+
+
+@migration(11, 'Unique genre names and movies-by-genre index')
+def _genre_indexes(connection):
+    # Merge duplicate genres into the oldest row, keeping one link per
+    # movie, before the unique index on the name can be created
+    duplicates = ('SELECT id FROM genres WHERE id NOT IN'
+                  ' (SELECT MIN(id) FROM genres GROUP BY name)')
+    connection.exec_driver_sql(
+        'INSERT OR IGNORE INTO movie_genre (movie_id, genre_id)'
+        ' SELECT movie_id, ('
+        '  SELECT MIN(g2.id) FROM genres g1'
+        '  JOIN genres g2 ON g2.name = g1.name'
+        '  WHERE g1.id = movie_genre.genre_id)'
+        f' FROM movie_genre WHERE genre_id IN ({duplicates})')
+    connection.exec_driver_sql(
+        f'DELETE FROM movie_genre WHERE genre_id IN ({duplicates})')
+    connection.exec_driver_sql(
+        f'DELETE FROM genres WHERE id IN ({duplicates})')
+    _create_index(connection, 'ix_genres_name', 'genres', ['name'],
+                  unique=True)
+    _create_index(connection, 'ix_movie_genre_genre_movie', 'movie_genre',
+                  ['genre_id', 'movie_id'])
+
+
+@migration(12, 'Precomputed similar movies and their change log')
+def _movie_similarities(connection):
+    # movie_similarities and similarity_changes come from create_all; log
+    # every reviewed movie so the first refresh computes all neighbours
+    connection.exec_driver_sql(
+        'INSERT INTO similarity_changes (movie_id)'
+        ' SELECT DISTINCT movie_id FROM reviews')
+
+
+@migration(13, 'Shared movie catalog with per-user library links')
+def _shared_catalog(connection):
+    _add_column(connection, 'movies', 'imdb_id', 'VARCHAR')
+    if 'user_id' not in _column_names(connection, 'movies'):
+        return
+
+    # Every movie becomes a library entry of its owner, in the order the
+    # movies were added
+    connection.exec_driver_sql(
+        'INSERT INTO user_movies (user_id, movie_id, added_at)'
+        ' SELECT user_id, id, coalesce(updated_at, CURRENT_TIMESTAMP)'
+        ' FROM movies ORDER BY id')
+
+    # Copies of one OMDb movie (same title, year and director) collapse
+    # into the oldest; the others' links, reviews and genres move to it
+    connection.exec_driver_sql(
+        'CREATE TEMP TABLE movie_merge'
+        ' (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)')
+    connection.exec_driver_sql(
+        'INSERT INTO movie_merge (old_id, new_id)'
+        ' SELECT id, keep FROM (SELECT id, MIN(id) OVER ('
+        '  PARTITION BY title, year, director_id) AS keep FROM movies'
+        "  WHERE enrichment_status = 'done' AND director_id IS NOT NULL)"
+        ' WHERE id != keep')
+    merged = 'SELECT old_id FROM movie_merge'
+
+    def kept_id(table):
+        return (f'(SELECT new_id FROM movie_merge'
+                f' WHERE old_id = {table}.movie_id)')
+
+    drop_search_triggers(connection)
+    # A user holding several copies keeps one entry (the others are
+    # deleted with the merged movies below)
+    connection.exec_driver_sql(
+        f'UPDATE OR IGNORE user_movies SET movie_id = {kept_id("user_movies")}'
+        f' WHERE movie_id IN ({merged})')
+    connection.exec_driver_sql(
+        f'UPDATE reviews SET movie_id = {kept_id("reviews")}'
+        f' WHERE movie_id IN ({merged})')
+    connection.exec_driver_sql(
+        f'INSERT OR IGNORE INTO movie_genre (movie_id, genre_id)'
+        f' SELECT {kept_id("movie_genre")}, genre_id FROM movie_genre'
+        f' WHERE movie_id IN ({merged})')
+    connection.exec_driver_sql(
+        'UPDATE movies SET poster_hash = (SELECT d.poster_hash'
+        '  FROM movie_merge JOIN movies d ON d.id = movie_merge.old_id'
+        '  WHERE movie_merge.new_id = movies.id'
+        '  AND d.poster_hash IS NOT NULL LIMIT 1)'
+        ' WHERE poster_hash IS NULL'
+        '  AND id IN (SELECT new_id FROM movie_merge)')
+
+    # The kept movies' ratings changed, and the movies listing a merged
+    # one lose a neighbour
+    connection.exec_driver_sql(
+        'INSERT INTO similarity_changes (movie_id)'
+        ' SELECT DISTINCT new_id FROM movie_merge UNION'
+        ' SELECT movie_id FROM movie_similarities'
+        f' WHERE similar_movie_id IN ({merged})')
+    for table, column in (('user_movies', 'movie_id'),
+                          ('movie_genre', 'movie_id'),
+                          ('movie_similarities', 'movie_id'),
+                          ('movie_similarities', 'similar_movie_id'),
+                          ('movies', 'id')):
+        connection.exec_driver_sql(
+            f'DELETE FROM {table} WHERE {column} IN ({merged})')
+    connection.exec_driver_sql(
+        'UPDATE movies SET'
+        ' review_count = (SELECT count(*) FROM reviews'
+        '                 WHERE movie_id = movies.id),'
+        ' rating_sum = (SELECT coalesce(sum(rating), 0) FROM reviews'
+        '               WHERE movie_id = movies.id),'
+        ' avg_rating = (SELECT coalesce(avg(rating), 0) FROM reviews'
+        '               WHERE movie_id = movies.id),'
+        ' version = version + 1'
+        ' WHERE id IN (SELECT new_id FROM movie_merge)')
+    connection.exec_driver_sql('DROP TABLE movie_merge')
+
+    # Drop movies.user_id (and its indexes)
+    _rebuild_table(connection, 'movies', drop=['user_id'])
+    rebuild_search_index(connection)
+    create_search_index(connection)
+    connection.exec_driver_sql('UPDATE users SET version = version + 1')
+
+
+@migration(14, 'ON DELETE CASCADE foreign keys')
+def _cascading_foreign_keys(connection):
+    # Rows left behind by deletes from before foreign keys were enforced
+    # would fail the foreign key check
+    references = [('reviews', 'movie_id', 'movies'),
+                  ('reviews', 'user_id', 'users'),
+                  ('movie_genre', 'movie_id', 'movies'),
+                  ('movie_genre', 'genre_id', 'genres'),
+                  ('user_movies', 'movie_id', 'movies'),
+                  ('user_movies', 'user_id', 'users'),
+                  ('movie_similarities', 'movie_id', 'movies'),
+                  ('movie_similarities', 'similar_movie_id', 'movies')]
+    removed_reviews = 0
+    for table, column, parent in references:
+        removed = connection.exec_driver_sql(
+            f'DELETE FROM {table}'
+            f' WHERE {column} NOT IN (SELECT id FROM {parent})').rowcount
+        if table == 'reviews':
+            removed_reviews += removed
+    connection.exec_driver_sql(
+        'UPDATE movies SET director_id = NULL'
+        ' WHERE director_id NOT IN (SELECT id FROM directors)')
+    if removed_reviews:
+        for statement in REBUILD_RATING_AGGREGATES:
+            connection.exec_driver_sql(statement)
+
+    # The constraints of existing columns only change with a rebuild
+    drop_search_triggers(connection)
+    for table in ('movies', 'reviews', 'movie_genre', 'user_movies',
+                  'movie_similarities'):
+        _rebuild_table(connection, table)
+    create_search_index(connection)
+
+
+@migration(15, 'Progress of background library imports')
+def _library_imports(connection):
+    # library_imports comes from create_all
+    pass
+
+
+@migration(16, 'Per-user rating and notes on library entries')
+def _library_entry_fields(connection):
+    _add_column(connection, 'user_movies', 'user_rating', 'FLOAT')
+    _add_column(connection, 'user_movies', 'notes', 'TEXT')
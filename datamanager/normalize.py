@@ -0,0 +1,53 @@
+"""
+Parsing of the free-text year and rating values OMDb returns into the
+typed year_start / year_end / imdb_rating columns, and normalization of
+director names into their unique lookup key.
+"""
+import re
+import unicodedata
+
+_YEAR = re.compile(r'\d{4}')
+
+
+def parse_year_range(value):
+    """
+    Split an OMDb year into (start, end) integers.
+
+    "2010" -> (2010, 2010), "2010–2014" -> (2010, 2014), a running series
+    "2010–" -> (2010, None) and "N/A" or garbage -> (None, None).
+    """
+    if value is None:
+        return None, None
+    text = str(value).strip()
+    years = [int(year) for year in _YEAR.findall(text)]
+    if not years:
+        return None, None
+    if len(years) == 1 and text.rstrip().endswith(('–', '-')):
+        return years[0], None
+    return years[0], years[-1]
+
+
+def parse_rating(value):
+    """Return an OMDb rating as a float, or None for "N/A" and garbage."""
+    if value is None:
+        return None
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return None
+
+
+def name_key(name):
+    """
+    Return the lookup key of a director name: Unicode-normalized,
+    whitespace-collapsed and case-folded, so "Christopher  Nolan" and
+    "christopher nolan" are the same director.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', name).split()).casefold()
+
+
+def normalized_columns(year, rating):
+    """Return the typed column values for a movie's year and rating."""
+    year_start, year_end = parse_year_range(year)
+    return {'year_start': year_start, 'year_end': year_end,
+            'imdb_rating': parse_rating(rating)}
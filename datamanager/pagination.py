@@ -0,0 +1,131 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A page is addressed by the (sort key, id) of the row just before or after
+it instead of an OFFSET, so SQLite seeks straight to the page through the
+(sort key) index no matter how deep it is.
+"""
+import base64
+import json
+from collections import namedtuple
+
+from sqlalchemy import Select, tuple_
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode a (sort value, id) position as an opaque URL-safe token."""
+    raw = json.dumps([sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a token produced by encode_cursor.
+
+    :raises ValueError: If the token is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid page cursor: {cursor!r}") from e
+    if not isinstance(row_id, int):
+        raise ValueError(f"Invalid page cursor: {cursor!r}")
+    return sort_value, row_id
+
+
+def clamp_page_size(limit, default=DEFAULT_PAGE_SIZE):
+    """Bound a requested page size to 1..MAX_PAGE_SIZE."""
+    if not limit:
+        return default
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def keyset_page(session, query, sort_column, id_column, after=None,
+                before=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """
+    Fetch one page of `query` ordered by (sort_column, id_column).
+
+    Nullable sort columns are paged as two segments, the NULL rows and the
+    rest (SQLite orders NULLs first ascending, last descending), so each
+    segment query still seeks through the (sort key) index.
+
+    :param session: Session used to run the query.
+    :param query: ORM query or Core select (already filtered) selecting
+    the rows.
+    :param sort_column: Column the page is sorted by.
+    :param id_column: Unique tie-breaker column (the primary key).
+    :param after: Cursor of the row before the page (next page).
+    :param before: Cursor of the row after the page (previous page).
+    :param limit: Page size.
+    :param descending: Sort direction.
+    :return: A Page with the rows and the cursors of the neighbour pages
+    (None when there is no such page).
+    """
+    backward = before is not None
+    if backward:
+        position = decode_cursor(before)
+    elif after is not None:
+        position = decode_cursor(after)
+    else:
+        position = None
+
+    # Walking backwards is the same as walking forwards in reverse order
+    reverse = descending != backward
+    if getattr(sort_column, 'nullable', False):
+        segments = [False, True] if reverse else [True, False]
+    else:
+        segments = [None]
+    if position is not None and segments != [None]:
+        # Skip the segments that lie before the cursor
+        segments = segments[segments.index(position[0] is None):]
+
+    rows = []
+    for index, is_null in enumerate(segments):
+        segment = query
+        if is_null is not None:
+            segment = segment.filter(sort_column.is_(None) if is_null
+                                     else sort_column.isnot(None))
+        starts_at_cursor = position is not None and index == 0
+        if is_null:
+            if starts_at_cursor:
+                segment = segment.filter(
+                    id_column < position[1] if reverse
+                    else id_column > position[1])
+            order = [id_column.desc() if reverse else id_column.asc()]
+        else:
+            if starts_at_cursor:
+                key = tuple_(sort_column, id_column)
+                segment = segment.filter(
+                    key < tuple_(*position) if reverse
+                    else key > tuple_(*position))
+            order = ([sort_column.desc(), id_column.desc()] if reverse
+                     else [sort_column.asc(), id_column.asc()])
+        segment = segment.order_by(*order).limit(limit + 1 - len(rows))
+        rows.extend(session.execute(segment).all()
+                    if isinstance(segment, Select) else segment.all())
+        if len(rows) > limit:
+            break
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+
+    def cursor_of(row):
+        return encode_cursor(getattr(row, sort_column.key),
+                             getattr(row, id_column.key))
+
+    if backward:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, position is not None
+    return Page(
+        items=rows,
+        next_cursor=cursor_of(rows[-1]) if rows and has_next else None,
+        prev_cursor=cursor_of(rows[0]) if rows and has_prev else None)
@@ -0,0 +1,247 @@
+"""
+EXPLAIN QUERY PLAN check for the SQLiteDataManager queries.
+
+Every data-manager method is exercised against a scratch database while
+the emitted statements are recorded; each statement is then explained and
+reported if SQLite plans a full table scan for it.
+"""
+import os
+import tempfile
+
+from sqlalchemy import event
+
+from datamanager.pagination import encode_cursor
+from datamanager.sqlite_data_manager import SQLiteDataManager, MOVIE_SORTS
+from models import User, Movie, Review, Director
+
+# Listings and rebuilds that are expected to read the whole table
+FULL_SCAN_ALLOWED = {'get_all_users', 'get_all_directors', 'iter_reviews',
+                     'replace_similarities(all)'}
+
+
+class _StatementRecorder:
+    """Collect the statements executed on a set of engines."""
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.statements = []
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        if statement.lstrip().split(' ', 1)[0].upper() in (
+                'SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH'):
+            if executemany:
+                # The plan is the same for every parameter set
+                parameters = parameters[0]
+            self.statements.append((statement, parameters))
+
+
+def _seed(data_manager):
+    user_id = data_manager.add_user(User(name='Plan', lastname='Check'))
+    director_id = data_manager.add_director(Director(name='Plan Director'))
+    movie_id = data_manager.add_movie(user_id, Movie(
+        imdb_id='tt0000001', title='Plan Movie', director_id=director_id,
+        year='2000', rating=7.5, poster='', plot=''))
+    review_id = data_manager.add_review(Review(
+        user_id=user_id, movie_id=movie_id, review_text='Plan review',
+        rating=8))
+    data_manager.add_movie_genres({movie_id: ['Plan Genre']})
+    return user_id, director_id, movie_id, review_id
+
+
+def _calls(data_manager, user_id, director_id, movie_id, review_id):
+    """Yield (name, zero-argument callable) for every data-manager query."""
+    movie = data_manager.get_movie(movie_id)
+    review = data_manager.get_review(review_id)
+    director = data_manager.get_director(director_id)
+    genre_id = data_manager.get_facets().genres[0].value
+    yield 'get_all_users', data_manager.get_all_users
+    yield 'get_users_page', data_manager.get_users_page
+    yield 'get_users_page(after)', lambda: data_manager.get_users_page(
+        after=encode_cursor('Plan', user_id))
+    yield 'get_user_list_page(after)', \
+        lambda: data_manager.get_user_list_page(
+            after=encode_cursor('Plan', user_id))
+    for sort in MOVIE_SORTS:
+        yield f'get_library_page({sort})', \
+            lambda sort=sort: data_manager.get_library_page(
+                user_id, sort=sort, after=encode_cursor('', 0))
+    yield 'get_library_page(genre)', lambda: data_manager.get_library_page(
+        user_id, genre_id=genre_id, min_year=1990, min_rating=7)
+    for sort in MOVIE_SORTS:
+        yield f'get_user_movies_page({sort})', \
+            lambda sort=sort: data_manager.get_user_movies_page(
+                user_id, sort=sort, after=encode_cursor('', 0))
+    yield 'get_user_movies_page(filtered)', \
+        lambda: data_manager.get_user_movies_page(
+            user_id, sort='year', min_year=1990, max_year=2010,
+            min_rating=7)
+    for sort in ('rating', 'year'):
+        yield f'find_movies({sort})', \
+            lambda sort=sort: data_manager.find_movies(
+                min_year=1990, max_year=2010, min_rating=7, sort=sort,
+                after=encode_cursor(None, 10))
+    yield 'find_movies(genre)', lambda: data_manager.find_movies(
+        genre_id=genre_id, min_rating=7, after=encode_cursor(None, 10))
+    yield 'get_user_movies_page(genre)', \
+        lambda: data_manager.get_user_movies_page(user_id, genre_id=genre_id)
+    yield 'get_facets', data_manager.get_facets
+    yield 'get_facets(filtered)', lambda: data_manager.get_facets(
+        genre_id=genre_id, min_year=1990, max_year=2010, min_rating=7)
+    yield 'get_movies_missing_genres', \
+        lambda: data_manager.get_movies_missing_genres(0, 100)
+    yield 'add_movie_genres', lambda: data_manager.add_movie_genres(
+        {movie_id: ['Plan Genre', 'Plan Other Genre']})
+    yield 'get_users_version', data_manager.get_users_version
+    yield 'get_user_version', lambda: data_manager.get_user_version(user_id)
+    yield 'get_movie_version', \
+        lambda: data_manager.get_movie_version(movie_id)
+    yield 'get_user', lambda: data_manager.get_user(user_id)
+    yield 'get_user_movies', lambda: data_manager.get_user_movies(user_id)
+    yield 'iter_user_movies', \
+        lambda: list(data_manager.iter_user_movies(user_id))
+    yield 'get_movie', lambda: data_manager.get_movie(movie_id)
+    yield 'update_movie', lambda: data_manager.update_movie(movie)
+    yield 'get_library_entry', \
+        lambda: data_manager.get_library_entry(user_id, movie_id)
+    yield 'update_library_entry', lambda: data_manager.update_library_entry(
+        user_id, movie_id, 8.5, 'Plan notes')
+    yield 'add_pending_movie', \
+        lambda: data_manager.add_pending_movie(user_id, 'Plan Pending')
+    yield 'enrich_movie', lambda: data_manager.enrich_movie(movie_id, {
+        'imdb_id': 'tt0000001', 'title': 'Plan Movie',
+        'director': director.name, 'year': '2000', 'rating': '7.0',
+        'genres': ['Drama']})
+    yield 'enrich_movie(merge)', lambda: data_manager.enrich_movie(
+        data_manager.add_pending_movie(user_id, 'Plan Duplicate'), {
+            'imdb_id': 'tt0000001', 'title': 'Plan Movie',
+            'director': director.name, 'year': '2000', 'rating': '7.0',
+            'genres': ['Drama']})
+    yield 'get_movie_ids_by_imdb_id', \
+        lambda: data_manager.get_movie_ids_by_imdb_id(['tt0000001'])
+    yield 'add_movie(catalog)', lambda: data_manager.add_movie(
+        user_id, Movie(title='Plan Movie', director_id=director_id,
+                       year='2000', rating='7.5', poster='', plot=''))
+    yield 'set_enrichment_status', \
+        lambda: data_manager.set_enrichment_status(movie_id, 'done')
+    yield 'get_director', lambda: data_manager.get_director(director_id)
+    yield 'get_director_by_name', \
+        lambda: data_manager.get_director_by_name(director.name)
+    yield 'get_all_directors', data_manager.get_all_directors
+    yield 'get_directors_page', lambda: data_manager.get_directors_page(
+        after=encode_cursor('Plan', director_id))
+    yield 'get_or_create_directors', \
+        lambda: data_manager.get_or_create_directors(
+            [director.name, 'Plan New Director'])
+    yield 'search', lambda: data_manager.search('plan mov')
+    yield 'update_director', lambda: data_manager.update_director(director)
+    yield 'get_review', lambda: data_manager.get_review(review_id)
+    yield 'get_movie_reviews', \
+        lambda: data_manager.get_movie_reviews(movie_id)
+    yield 'get_movie_reviews_page', \
+        lambda: data_manager.get_movie_reviews_page(
+            movie_id, after=encode_cursor(0, 0))
+    yield 'iter_reviews', lambda: list(data_manager.iter_reviews())
+    yield 'update_review', lambda: data_manager.update_review(review)
+    yield 'get_similar_movies', \
+        lambda: data_manager.get_similar_movies(movie_id)
+    yield 'get_similarity_changes', data_manager.get_similarity_changes
+    yield 'get_movies_listing_similar', \
+        lambda: data_manager.get_movies_listing_similar([movie_id])
+    yield 'get_similarities', \
+        lambda: data_manager.get_similarities([movie_id])
+    yield 'replace_similarities', lambda: data_manager.replace_similarities(
+        [(movie_id, movie_id, 0.5)], [movie_id], last_change_id=1)
+    yield 'replace_similarities(all)', \
+        lambda: data_manager.replace_similarities([], last_change_id=1)
+    yield 'remove_user_movie', \
+        lambda: data_manager.remove_user_movie(user_id, movie_id)
+    yield 'add_user_movies', \
+        lambda: data_manager.add_user_movies(user_id, [movie_id])
+    yield 'remove_user_movie(orphan)', lambda: data_manager.remove_user_movie(
+        user_id, data_manager.add_pending_movie(user_id, 'Plan Orphan'))
+    yield 'delete_reviews', lambda: data_manager.delete_reviews(
+        [data_manager.add_review(Review(
+            user_id=user_id, movie_id=movie_id, review_text='Plan review',
+            rating=4))])
+    yield 'delete_review', lambda: data_manager.delete_review(review_id)
+    yield 'delete_movies', lambda: data_manager.delete_movies(
+        [data_manager.add_pending_movie(user_id, 'Plan Deleted')])
+    yield 'delete_movie', lambda: data_manager.delete_movie(movie_id)
+    import_id = data_manager.add_library_import(user_id, 1)
+    yield 'update_library_import', \
+        lambda: data_manager.update_library_import(
+            import_id, status='done', done=1, failures=[])
+    yield 'get_library_import', \
+        lambda: data_manager.get_library_import(import_id)
+    yield 'delete_user', lambda: data_manager.delete_user(user_id)
+
+
+def _scans(connection, statement, parameters):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        details = [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+    # Scans of materialized subqueries only read their (bounded) result
+    subqueries = {detail.split(' ', 1)[1] for detail in details
+                  if detail.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+
+    def is_table_scan(detail):
+        # "SCAN t USING INDEX ..." walks an index in order (paged queries
+        # stop after LIMIT rows); only a bare "SCAN t" reads the table.
+        if not detail.startswith('SCAN ') or 'USING' in detail:
+            return False
+        if 'CONSTANT ROW' in detail or 'VIRTUAL TABLE' in detail:
+            return False
+        return detail.split(' ')[1] not in subqueries
+
+    return [detail for detail in details if is_table_scan(detail)]
+
+
+def check_query_plans(data_manager_factory=None):
+    """
+    Explain every data-manager query and collect the ones that scan.
+
+    :param data_manager_factory: Callable taking a database path and
+    returning a data manager; defaults to SQLiteDataManager.
+    :return: A list of (method name, statement, scan details) tuples,
+    empty when every query is answered from an index.
+    """
+    if data_manager_factory is None:
+        data_manager_factory = SQLiteDataManager
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_manager = data_manager_factory(
+            os.path.join(tmp_dir, 'query_plans.db'))
+        try:
+            ids = _seed(data_manager)
+            problems = []
+            for name, call in _calls(data_manager, *ids):
+                with _StatementRecorder([data_manager.engine,
+                                         data_manager.read_engine]) as rec:
+                    call()
+                if name in FULL_SCAN_ALLOWED:
+                    continue
+                raw = data_manager.engine.raw_connection()
+                try:
+                    for statement, parameters in rec.statements:
+                        scans = _scans(raw, statement, parameters)
+                        if scans:
+                            problems.append((name, statement, scans))
+                finally:
+                    raw.close()
+            return problems
+        finally:
+            data_manager.dispose()
@@ -1,7 +1,129 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, joinedload
-from models import User, Movie, Base, Review, Director
+import json
+import logging
+import re
+import threading
+from collections import defaultdict, namedtuple, OrderedDict
+
+from markupsafe import Markup, escape
+from sqlalchemy import Select, insert, select, text, update, delete, case, \
+    func, literal, null, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, joinedload, with_expression
+from models import User, Movie, Review, Director, Genre, LibraryImport, \
+    movie_genre_table, movie_similarity_table, similarity_change_table, \
+    user_movie_table
 from datamanager.data_manager_interface import DataManagerInterface
+from datamanager.sqlite_engine import create_sqlite_engines
+from datamanager.migrations import upgrade, REBUILD_RATING_AGGREGATES
+from datamanager.pagination import keyset_page, clamp_page_size
+from datamanager.normalize import normalized_columns, name_key
+
+logger = logging.getLogger(__name__)
+
+SearchResult = namedtuple('SearchResult', [
+    'movie_id', 'title', 'year', 'poster', 'director',
+    'snippet', 'rank'])
+
+# Validator of a page: a version that changes with every write affecting
+# it and the time of the last such write
+PageVersion = namedtuple('PageVersion', ['version', 'updated_at'])
+
+# Movie counts of the browse page (see SQLiteDataManager.get_facets)
+Facets = namedtuple('Facets', ['total', 'genres', 'decades', 'ratings'])
+FacetCount = namedtuple('FacetCount', ['value', 'label', 'count'])
+
+_SNIPPET_START, _SNIPPET_END = '\x02', '\x03'
+
+# Sort options of the movie listings: name -> (column, descending);
+# 'added' is the order of a user's library (read into Movie.added_order)
+MOVIE_SORTS = {
+    'title': (Movie.title, False),
+    'year': (Movie.year_start, True),
+    'rating': (Movie.imdb_rating, True),
+    'added': (user_movie_table.c.id.label('added_order'), True),
+    'community': (Movie.avg_rating, True),
+}
+
+# Columns of the NDJSON exports (and of the JSON API), by field name
+MOVIE_COLUMNS = {
+    'id': Movie.id,
+    'imdb_id': Movie.imdb_id,
+    'title': Movie.title,
+    'director_id': Movie.director_id,
+    'director': Director.name,
+    'year': Movie.year,
+    'rating': Movie.rating,
+    'year_start': Movie.year_start,
+    'year_end': Movie.year_end,
+    'imdb_rating': Movie.imdb_rating,
+    'poster': Movie.poster,
+    'poster_hash': Movie.poster_hash,
+    'plot': Movie.plot,
+    'review_count': Movie.review_count,
+    'avg_rating': Movie.avg_rating,
+    'enrichment_status': Movie.enrichment_status,
+    'version': Movie.version,
+    'updated_at': Movie.updated_at,
+}
+REVIEW_COLUMNS = {
+    'id': Review.id,
+    'user_id': Review.user_id,
+    'movie_id': Review.movie_id,
+    'review_text': Review.review_text,
+    'rating': Review.rating,
+    'version': Review.version,
+    'updated_at': Review.updated_at,
+}
+
+# Read models of the HTML list pages: plain tuples of exactly the columns
+# their templates show, read with Core selects, so no ORM instance (and no
+# lazy relationship a template could trip over once the session closed)
+# is built per row. The sort keys of the pages are included for their
+# cursors.
+UserRow = namedtuple('UserRow', ['id', 'name', 'lastname'])
+LibraryMovie = namedtuple('LibraryMovie', [
+    'id', 'title', 'year', 'rating', 'director', 'poster', 'poster_hash',
+    'enrichment_status', 'review_count', 'avg_rating', 'year_start',
+    'imdb_rating', 'added_order', 'user_rating', 'notes'])
+ReviewRow = namedtuple('ReviewRow', ['id', 'review_text', 'rating'])
+
+# Progress of a library import, with its failures decoded
+ImportRow = namedtuple('ImportRow', [
+    'id', 'user_id', 'status', 'total', 'done', 'imported', 'failures',
+    'updated_at'])
+
+
+def _select_fields(read_model, columns):
+    """Select the fields of a read model from a name -> column mapping."""
+    return select(*[columns[name].label(name) for name in read_model._fields])
+
+
+class _IdCache:
+    """Bounded, thread-safe LRU mapping of lookup keys to row IDs."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row_id = self._entries.get(key)
+            if row_id is not None:
+                self._entries.move_to_end(key)
+            return row_id
+
+    def set(self, key, row_id):
+        with self._lock:
+            self._entries[key] = row_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
 
 
 class SQLiteDataManager(DataManagerInterface):
@@ -10,27 +132,190 @@ class SQLiteDataManager(DataManagerInterface):
     that uses SQLAlchemy to manage CRUD operations with a SQLite database.
     """
 
-    def __init__(self, db_file_name):
+    def __init__(self, db_file_name, director_cache_size=4096,
+                 **engine_options):
         """
         Initialize the SQLiteDataManager with the specified
         SQLite database file.
 
+        The schema is brought up to date by the versioned migrations in
+        datamanager.migrations. Writes go through a pooled read-write
+        engine, lookups through a separate read-only engine so GET routes
+        never take the write lock.
+
         :param db_file_name: Name of the SQLite database file.
+        :param director_cache_size: Entries of the in-process director
+        name -> ID cache in front of get_or_create_director.
+        :param engine_options: Pool and pragma settings passed on to
+        create_sqlite_engines (pool_size, busy_timeout, ...).
+        """
+        self.engine, self.read_engine = create_sqlite_engines(
+            db_file_name, **engine_options)
+        self.schema_version = upgrade(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.ReadSession = sessionmaker(bind=self.read_engine)
+        self._invalidation_listeners = []
+        self._director_ids = _IdCache(director_cache_size)
+
+    def add_invalidation_listener(self, listener):
+        """
+        Register a callable notified after every committed write.
+
+        The listener receives the set of cache tags the write touched:
+        "users" (the user list), "user:<id>" (a user's library page),
+        "movie:<id>" (a movie's page, and the library pages listing the
+        movie), "ratings" (any page ordered by community rating),
+        "directors" (any page showing director names) or "*"
+        (everything).
         """
-        engine = create_engine(f'sqlite:///{db_file_name}')
-        Base.metadata.create_all(engine)
-        self.Session = sessionmaker(bind=engine)
+        self._invalidation_listeners.append(listener)
+
+    def _invalidate(self, *tags):
+        for listener in self._invalidation_listeners:
+            listener(set(tags))
+
+    @staticmethod
+    def _touch(session, model, ids):
+        """
+        Bump the version/updated_at of rows whose page shows data that
+        lives in other rows (a user's library, a movie's director), in
+        the caller's transaction.
+        """
+        ids = list(ids)
+        if ids:
+            session.execute(update(model).where(model.id.in_(ids)).values(
+                version=model.version + 1))
+
+    @staticmethod
+    def _touch_libraries(session, movie_ids):
+        """
+        Bump the users whose library holds one of `movie_ids` (IDs or a
+        SELECT of them), in the caller's transaction.
+
+        :return: The IDs of those users.
+        """
+        links = user_movie_table.c
+        if not isinstance(movie_ids, Select):
+            movie_ids = list(movie_ids)
+            if not movie_ids:
+                return []
+        return session.scalars(
+            update(User).where(User.id.in_(
+                select(links.user_id).where(links.movie_id.in_(movie_ids))))
+            .values(version=User.version + 1).returning(User.id)).all()
+
+    def get_users_version(self):
+        """
+        Return the validator of the user list: the number of users and
+        the latest change to any of them.
+
+        :return: A PageVersion.
+        """
+        session = self.ReadSession()
+        try:
+            count, updated_at = session.execute(select(
+                select(func.count()).select_from(User).scalar_subquery(),
+                select(func.max(User.updated_at)).scalar_subquery())).one()
+            return PageVersion(count, updated_at)
+        finally:
+            session.close()
+
+    def get_user_version(self, user_id):
+        """
+        Return the validator of a user's library page: the user's row
+        version folded with the versions of the movies in the library,
+        whose community ratings the page shows. Reviews therefore only
+        bump the reviewed movie, however many libraries hold it.
+
+        :return: A PageVersion, or None if the user does not exist.
+        """
+        links = user_movie_table.c
+
+        def over_library(aggregate):
+            return select(aggregate).join(
+                user_movie_table, links.movie_id == Movie.id).where(
+                links.user_id == user_id).scalar_subquery()
+
+        session = self.ReadSession()
+        try:
+            row = session.execute(select(
+                User.version, User.updated_at,
+                over_library(func.coalesce(func.sum(Movie.version), 0)),
+                over_library(func.max(Movie.updated_at))).where(
+                User.id == user_id)).first()
+        finally:
+            session.close()
+        if row is None:
+            return None
+        version, updated_at, movie_versions, movies_updated_at = row
+        return PageVersion(f'{version}.{movie_versions}',
+                           max(filter(None, (updated_at, movies_updated_at))))
+
+    def get_movie_version(self, movie_id):
+        """
+        Return the validator of a movie's page (details and reviews).
+
+        :return: A PageVersion, or None if the movie does not exist.
+        """
+        return self._row_version(Movie, movie_id)
+
+    def _row_version(self, model, row_id):
+        session = self.ReadSession()
+        try:
+            row = session.execute(select(model.version, model.updated_at)
+                                  .where(model.id == row_id)).first()
+            return PageVersion(*row) if row else None
+        finally:
+            session.close()
 
     def get_all_users(self):
         """
         Retrieve all users from the database.
 
-        :return: A list of User objects.
+        :return: A list of UserRow tuples.
         """
-        session = self.Session()
-        users = session.query(User).all()
-        session.close()
-        return users
+        session = self.ReadSession()
+        try:
+            return [UserRow._make(row) for row in session.execute(
+                _select_fields(UserRow, User.__table__.c))]
+        finally:
+            session.close()
+
+    def get_users_page(self, after=None, before=None, limit=None):
+        """
+        Retrieve one page of users ordered by name.
+
+        :param after: Cursor of the last user of the previous page.
+        :param before: Cursor of the first user of the following page.
+        :param limit: Page size (capped at MAX_PAGE_SIZE).
+        :return: A Page of User objects with next/prev cursors.
+        """
+        session = self.ReadSession()
+        try:
+            return keyset_page(session, session.query(User), User.name,
+                               User.id, after=after, before=before,
+                               limit=clamp_page_size(limit, default=50))
+        finally:
+            session.close()
+
+    def get_user_list_page(self, after=None, before=None, limit=None):
+        """
+        Retrieve one page of the user list ordered by name, as read
+        models (see get_users_page for User objects).
+
+        :return: A Page of UserRow tuples with next/prev cursors.
+        """
+        session = self.ReadSession()
+        try:
+            page = keyset_page(session,
+                               _select_fields(UserRow, User.__table__.c),
+                               User.name, User.id, after=after,
+                               before=before,
+                               limit=clamp_page_size(limit, default=50))
+        finally:
+            session.close()
+        return page._replace(items=[UserRow._make(row)
+                                    for row in page.items])
 
     def get_user(self, user_id):
         """
@@ -39,33 +324,277 @@ class SQLiteDataManager(DataManagerInterface):
         :param user_id: ID of the user to retrieve.
         :return: User object or None if not found.
         """
-        session = self.Session()
+        session = self.ReadSession()
         user = session.query(User).filter_by(id=user_id).first()
         session.close()
         return user
 
     def get_user_movies(self, user_id):
         """
-        Retrieve all movies associated with a specific user with eager
-        loading for related Director objects.
+        Retrieve all movies in a user's library, in the order they were
+        added.
 
         :param user_id: ID of the user whose movies are to be retrieved.
-        :return: A list of Movie objects with their associated Director
-        objects.
+        :return: A list of LibraryMovie tuples.
         """
-        session = self.Session()
+        session = self.ReadSession()
         try:
-            user = session.query(User).filter_by(id=user_id).first()
-            if user:
-                # Eager load the related Director objects helped with error
-                movies = session.query(Movie).options(
-                    joinedload(Movie.director)).filter_by(
-                    user_id=user_id).all()
-            else:
-                movies = []
+            return [LibraryMovie._make(row) for row in session.execute(
+                self._library_rows(user_id).order_by(
+                    user_movie_table.c.id))]
+        finally:
+            session.close()
+
+    @staticmethod
+    def _library(session, user_id):
+        """
+        Query of the catalog movies in a user's library, with their
+        directors and their added_order loaded.
+        """
+        links = user_movie_table.c
+        return session.query(Movie).join(
+            user_movie_table, links.movie_id == Movie.id).filter(
+            links.user_id == user_id).options(
+            joinedload(Movie.director),
+            with_expression(Movie.added_order, links.id))
+
+    @staticmethod
+    def _library_rows(user_id):
+        """
+        Core select of the LibraryMovie rows of a user's library (see
+        _library for the ORM query).
+        """
+        links = user_movie_table.c
+        return _select_fields(
+            LibraryMovie, {**MOVIE_COLUMNS, 'added_order': links.id,
+                           'user_rating': links.user_rating,
+                           'notes': links.notes}
+        ).select_from(user_movie_table).join(
+            Movie, Movie.id == links.movie_id).outerjoin(
+            Director, Director.id == Movie.director_id).where(
+            links.user_id == user_id)
+
+    @staticmethod
+    def _movie_conditions(genre_id=None, min_year=None, max_year=None,
+                          min_rating=None):
+        """Return the WHERE conditions of the movie listing filters."""
+        conditions = []
+        if genre_id is not None:
+            conditions.append(Movie.id.in_(
+                select(movie_genre_table.c.movie_id).where(
+                    movie_genre_table.c.genre_id == genre_id)))
+        if min_year is not None:
+            conditions.append(Movie.year_start >= min_year)
+        if max_year is not None:
+            conditions.append(Movie.year_start <= max_year)
+        if min_rating is not None:
+            conditions.append(Movie.imdb_rating >= min_rating)
+        return conditions
+
+    def _filter_movies(self, query, min_year=None, max_year=None,
+                       min_rating=None, genre_id=None):
+        """Apply genre / year range / minimum IMDb rating filters to a
+        query or select."""
+        return query.filter(*self._movie_conditions(
+            genre_id, min_year, max_year, min_rating))
+
+    def get_user_movies_page(self, user_id, sort='title', after=None,
+                             before=None, limit=None, min_year=None,
+                             max_year=None, min_rating=None, genre_id=None):
+        """
+        Retrieve one page of a user's movies with their directors loaded.
+
+        :param user_id: ID of the user whose movies are to be retrieved.
+        :param sort: One of MOVIE_SORTS (title, year, rating, added, ...).
+        :param after: Cursor of the last movie of the previous page.
+        :param before: Cursor of the first movie of the following page.
+        :param limit: Page size (capped at MAX_PAGE_SIZE).
+        :param min_year: Only movies first released in or after this year.
+        :param max_year: Only movies first released in or before this year.
+        :param min_rating: Only movies with at least this IMDb rating.
+        :param genre_id: Only movies linked to this genre.
+        :return: A Page of Movie objects with next/prev cursors.
+        """
+        if sort not in MOVIE_SORTS:
+            raise ValueError(f"Unknown sort order: {sort}")
+        sort_column, descending = MOVIE_SORTS[sort]
+
+        session = self.ReadSession()
+        try:
+            query = self._filter_movies(self._library(session, user_id),
+                                        min_year, max_year, min_rating,
+                                        genre_id)
+            return keyset_page(session, query, sort_column, Movie.id,
+                               after=after, before=before,
+                               limit=clamp_page_size(limit),
+                               descending=descending)
+        finally:
+            session.close()
+
+    def get_library_page(self, user_id, sort='title', after=None,
+                         before=None, limit=None, min_year=None,
+                         max_year=None, min_rating=None, genre_id=None):
+        """
+        Retrieve one page of a user's movies as read models, with the same
+        sorts and filters as get_user_movies_page.
+
+        :return: A Page of LibraryMovie tuples with next/prev cursors.
+        """
+        if sort not in MOVIE_SORTS:
+            raise ValueError(f"Unknown sort order: {sort}")
+        sort_column, descending = MOVIE_SORTS[sort]
+
+        session = self.ReadSession()
+        try:
+            statement = self._filter_movies(self._library_rows(user_id),
+                                            min_year, max_year, min_rating,
+                                            genre_id)
+            page = keyset_page(session, statement, sort_column, Movie.id,
+                               after=after, before=before,
+                               limit=clamp_page_size(limit),
+                               descending=descending)
+        finally:
+            session.close()
+        return page._replace(items=[LibraryMovie._make(row)
+                                    for row in page.items])
+
+    def iter_user_movies(self, user_id, fields=None, batch_size=1000):
+        """
+        Stream a user's whole library, in movie ID order, without loading
+        it all; the director is only joined when its name is selected.
+
+        :param user_id: ID of the user whose movies are exported.
+        :param fields: MOVIE_COLUMNS names to select (default: all).
+        :param batch_size: Rows fetched from SQLite at a time.
+        :return: A generator of Row objects with the selected fields.
+        """
+        fields = list(fields or MOVIE_COLUMNS)
+        links = user_movie_table.c
+        statement = select(*[MOVIE_COLUMNS[name].label(name)
+                             for name in fields]).select_from(
+            user_movie_table).join(Movie, Movie.id == links.movie_id)
+        if 'director' in fields:
+            statement = statement.outerjoin(
+                Director, Director.id == Movie.director_id)
+        return self._stream(statement.where(
+            links.user_id == user_id).order_by(links.movie_id), batch_size)
+
+    def _stream(self, statement, batch_size):
+        """
+        Yield the rows of `statement` `batch_size` at a time from one read
+        session, which stays open until the generator is exhausted or
+        closed.
+        """
+        session = self.ReadSession()
+        try:
+            result = session.execute(
+                statement.execution_options(yield_per=batch_size))
+            for partition in result.partitions():
+                yield from partition
+        finally:
+            session.close()
+
+    def find_movies(self, min_year=None, max_year=None, min_rating=None,
+                    sort='rating', after=None, before=None, limit=None,
+                    genre_id=None):
+        """
+        Retrieve one page of catalog movies within a year range, above a
+        minimum IMDb rating and/or of a genre.
+
+        The filters are answered from the year_start / imdb_rating
+        indexes; sort by 'year' when filtering mainly on years and by
+        'rating' when filtering mainly on ratings.
+
+        :param sort: 'rating' (best first) or 'year' (newest first).
+        :param genre_id: Only movies linked to this genre.
+        :return: A Page of Movie objects with next/prev cursors.
+        """
+        if sort not in ('rating', 'year'):
+            raise ValueError(f"Unknown sort order: {sort}")
+        sort_column, descending = MOVIE_SORTS[sort]
+
+        session = self.ReadSession()
+        try:
+            query = self._filter_movies(
+                session.query(Movie).options(joinedload(Movie.director)),
+                min_year, max_year, min_rating, genre_id)
+            return keyset_page(session, query, sort_column, Movie.id,
+                               after=after, before=before,
+                               limit=clamp_page_size(limit),
+                               descending=descending)
+        finally:
+            session.close()
+
+    def get_facets(self, genre_id=None, min_year=None, max_year=None,
+                   min_rating=None):
+        """
+        Count the catalog movies per genre, decade and IMDb rating
+        band for the faceted browse page, in one statement (a UNION ALL
+        of one GROUP BY per facet).
+
+        Each facet is counted with the other facets' filters applied but
+        not its own, so its counts show what choosing another value of it
+        would give.
+
+        :return: Facets with the total matching all filters and, per
+        facet, a list of FacetCount(value, label, count): genres (value
+        genre ID, label name) by count, decades (value first year) and
+        rating bands (value the whole-number lower bound) in descending
+        order.
+        """
+        links = movie_genre_table.c
+        genre_counts = select(links.genre_id.label('value'),
+                              func.count().label('count'))
+        rest = self._movie_conditions(None, min_year, max_year, min_rating)
+        if rest:
+            genre_counts = genre_counts.join(
+                Movie, Movie.id == links.movie_id).where(*rest)
+        genre_counts = genre_counts.group_by(links.genre_id).subquery()
+
+        # Grouped on the bare indexed columns (no temporary b-tree), then
+        # rolled up into decades and bands here
+        statement = union_all(
+            select(literal('genre').label('facet'), genre_counts.c.value,
+                   Genre.name.label('label'), genre_counts.c.count).join(
+                Genre, Genre.id == genre_counts.c.value),
+            select(literal('decade'), Movie.year_start, null(),
+                   func.count()).where(
+                Movie.year_start.isnot(None),
+                *self._movie_conditions(genre_id, None, None, min_rating)
+            ).group_by(Movie.year_start),
+            select(literal('rating'), Movie.imdb_rating, null(),
+                   func.count()).where(
+                Movie.imdb_rating.isnot(None),
+                *self._movie_conditions(genre_id, min_year, max_year, None)
+            ).group_by(Movie.imdb_rating),
+            select(literal('total'), null(), null(), func.count()).where(
+                *self._movie_conditions(genre_id, min_year, max_year,
+                                        min_rating)))
+
+        session = self.ReadSession()
+        try:
+            rows = session.execute(statement).all()
         finally:
             session.close()
-        return movies
+
+        total, genres = 0, []
+        decades, bands = defaultdict(int), defaultdict(int)
+        for facet, value, label, count in rows:
+            if facet == 'genre':
+                genres.append(FacetCount(value, label, count))
+            elif facet == 'decade':
+                decades[value // 10 * 10] += count
+            elif facet == 'rating':
+                bands[int(value)] += count
+            else:
+                total = count
+        return Facets(
+            total=total,
+            genres=sorted(genres, key=lambda facet: -facet.count),
+            decades=[FacetCount(decade, None, count) for decade, count
+                     in sorted(decades.items(), reverse=True)],
+            ratings=[FacetCount(band, None, count) for band, count
+                     in sorted(bands.items(), reverse=True)])
 
     def add_user(self, user):
         """
@@ -80,9 +609,57 @@ class SQLiteDataManager(DataManagerInterface):
         session.commit()
         new_user_id = new_user.id
         session.close()
+        self._invalidate('users')
         return new_user_id
 
+    def delete_user(self, user_id, chunk_size=500):
+        """
+        Delete a user with their reviews and library in a few set-based
+        statements, however large the library. Movies only they had and
+        nobody reviewed are deleted too (as by remove_user_movie),
+        `chunk_size` per statement.
+
+        :return: False if the user did not exist.
+        """
+        links = user_movie_table.c
+        others = user_movie_table.alias('others')
+        session = self.Session()
+        try:
+            if session.scalar(select(User.id).where(
+                    User.id == user_id)) is None:
+                return False
+            _, tags = self._delete_reviews(session,
+                                           Review.user_id == user_id)
+            orphans = session.scalars(select(links.movie_id).join(
+                Movie, Movie.id == links.movie_id).where(
+                links.user_id == user_id, Movie.review_count == 0,
+                ~select(others.c.id).where(
+                    others.c.movie_id == links.movie_id,
+                    others.c.user_id != user_id).exists())).all()
+            for start in range(0, len(orphans), chunk_size):
+                tags += self._delete_movies(
+                    session, orphans[start:start + chunk_size])
+            # The rest of the library goes with the user (ON DELETE
+            # CASCADE)
+            session.execute(delete(User).where(User.id == user_id))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self._invalidate('users', f'user:{user_id}', *tags)
+        return True
+
     def add_movie(self, user_id, movie):
+        """
+        Add a movie to a user's library. A movie the catalog already has
+        (see _find_catalog_movies) is linked instead of copied.
+
+        :param user_id: ID of the user the movie is added to.
+        :param movie: Movie object with the details and director_id.
+        :return: The ID of the catalog movie, or None on failure.
+        """
         session = self.Session()
         try:
             # Check if the user exists
@@ -96,33 +673,362 @@ class SQLiteDataManager(DataManagerInterface):
             if not director_id:
                 raise ValueError("Director information is missing")
 
-            # Create new movie
-            new_movie = Movie(
-                title=movie.title,
-                director_id=director_id,
-                year=movie.year,
-                rating=movie.rating,
-                user_id=user_id,
-                poster=movie.poster,
-                plot=movie.plot
-            )
-            session.add(new_movie)
+            movie_id = self._find_catalog_movies(session, [{
+                'imdb_id': movie.imdb_id, 'title': movie.title,
+                'year': movie.year, 'director_id': director_id}])[0]
+            if movie_id is None:
+                # Create new movie
+                new_movie = Movie(
+                    imdb_id=movie.imdb_id,
+                    title=movie.title,
+                    director_id=director_id,
+                    year=movie.year,
+                    rating=movie.rating,
+                    poster=movie.poster,
+                    plot=movie.plot,
+                    **normalized_columns(movie.year, movie.rating)
+                )
+                session.add(new_movie)
+                session.flush()
+                movie_id = new_movie.id
+            self._add_to_library(session, user_id, [movie_id])
+            self._touch(session, User, [user_id])
             session.commit()
-            return new_movie.id
+            self._invalidate(f'user:{user_id}')
+            return movie_id
         except ValueError as ve:
-            print(f"ValueError: {ve}")
+            logger.warning("Could not add movie: %s", ve)
             session.rollback()
             return None
         except Exception as e:
-            print(f"Error adding movie: {e}")
+            logger.exception("Error adding movie: %s", e)
             session.rollback()
             return None
         finally:
             session.close()
 
+    @staticmethod
+    def _add_to_library(session, user_id, movie_ids):
+        """
+        Link catalog movies to a user's library in the caller's
+        transaction; movies already in it are skipped.
+
+        :return: The number of movies added.
+        """
+        rows = [{'user_id': user_id, 'movie_id': movie_id}
+                for movie_id in dict.fromkeys(movie_ids)]
+        if not rows:
+            return 0
+        return session.execute(
+            sqlite_insert(user_movie_table).on_conflict_do_nothing(),
+            rows).rowcount
+
+    @staticmethod
+    def _find_catalog_movies(session, movies, chunk_size=500):
+        """
+        Match movie details against the catalog: on the imdbID, and for
+        movies stored before imdbIDs were, on the title, year and
+        director. Such a movie gets the imdbID it matched with.
+
+        :param movies: List of dicts with the keys imdb_id (may be None),
+        title, year and director_id.
+        :return: A list with the catalog movie ID of each dict, or None
+        where the catalog does not have it.
+        """
+        imdb_ids = list({movie['imdb_id'] for movie in movies
+                         if movie.get('imdb_id')})
+        by_imdb_id = {}
+        for start in range(0, len(imdb_ids), chunk_size):
+            by_imdb_id.update(session.execute(
+                select(Movie.imdb_id, Movie.id).where(Movie.imdb_id.in_(
+                    imdb_ids[start:start + chunk_size]))).all())
+
+        titles = list({movie['title'] for movie in movies
+                       if movie.get('imdb_id') not in by_imdb_id})
+        legacy = {}
+        for start in range(0, len(titles), chunk_size):
+            for movie_id, title, year, director_id in session.execute(
+                    select(Movie.id, Movie.title, Movie.year,
+                           Movie.director_id).where(
+                        Movie.title.in_(titles[start:start + chunk_size]),
+                        Movie.imdb_id.is_(None),
+                        Movie.enrichment_status == 'done')
+                    .order_by(Movie.id)):
+                legacy.setdefault((title, year, director_id), movie_id)
+
+        found = []
+        for movie in movies:
+            imdb_id = movie.get('imdb_id')
+            movie_id = by_imdb_id.get(imdb_id)
+            if movie_id is None:
+                movie_id = legacy.pop((movie['title'], movie['year'],
+                                       movie['director_id']), None)
+                if movie_id is not None and imdb_id:
+                    session.execute(update(Movie).where(
+                        Movie.id == movie_id).values(imdb_id=imdb_id))
+                    by_imdb_id[imdb_id] = movie_id
+            found.append(movie_id)
+        return found
+
+    def get_movie_ids_by_imdb_id(self, imdb_ids, chunk_size=500):
+        """
+        Look up catalog movies by imdbID.
+
+        :return: A dict of imdbID -> movie ID for the IDs the catalog has.
+        """
+        imdb_ids = list(dict.fromkeys(imdb_ids))
+        found = {}
+        session = self.ReadSession()
+        try:
+            for start in range(0, len(imdb_ids), chunk_size):
+                found.update(session.execute(
+                    select(Movie.imdb_id, Movie.id).where(Movie.imdb_id.in_(
+                        imdb_ids[start:start + chunk_size]))).all())
+            return found
+        finally:
+            session.close()
+
+    def add_user_movies(self, user_id, movie_ids):
+        """
+        Add catalog movies to a user's library, skipping those already in
+        it.
+
+        :param user_id: ID of the user the movies are added to.
+        :param movie_ids: IDs of catalog movies.
+        :return: The number of movies added.
+        """
+        session = self.Session()
+        try:
+            if session.get(User, user_id) is None:
+                raise ValueError("User not found")
+            added = self._add_to_library(session, user_id, movie_ids)
+            if added:
+                self._touch(session, User, [user_id])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if added:
+            self._invalidate(f'user:{user_id}')
+        return added
+
+    def remove_user_movie(self, user_id, movie_id):
+        """
+        Take a movie out of a user's library. The catalog movie stays for
+        the other users and its reviews; one that nobody holds or
+        reviewed any more (e.g. a mistyped title) is deleted.
+
+        :return: False if the movie was not in the user's library.
+        """
+        links = user_movie_table.c
+        session = self.Session()
+        try:
+            removed = session.execute(delete(user_movie_table).where(
+                links.user_id == user_id,
+                links.movie_id == movie_id)).rowcount
+            if not removed:
+                session.rollback()
+                return False
+            self._touch(session, User, [user_id])
+            tags = [f'user:{user_id}']
+            tags += self._delete_movies(session, select(Movie.id).where(
+                Movie.id == movie_id, Movie.review_count == 0,
+                ~select(links.id).where(links.movie_id == movie_id).exists()))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self._invalidate(*tags)
+        return True
+
+    def get_library_entry(self, user_id, movie_id):
+        """
+        Retrieve a movie of a user's library with the user's own fields.
+
+        :return: A LibraryMovie tuple, or None if the movie is not in the
+        user's library.
+        """
+        session = self.ReadSession()
+        try:
+            row = session.execute(self._library_rows(user_id).where(
+                user_movie_table.c.movie_id == movie_id)).first()
+            return LibraryMovie._make(row) if row else None
+        finally:
+            session.close()
+
+    def update_library_entry(self, user_id, movie_id, user_rating=None,
+                             notes=None):
+        """
+        Set the user's own rating and notes of a movie in their library.
+        The catalog movie, shared with the other libraries, is unchanged.
+
+        :param user_rating: Rating from 0 to 10, or None to clear it.
+        :param notes: Free text, or None to clear it.
+        :return: False if the movie is not in the user's library.
+        """
+        links = user_movie_table.c
+        session = self.Session()
+        try:
+            updated = session.execute(update(user_movie_table).where(
+                links.user_id == user_id,
+                links.movie_id == movie_id).values(
+                user_rating=user_rating, notes=notes)).rowcount
+            if not updated:
+                session.rollback()
+                return False
+            self._touch(session, User, [user_id])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self._invalidate(f'user:{user_id}')
+        return True
+
+    def add_pending_movie(self, user_id, title):
+        """
+        Add a placeholder movie with only its title to a user's library,
+        to be completed by enrich_movie once its OMDb details are known.
+
+        :param user_id: ID of the user the movie is added to.
+        :param title: Title as entered by the user.
+        :return: The ID of the new movie, or None if the user does not
+        exist.
+        """
+        session = self.Session()
+        try:
+            if session.get(User, user_id) is None:
+                logger.warning("Could not add movie: user %s not found",
+                               user_id)
+                return None
+            movie_id = session.scalar(insert(Movie).values(
+                title=title, enrichment_status='pending').returning(
+                Movie.id))
+            self._add_to_library(session, user_id, [movie_id])
+            self._touch(session, User, [user_id])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self._invalidate(f'user:{user_id}')
+        return movie_id
+
+    def enrich_movie(self, movie_id, details):
+        """
+        Fill in the OMDb details of a placeholder movie and mark it done.
+
+        When the catalog already has the movie (by imdbID, see
+        _find_catalog_movies) the placeholder is merged into it instead.
+
+        :param movie_id: ID of the movie added by add_pending_movie.
+        :param details: Dict with the keys imdb_id, title, director,
+        year, rating, poster, plot and genres (see
+        static.library_import.movie_details).
+        :return: The ID of the catalog movie holding the details, or None
+        if the placeholder was deleted in the meantime.
+        """
+        # Resolved before this session takes the write lock
+        director_id = self.get_or_create_director(details['director'])
+        session = self.Session()
+        try:
+            if session.get(Movie, movie_id) is None:
+                return None
+            tags = [f'movie:{movie_id}']
+            catalog_id = self._find_catalog_movies(session, [{
+                'imdb_id': details.get('imdb_id'),
+                'title': details['title'], 'year': details['year'],
+                'director_id': director_id}])[0]
+            if catalog_id is not None and catalog_id != movie_id:
+                tags += self._merge_movie(session, movie_id, catalog_id)
+                movie_id = catalog_id
+            else:
+                session.execute(update(Movie).where(
+                    Movie.id == movie_id).values(
+                    imdb_id=details.get('imdb_id'), title=details['title'],
+                    director_id=director_id, year=details['year'],
+                    rating=details['rating'], poster=details.get('poster'),
+                    plot=details.get('plot'), enrichment_status='done',
+                    **normalized_columns(details['year'],
+                                         details['rating'])))
+            genre_ids = self._resolve_names(
+                session, Genre, dict.fromkeys(details.get('genres') or ()))
+            if genre_ids:
+                session.execute(
+                    sqlite_insert(movie_genre_table).on_conflict_do_nothing(),
+                    [{'movie_id': movie_id, 'genre_id': genre_id}
+                     for genre_id in genre_ids.values()])
+            holders = self._touch_libraries(session, [movie_id])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self._invalidate(f'movie:{movie_id}', *tags,
+                         *[f'user:{user_id}' for user_id in holders])
+        return movie_id
+
+    def _merge_movie(self, session, duplicate_id, movie_id):
+        """
+        Fold a duplicate catalog movie into `movie_id` in the caller's
+        transaction: its library entries, reviews and genre links move
+        over and it is deleted.
+
+        :return: The cache tags of the pages showing the duplicate.
+        """
+        links = user_movie_table.c
+        session.execute(update(user_movie_table).prefix_with('OR IGNORE')
+                        .where(links.movie_id == duplicate_id)
+                        .values(movie_id=movie_id))
+        session.execute(insert(movie_genre_table).prefix_with('OR IGNORE')
+                        .from_select(['movie_id', 'genre_id'], select(
+                            literal(movie_id),
+                            movie_genre_table.c.genre_id).where(
+                            movie_genre_table.c.movie_id == duplicate_id)))
+
+        count, rating_sum = session.execute(
+            select(func.count(), func.coalesce(func.sum(Review.rating), 0))
+            .where(Review.movie_id == duplicate_id)).one()
+        if count:
+            session.execute(update(Review).where(
+                Review.movie_id == duplicate_id).values(movie_id=movie_id))
+            self._apply_rating_delta(session, Movie, movie_id, count,
+                                     rating_sum)
+            self._log_rating_changes(session, [movie_id])
+        return self._delete_movies(session, [duplicate_id])
+
+    def set_enrichment_status(self, movie_id, status):
+        """
+        Record the enrichment status of a movie, e.g. 'failed' when its
+        OMDb lookup was given up.
+        """
+        session = self.Session()
+        try:
+            found = session.execute(
+                update(Movie).where(Movie.id == movie_id).values(
+                    enrichment_status=status)).rowcount
+            holders = self._touch_libraries(session, [movie_id])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if found:
+            self._invalidate(f'movie:{movie_id}',
+                             *[f'user:{user_id}' for user_id in holders])
+
     def update_movie(self, movie):
         """
-        Update the details of a specific movie in the database.
+        Update the details of a catalog movie, for every library holding
+        it.
 
         :param movie: Movie object containing updated details.
         """
@@ -138,13 +1044,19 @@ class SQLiteDataManager(DataManagerInterface):
                 existing_movie.rating = movie.rating
                 existing_movie.poster = movie.poster
                 existing_movie.plot = movie.plot
+                for column, value in normalized_columns(
+                        movie.year, movie.rating).items():
+                    setattr(existing_movie, column, value)
+                holders = self._touch_libraries(session, [movie.id])
 
                 session.commit()
+                self._invalidate(f'movie:{movie.id}',
+                                 *[f'user:{user_id}' for user_id in holders])
             else:
-                print(f"Movie with ID {movie.id} not found.")
+                logger.warning("Movie with ID %s not found.", movie.id)
                 return False
         except Exception as e:
-            print(f"Error updating movie: {e}")
+            logger.exception("Error updating movie: %s", e)
             session.rollback()  # Rollback in case of an error
             return False
         finally:
@@ -153,32 +1065,93 @@ class SQLiteDataManager(DataManagerInterface):
 
     def delete_movie(self, movie_id):
         """
-        Delete a specific movie from the database.
+        Delete a movie from the catalog, and so from every library and
+        with its reviews.
 
         :param movie_id: ID of the movie to be deleted.
         """
         session = self.Session()
+        try:
+            if session.scalar(select(Movie.id).where(
+                    Movie.id == movie_id)) is None:
+                raise ValueError(f"Movie with ID {movie_id} does not exist.")
+            tags = self._delete_movies(session, [movie_id])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self._invalidate(*tags)
 
-        # Get the movie to be deleted
-        movie = session.query(Movie).get(movie_id)
-
-        if not movie:
-            raise ValueError(f"Movie with ID {movie_id} does not exist.")
-
-        # Delete associated reviews
-        session.query(Review).filter_by(movie_id=movie_id).delete(
-            synchronize_session=False)
-
-        # Delete the movie
-        session.delete(movie)
-
+    def delete_movies(self, movie_ids, chunk_size=500):
+        """
+        Delete catalog movies with set-based statements (see
+        _delete_movies), `chunk_size` IDs per statement, in one
+        transaction. Unknown IDs are ignored.
+        """
+        movie_ids = list(movie_ids)
+        tags = []
+        session = self.Session()
         try:
+            for start in range(0, len(movie_ids), chunk_size):
+                tags += self._delete_movies(
+                    session, movie_ids[start:start + chunk_size])
             session.commit()
-        except Exception as e:
+        except Exception:
             session.rollback()
-            raise e
+            raise
         finally:
             session.close()
+        if tags:
+            self._invalidate(*tags)
+
+    def _delete_movies(self, session, movie_ids):
+        """
+        Delete catalog movies in the caller's transaction without loading
+        them: their reviews are taken out of the authors' aggregates, and
+        their library entries, genre links and similar movies go with
+        them (ON DELETE CASCADE).
+
+        :param movie_ids: Movie IDs, or a SELECT of them.
+        :return: The cache tags of the pages affected.
+        """
+        if not isinstance(movie_ids, Select):
+            movie_ids = list(movie_ids)
+        _, tags = self._delete_reviews(session,
+                                       Review.movie_id.in_(movie_ids))
+
+        # The movies listing a deleted one lose a neighbour, refilled by
+        # the next similar-movies refresh
+        links = movie_similarity_table.c
+        listing = session.scalars(
+            update(Movie).where(Movie.id.in_(select(links.movie_id).where(
+                links.similar_movie_id.in_(movie_ids))))
+            .values(version=Movie.version + 1).returning(Movie.id),
+            execution_options={'synchronize_session': False}).all()
+        self._log_rating_changes(session, listing)
+
+        holders = self._touch_libraries(session, movie_ids)
+        deleted = session.scalars(
+            delete(Movie).where(Movie.id.in_(movie_ids)).returning(Movie.id),
+            execution_options={'synchronize_session': False}).all()
+        return tags + [f'movie:{movie_id}' for movie_id in deleted] + \
+            [f'movie:{movie_id}' for movie_id in listing] + \
+            [f'user:{user_id}' for user_id in holders]
+
+    @staticmethod
+    def _movie_row(movie):
+        """Column values of a new catalog movie from a details dict."""
+        return {
+            'imdb_id': movie.get('imdb_id'),
+            'title': movie['title'],
+            'director_id': movie['director_id'],
+            'year': movie['year'],
+            'rating': movie['rating'],
+            'poster': movie.get('poster'),
+            'plot': movie.get('plot'),
+            **normalized_columns(movie['year'], movie['rating']),
+        }
 
     def get_movie(self, movie_id):
         """
@@ -187,12 +1160,389 @@ class SQLiteDataManager(DataManagerInterface):
         :param movie_id: ID of the movie to retrieve.
         :return: Movie object or None if not found.
         """
-        session = self.Session()
+        session = self.ReadSession()
         movie = session.query(Movie).options(
             joinedload(Movie.director)).filter_by(id=movie_id).first()
         session.close()
         return movie
 
+    def bulk_add_movies(self, user_id, movies, batch_size=500):
+        """
+        Add many movies to a user's library with bulk INSERTs.
+
+        Movies the catalog already has (see _find_catalog_movies) are
+        linked, only the others are inserted. Directors and genres are
+        deduplicated in memory and only the missing ones are inserted;
+        movies are written in batches of `batch_size`, one transaction
+        per batch.
+
+        :param user_id: ID of the user the movies are added to.
+        :param movies: List of dicts with the keys title, director, year,
+        rating, poster, plot and (optionally) imdb_id and genres, a list
+        of names.
+        :param batch_size: Number of movies per transaction.
+        :return: A list with the catalog movie ID for each input dict.
+        """
+        if self.get_user(user_id) is None:
+            raise ValueError("User not found")
+        # Resolved in their own transaction, before this session takes
+        # the write lock
+        director_ids = self.get_or_create_directors(
+            movie['director'] for movie in movies)
+
+        session = self.Session()
+        movie_ids = []
+        try:
+            genre_ids = self._resolve_names(
+                session, Genre,
+                {genre for movie in movies
+                 for genre in movie.get('genres') or ()})
+            session.commit()
+
+            for start in range(0, len(movies), batch_size):
+                batch = [dict(movie, director_id=director_ids[
+                    movie['director']]) for movie in
+                    movies[start:start + batch_size]]
+                batch_ids = self._find_catalog_movies(session, batch)
+                # One new row per imdbID, however often it is listed
+                new = {}
+                for index, movie in enumerate(batch):
+                    if batch_ids[index] is None:
+                        new.setdefault(movie.get('imdb_id') or index, movie)
+                if new:
+                    inserted = dict(zip(new, session.scalars(
+                        insert(Movie).returning(
+                            Movie.id, sort_by_parameter_order=True),
+                        [self._movie_row(movie) for movie in new.values()])))
+                    batch_ids = [
+                        inserted[movie.get('imdb_id') or index]
+                        if movie_id is None else movie_id
+                        for index, (movie, movie_id) in enumerate(
+                            zip(batch, batch_ids))]
+                links = [{'movie_id': movie_id, 'genre_id': genre_ids[name]}
+                         for movie_id, movie in zip(batch_ids, batch)
+                         for name in dict.fromkeys(movie.get('genres') or ())]
+                if links:
+                    session.execute(sqlite_insert(movie_genre_table)
+                                    .on_conflict_do_nothing(), links)
+                self._add_to_library(session, user_id, batch_ids)
+                self._touch(session, User, [user_id])
+                session.commit()
+                movie_ids.extend(batch_ids)
+            return movie_ids
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+            if movie_ids:
+                self._invalidate(f'user:{user_id}')
+
+    @staticmethod
+    def _resolve_names(session, model, names, chunk_size=500):
+        """
+        Map names to IDs for a model with a `name` column, inserting the
+        names that do not exist yet.
+        """
+        names = list(names)
+        ids = {}
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start:start + chunk_size]
+            ids.update(session.execute(
+                select(model.name, model.id).where(
+                    model.name.in_(chunk))).all())
+        missing = [name for name in names if name not in ids]
+        if missing:
+            ids.update(session.execute(
+                insert(model).returning(model.name, model.id),
+                [{'name': name} for name in missing]).all())
+        return ids
+
+    def get_movies_missing_posters(self):
+        """
+        Retrieve the movies whose poster has not been mirrored yet.
+
+        :return: A list of (movie ID, poster URL) tuples.
+        """
+        session = self.ReadSession()
+        try:
+            return session.query(Movie.id, Movie.poster).filter(
+                Movie.poster_hash.is_(None),
+                Movie.poster.isnot(None),
+                Movie.poster.notin_(['', 'N/A'])).all()
+        finally:
+            session.close()
+
+    def get_movies_missing_genres(self, after_id=0, limit=500):
+        """
+        Retrieve a batch of enriched movies without any genre link, for
+        backfilling them batch by batch.
+
+        :param after_id: Only movies with a greater ID (the last ID of
+        the previous batch).
+        :param limit: Batch size.
+        :return: A list of (movie ID, title) tuples in ID order.
+        """
+        links = movie_genre_table.c
+        session = self.ReadSession()
+        try:
+            return session.execute(
+                select(Movie.id, Movie.title).where(
+                    Movie.id > after_id,
+                    Movie.enrichment_status == 'done',
+                    ~select(links.movie_id).where(
+                        links.movie_id == Movie.id).exists())
+                .order_by(Movie.id).limit(limit)).all()
+        finally:
+            session.close()
+
+    def add_movie_genres(self, genres_by_movie):
+        """
+        Link movies to genres, creating the genres that do not exist yet;
+        links that already exist are kept.
+
+        :param genres_by_movie: Dict of movie ID -> list of genre names.
+        :return: The number of links added.
+        """
+        session = self.Session()
+        try:
+            genre_ids = self._resolve_names(
+                session, Genre, {name for names in genres_by_movie.values()
+                                 for name in names})
+            links = [{'movie_id': movie_id, 'genre_id': genre_ids[name]}
+                     for movie_id, names in genres_by_movie.items()
+                     for name in dict.fromkeys(names)]
+            added = 0
+            if links:
+                added = session.execute(
+                    sqlite_insert(movie_genre_table)
+                    .on_conflict_do_nothing(), links).rowcount
+            session.commit()
+            return added
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def set_poster_hash(self, movie_ids, digest):
+        """
+        Record the mirrored poster digest for one or more movies.
+
+        :param movie_ids: IDs of the movies sharing the poster.
+        :param digest: Digest returned by PosterStore.mirror.
+        """
+        movie_ids = list(movie_ids)
+        session = self.Session()
+        try:
+            session.execute(update(Movie).where(
+                Movie.id.in_(movie_ids)).values(poster_hash=digest))
+            holders = self._touch_libraries(session, movie_ids)
+            session.commit()
+            self._invalidate(*[f'movie:{movie_id}' for movie_id in movie_ids],
+                             *[f'user:{user_id}' for user_id in holders])
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def search(self, query, limit=20):
+        """
+        Full-text search over movie titles, plots, directors and reviews.
+
+        Every word of the query is matched as a prefix ("incep" finds
+        "Inception"); results are ranked by bm25 with titles weighted
+        highest.
+
+        :param query: Free-text search string.
+        :param limit: Maximum number of results.
+        :return: A list of SearchResult tuples, best match first, with an
+        HTML-safe snippet in which the matches are wrapped in <mark>.
+        """
+        words = re.findall(r'\w+', query)
+        if not words:
+            return []
+        match = ' '.join(f'"{word}"*' for word in words)
+
+        # Rank (the weighted bm25 configured by the migration) and cut to
+        # `limit` inside the FTS query before joining the movie rows.
+        statement = text(
+            "SELECT m.id, m.title, m.year, m.poster, d.name,"
+            " hit.snippet, hit.rank"
+            " FROM (SELECT rowid, rank,"
+            "       snippet(movie_search, -1, :start, :end, '…', 16)"
+            "       AS snippet"
+            "       FROM movie_search WHERE movie_search MATCH :match"
+            "       ORDER BY rank LIMIT :limit) AS hit"
+            " JOIN movies m ON m.id = hit.rowid"
+            " LEFT JOIN directors d ON d.id = m.director_id"
+            " ORDER BY hit.rank")
+        session = self.ReadSession()
+        try:
+            rows = session.execute(statement, {
+                'match': match, 'limit': limit,
+                'start': _SNIPPET_START, 'end': _SNIPPET_END}).all()
+        finally:
+            session.close()
+
+        def highlight(snippet):
+            return Markup(str(escape(snippet))
+                          .replace(_SNIPPET_START, '<mark>')
+                          .replace(_SNIPPET_END, '</mark>'))
+
+        return [SearchResult(*row[:5], highlight(row[5]), row[6])
+                for row in rows]
+
+    # --- Similar movies ---
+
+    def get_similar_movies(self, movie_id, limit=10):
+        """
+        Retrieve the movies most similar to a movie by review ratings, as
+        last computed by static.recommendations.refresh_similarities.
+
+        :param movie_id: ID of the movie.
+        :param limit: Maximum number of movies returned.
+        :return: A list of Movie objects, most similar first.
+        """
+        links = movie_similarity_table.c
+        session = self.ReadSession()
+        try:
+            return session.query(Movie).join(
+                movie_similarity_table, links.similar_movie_id == Movie.id
+            ).filter(links.movie_id == movie_id).order_by(
+                links.score.desc()).limit(limit).all()
+        finally:
+            session.close()
+
+    def get_similarity_changes(self):
+        """
+        Return the movies whose review ratings changed since the similar
+        movies were last refreshed.
+
+        :return: A tuple (ID of the last logged change or None, set of
+        movie IDs).
+        """
+        changes = similarity_change_table.c
+        session = self.ReadSession()
+        try:
+            last_id = session.scalar(select(func.max(changes.id)))
+            if last_id is None:
+                return None, set()
+            return last_id, set(session.scalars(
+                select(changes.movie_id).where(changes.id <= last_id)))
+        finally:
+            session.close()
+
+    def get_movies_listing_similar(self, movie_ids, chunk_size=500):
+        """
+        Return the movies whose stored similar movies include any of
+        `movie_ids`.
+
+        :return: A set of movie IDs.
+        """
+        links = movie_similarity_table.c
+        movie_ids = list(movie_ids)
+        listing = set()
+        session = self.ReadSession()
+        try:
+            for start in range(0, len(movie_ids), chunk_size):
+                listing.update(session.scalars(
+                    select(links.movie_id).where(links.similar_movie_id.in_(
+                        movie_ids[start:start + chunk_size]))))
+            return listing
+        finally:
+            session.close()
+
+    def get_similarities(self, movie_ids, chunk_size=500):
+        """
+        Return the stored similar movies of each of `movie_ids`.
+
+        :return: A dict of movie ID -> list of (similar movie ID, score),
+        most similar first, without the movies that have none.
+        """
+        links = movie_similarity_table.c
+        movie_ids = list(movie_ids)
+        similarities = defaultdict(list)
+        session = self.ReadSession()
+        try:
+            for start in range(0, len(movie_ids), chunk_size):
+                for movie_id, similar_movie_id, score in session.execute(
+                        select(links.movie_id, links.similar_movie_id,
+                               links.score)
+                        .where(links.movie_id.in_(
+                            movie_ids[start:start + chunk_size]))):
+                    similarities[movie_id].append((similar_movie_id, score))
+        finally:
+            session.close()
+        for neighbours in similarities.values():
+            neighbours.sort(key=lambda item: (-item[1], item[0]))
+        return dict(similarities)
+
+    def replace_similarities(self, neighbours, movie_ids=None,
+                             last_change_id=None, batch_size=5000):
+        """
+        Store freshly computed similar movies in one transaction and bump
+        the versions of the movies whose page shows them.
+
+        :param neighbours: Iterable of (movie ID, similar movie ID, score)
+        tuples.
+        :param movie_ids: The movies whose neighbours were recomputed;
+        their stored rows are replaced. None replaces the whole table.
+        :param last_change_id: Drop the logged changes up to this ID (see
+        get_similarity_changes), which the neighbours take into account.
+        """
+        links = movie_similarity_table.c
+        session = self.Session()
+        try:
+            if movie_ids is None:
+                session.execute(delete(movie_similarity_table))
+                session.execute(update(Movie).values(
+                    version=Movie.version + 1))
+            else:
+                movie_ids = list(movie_ids)
+                for start in range(0, len(movie_ids), batch_size):
+                    chunk = movie_ids[start:start + batch_size]
+                    session.execute(delete(movie_similarity_table).where(
+                        links.movie_id.in_(chunk)))
+                    self._touch(session, Movie, chunk)
+
+            rows = []
+            for movie_id, similar_movie_id, score in neighbours:
+                rows.append({'movie_id': movie_id,
+                             'similar_movie_id': similar_movie_id,
+                             'score': score})
+                if len(rows) >= batch_size:
+                    session.execute(insert(movie_similarity_table), rows)
+                    rows = []
+            if rows:
+                session.execute(insert(movie_similarity_table), rows)
+
+            if last_change_id is not None:
+                session.execute(delete(similarity_change_table).where(
+                    similarity_change_table.c.id <= last_change_id))
+            session.commit()
+            if movie_ids is None:
+                self._invalidate('*')
+            else:
+                self._invalidate(*[f'movie:{movie_id}'
+                                   for movie_id in movie_ids])
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def _log_rating_changes(session, movie_ids):
+        """
+        Queue movies for the next similar-movies refresh, in the caller's
+        transaction.
+        """
+        rows = [{'movie_id': movie_id} for movie_id in movie_ids]
+        if rows:
+            session.execute(insert(similarity_change_table), rows)
+
     # --- Director CRUD Operations ---
 
     def add_director(self, director):
@@ -214,13 +1564,90 @@ class SQLiteDataManager(DataManagerInterface):
         :param director_id: ID of the director to retrieve.
         :return: Director object.
         """
-        session = self.Session()
+        session = self.ReadSession()
         director = session.query(Director).filter_by(id=director_id).first()
         session.close()
         return director
 
+    def get_or_create_director(self, name):
+        """
+        Return the ID of the director called `name`, creating the
+        director if needed.
+
+        Names are matched on their normalized key (case, spacing and
+        Unicode form are ignored). The lookup is served from an in-process
+        cache; on a miss a single INSERT ... ON CONFLICT upsert returns
+        the existing or new row, so concurrent calls for the same name
+        never create duplicates.
+
+        :param name: Director name.
+        :return: The director's ID.
+        :raises ValueError: If the name is empty.
+        """
+        director_id = self._director_ids.get(name_key(name or ''))
+        if director_id is not None:
+            return director_id
+        return self.get_or_create_directors([name])[name]
+
+    def get_or_create_directors(self, names, chunk_size=500):
+        """
+        Batch form of get_or_create_director: resolve many names with one
+        upsert statement per `chunk_size` uncached names.
+
+        :param names: Iterable of director names.
+        :return: A dict mapping each given name to its director's ID.
+        :raises ValueError: If a name is empty.
+        """
+        keys = {name: name_key(name or '') for name in names}
+        if not all(keys.values()):
+            raise ValueError("Director name is empty")
+
+        ids, missing = {}, {}
+        for name, key in keys.items():
+            director_id = self._director_ids.get(key)
+            if director_id is not None:
+                ids[name] = director_id
+            else:
+                missing.setdefault(key, ' '.join(name.split()))
+
+        found = {}
+        if missing:
+            items = list(missing.items())
+            with self.engine.begin() as connection:
+                for start in range(0, len(items), chunk_size):
+                    statement = sqlite_insert(Director).values([
+                        {'name': display, 'name_key': key}
+                        for key, display in items[start:start + chunk_size]])
+                    # The no-op update makes RETURNING yield existing rows
+                    statement = statement.on_conflict_do_update(
+                        index_elements=[Director.name_key],
+                        set_={'name_key': statement.excluded.name_key})
+                    found.update(connection.execute(statement.returning(
+                        Director.name_key, Director.id)).all())
+            for key, director_id in found.items():
+                self._director_ids.set(key, director_id)
+
+        for name, key in keys.items():
+            if name not in ids:
+                ids[name] = found[key]
+        return ids
+
+    def get_directors_page(self, after=None, before=None, limit=None):
+        """
+        Retrieve one page of directors ordered by name.
+
+        :return: A Page of Director objects with next/prev cursors.
+        """
+        session = self.ReadSession()
+        try:
+            return keyset_page(session, session.query(Director),
+                               Director.name, Director.id, after=after,
+                               before=before, limit=clamp_page_size(limit))
+        finally:
+            session.close()
+
     def get_director_by_name(self, name):
-        session = self.Session()
+        session = self.ReadSession()
         try:
             director = session.query(Director).filter_by(name=name).first()
             return director
@@ -232,7 +1659,7 @@ class SQLiteDataManager(DataManagerInterface):
         Retrieve all directors from the database.
         :return: A list of Director objects.
         """
-        session = self.Session()
+        session = self.ReadSession()
         directors = session.query(Director).all()
         session.close()
         return directors
@@ -246,9 +1673,13 @@ class SQLiteDataManager(DataManagerInterface):
         existing_director = session.query(Director).filter_by(
             id=director.id).first()
         if existing_director:
+            keys = existing_director.name_key, name_key(director.name)
             existing_director.name = director.name
-            existing_director.birth_date = director.birth_date
+            existing_director.name_key = keys[1]
+            self._touch_director_pages(session, director.id)
             session.commit()
+            self._director_ids.discard(*keys)
+            self._invalidate('directors')
         session.close()
 
     def delete_director(self, director_id):
@@ -259,24 +1690,64 @@ class SQLiteDataManager(DataManagerInterface):
         session = self.Session()
         director = session.query(Director).filter_by(id=director_id).first()
         if director:
+            key = director.name_key
+            self._touch_director_pages(session, director_id)
             session.delete(director)
             session.commit()
+            self._director_ids.discard(key)
+            self._invalidate('directors')
         session.close()
 
+    def _touch_director_pages(self, session, director_id):
+        """Bump the movies of a director and the libraries holding them."""
+        movies = select(Movie.id).where(Movie.director_id == director_id)
+        owners = select(user_movie_table.c.user_id).where(
+            user_movie_table.c.movie_id.in_(movies))
+        session.execute(update(User).where(User.id.in_(owners)).values(
+            version=User.version + 1))
+        session.execute(update(Movie).where(Movie.id.in_(movies)).values(
+            version=Movie.version + 1))
+
     # --- Review CRUD Operations ---
 
+    @staticmethod
+    def _apply_rating_delta(session, model, row_id, count_delta, sum_delta):
+        """
+        Adjust the review_count/rating_sum/avg_rating aggregates of one
+        movie or user in the caller's transaction.
+        """
+        new_count = model.review_count + count_delta
+        new_sum = model.rating_sum + sum_delta
+        session.execute(update(model).where(model.id == row_id).values(
+            review_count=new_count,
+            rating_sum=new_sum,
+            avg_rating=case((new_count > 0, new_sum / new_count), else_=0)))
+
     def add_review(self, review):
         """
-        Add a new review to the database.
+        Add a new review to the database and count it in the movie's and
+        the author's rating aggregates.
         :param review: Review object to be added.
         :return: The ID of the newly created review.
         """
         session = self.Session()
-        session.add(review)
-        session.commit()
-        review_id = review.id
-        session.close()
-        return review_id
+        try:
+            review.rating = float(review.rating)
+            session.add(review)
+            session.flush()
+            self._apply_rating_delta(session, Movie, review.movie_id, 1,
+                                     review.rating)
+            self._apply_rating_delta(session, User, review.user_id, 1,
+                                     review.rating)
+            self._log_rating_changes(session, [review.movie_id])
+            session.commit()
+            self._invalidate(f'movie:{review.movie_id}', 'ratings')
+            return review.id
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
     def get_review(self, review_id):
         """
@@ -284,23 +1755,53 @@ class SQLiteDataManager(DataManagerInterface):
         :param review_id: ID of the review to retrieve.
         :return: Review object.
         """
-        session = self.Session()
+        session = self.ReadSession()
         review = session.query(Review).options(joinedload(Review.user)).get(
             review_id)
         session.close()
         return review
 
+    def get_movie_reviews_page(self, movie_id, after=None, before=None,
+                               limit=None):
+        """
+        Retrieve one page of a movie's reviews, oldest first.
+
+        :return: A Page of Review objects with next/prev cursors.
+        """
+        session = self.ReadSession()
+        try:
+            return keyset_page(session, session.query(Review).filter_by(
+                movie_id=movie_id), Review.id, Review.id, after=after,
+                before=before, limit=clamp_page_size(limit))
+        finally:
+            session.close()
+
+    def iter_reviews(self, fields=None, batch_size=1000):
+        """
+        Stream every review, in ID order, without loading them all.
+
+        :param fields: REVIEW_COLUMNS names to select (default: all).
+        :param batch_size: Rows fetched from SQLite at a time.
+        :return: A generator of Row objects with the selected fields.
+        """
+        columns = [REVIEW_COLUMNS[name].label(name)
+                   for name in fields or REVIEW_COLUMNS]
+        return self._stream(select(*columns).order_by(Review.id),
+                            batch_size)
+
     def get_movie_reviews(self, movie_id):
         """
-        Retrieve all reviews for a specific movie.
+        Retrieve all reviews for a specific movie, oldest first.
         :param movie_id: ID of the movie whose reviews are to be retrieved.
-        :return: A list of Review objects.
+        :return: A list of ReviewRow tuples.
         """
-        session = self.Session()
-        reviews = session.query(Review).options(
-            joinedload(Review.user)).filter_by(movie_id=movie_id).all()
-        session.close()
-        return reviews
+        session = self.ReadSession()
+        try:
+            return [ReviewRow._make(row) for row in session.execute(
+                _select_fields(ReviewRow, Review.__table__.c).where(
+                    Review.movie_id == movie_id).order_by(Review.id))]
+        finally:
+            session.close()
 
     def update_review(self, review):
         """
@@ -312,9 +1813,21 @@ class SQLiteDataManager(DataManagerInterface):
             # Directly update the review in the session
             existing_review = session.query(Review).filter_by(
                 id=review.id).one()
+            rating_delta = float(review.rating) - existing_review.rating
             existing_review.review_text = review.review_text
-            existing_review.rating = review.rating
+            existing_review.rating = float(review.rating)
+            self._apply_rating_delta(session, Movie,
+                                     existing_review.movie_id, 0,
+                                     rating_delta)
+            self._apply_rating_delta(session, User,
+                                     existing_review.user_id, 0,
+                                     rating_delta)
+            if rating_delta:
+                self._log_rating_changes(session,
+                                         [existing_review.movie_id])
+            movie_id = existing_review.movie_id
             session.commit()
+            self._invalidate(f'movie:{movie_id}', 'ratings')
         except Exception as e:
             session.rollback()
             raise e  # Reraise the exception to handle it in the calling code
@@ -323,12 +1836,148 @@ class SQLiteDataManager(DataManagerInterface):
 
     def delete_review(self, review_id):
         """
-        Delete a review by its ID.
+        Delete a review by its ID and remove it from the rating aggregates.
         :param review_id: ID of the review to delete.
+        :return: The ID of the reviewed movie, or None if the review did
+        not exist.
         """
         session = self.Session()
-        review = session.query(Review).filter_by(id=review_id).first()
-        if review:
-            session.delete(review)
+        try:
+            movie_ids, tags = self._delete_reviews(session,
+                                                   Review.id == review_id)
             session.commit()
-        session.close()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if not movie_ids:
+            return None
+        self._invalidate(*tags)
+        return movie_ids[0]
+
+    def delete_reviews(self, review_ids, chunk_size=500):
+        """
+        Delete reviews by ID with set-based statements (see
+        _delete_reviews), `chunk_size` IDs per statement, in one
+        transaction. Unknown IDs are ignored.
+        """
+        review_ids = list(review_ids)
+        tags = []
+        session = self.Session()
+        try:
+            for start in range(0, len(review_ids), chunk_size):
+                tags += self._delete_reviews(session, Review.id.in_(
+                    review_ids[start:start + chunk_size]))[1]
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if tags:
+            self._invalidate(*tags)
+
+    def _delete_reviews(self, session, condition):
+        """
+        Delete the reviews matching `condition` in the caller's
+        transaction without loading them: one grouped UPDATE per table
+        takes them out of the movies' and the authors' rating aggregates,
+        and the movies are logged for the next similar-movies refresh.
+
+        :return: The IDs of the reviewed movies, and the cache tags of
+        the pages showing their aggregates.
+        """
+        changed = {}
+        for model, column in ((Movie, Review.movie_id),
+                              (User, Review.user_id)):
+            removed = select(
+                column.label('row_id'), func.count().label('removed_count'),
+                func.sum(Review.rating).label('removed_sum')).where(
+                condition).group_by(column).subquery()
+            new_count = model.review_count - removed.c.removed_count
+            new_sum = model.rating_sum - removed.c.removed_sum
+            changed[model] = session.scalars(
+                update(model).where(model.id == removed.c.row_id).values(
+                    review_count=new_count, rating_sum=new_sum,
+                    avg_rating=case((new_count > 0, new_sum / new_count),
+                                    else_=0)).returning(model.id),
+                execution_options={'synchronize_session': False}).all()
+        session.execute(insert(similarity_change_table).from_select(
+            ['movie_id'], select(Review.movie_id).where(condition).distinct()))
+        session.execute(delete(Review).where(condition),
+                        execution_options={'synchronize_session': False})
+        movie_ids = changed[Movie]
+        return movie_ids, [f'movie:{movie_id}' for movie_id in movie_ids] + \
+            [f'user:{user_id}' for user_id in changed[User]] + ['ratings']
+
+    def rebuild_rating_aggregates(self):
+        """
+        Recompute every movie and user rating aggregate from the reviews.
+        """
+        with self.engine.begin() as connection:
+            for statement in REBUILD_RATING_AGGREGATES:
+                connection.exec_driver_sql(statement)
+            for model in (Movie, User):
+                connection.execute(update(model).values(
+                    version=model.version + 1))
+        self._invalidate('*')
+
+    # --- Library imports ---
+
+    def add_library_import(self, user_id, total):
+        """
+        Record a library import queued for a user.
+
+        :param total: Number of titles to import.
+        :return: The ID of the import.
+        """
+        session = self.Session()
+        try:
+            library_import = LibraryImport(user_id=user_id, total=total)
+            session.add(library_import)
+            session.commit()
+            return library_import.id
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def update_library_import(self, import_id, failures=None, **fields):
+        """
+        Update the progress of a library import.
+
+        :param failures: Optional list of {'title', 'error'} dicts
+        replacing the stored failures.
+        :param fields: New values of status, done and imported.
+        """
+        values = dict(fields)
+        if failures is not None:
+            values['failures'] = json.dumps(failures)
+        with self.engine.begin() as connection:
+            connection.execute(update(LibraryImport).where(
+                LibraryImport.id == import_id).values(**values))
+
+    def get_library_import(self, import_id):
+        """
+        Retrieve the progress of a library import.
+
+        :return: An ImportRow, or None if there is no such import.
+        """
+        session = self.ReadSession()
+        try:
+            row = session.execute(_select_fields(
+                ImportRow, LibraryImport.__table__.c).where(
+                LibraryImport.id == import_id)).first()
+        finally:
+            session.close()
+        if row is None:
+            return None
+        return ImportRow._make(row)._replace(
+            failures=json.loads(row.failures))
+
+    def dispose(self):
+        """Close every pooled connection of both engines."""
+        self.engine.dispose()
+        self.read_engine.dispose()
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import threading
+import weakref
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import NullPool
+
+# Defaults applied to every connection handed out by the pool. They can be
+# overridden per data manager through the keyword arguments of
+# create_sqlite_engines (and from the Flask config in app.py).
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_TIMEOUT = 30
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KIB = 64 * 1024
+
+
+def _install_pragmas(engine, busy_timeout, mmap_size, cache_size,
+                     read_only=False):
+    """
+    Register a connect hook that tunes every new SQLite connection.
+
+    The write engine also switches the database to WAL and opens its
+    transactions with BEGIN IMMEDIATE, so concurrent writers wait on
+    busy_timeout instead of failing with "database is locked" when a
+    deferred transaction tries to upgrade its lock.
+    """
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see on_begin below)
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        if not read_only:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+        # A negative cache_size is interpreted by SQLite as KiB
+        cursor.execute(f'PRAGMA cache_size=-{int(cache_size)}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        # ON DELETE CASCADE / SET NULL of the models (off by default)
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        if read_only:
+            connection.exec_driver_sql('BEGIN')
+        else:
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def _dispose_after_fork(engine):
+    """
+    Drop the pooled connections of `engine` in processes forked from this
+    one (e.g. gunicorn workers forked from a preloading master).
+
+    SQLite connections must not be used across a fork, so each child opens
+    its own; close=False leaves the parent's connections open for the
+    parent. The engine is held weakly, so disposed engines are not kept.
+    """
+    engine_ref = weakref.ref(engine)
+
+    def after_in_child():
+        child_engine = engine_ref()
+        if child_engine is not None:
+            child_engine.dispose(close=False)
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=after_in_child)
+
+
+def _create_async_engine(url, **options):
+    # Imported here: the asyncio extension is only needed by the async
+    # data layer
+    from sqlalchemy.ext.asyncio import create_async_engine
+    return create_async_engine(url, **options).sync_engine
+
+
+def create_sqlite_engines(db_file_name,
+                          pool_size=DEFAULT_POOL_SIZE,
+                          max_overflow=DEFAULT_MAX_OVERFLOW,
+                          pool_timeout=DEFAULT_POOL_TIMEOUT,
+                          busy_timeout=DEFAULT_BUSY_TIMEOUT_MS,
+                          mmap_size=DEFAULT_MMAP_SIZE,
+                          cache_size=DEFAULT_CACHE_SIZE_KIB,
+                          async_driver=False, pooled=True):
+    """
+    Create the pooled read-write and read-only engines for a database file.
+
+    :param db_file_name: Path of the SQLite database file.
+    :param async_driver: Create the engines with SQLAlchemy's asyncio
+    extension and the aiosqlite driver, and return their synchronous
+    facades; these only work inside greenlet_spawn (see
+    datamanager.async_data_manager).
+    :param pooled: False to open a connection per checkout (NullPool),
+    e.g. for async engines used from more than one event loop.
+    :return: A (write_engine, read_engine) tuple.
+    """
+    if pooled:
+        pool_options = dict(pool_size=pool_size, max_overflow=max_overflow,
+                            pool_timeout=pool_timeout, pool_pre_ping=False)
+    else:
+        pool_options = dict(poolclass=NullPool)
+    if async_driver:
+        make_engine, dialect = _create_async_engine, 'sqlite+aiosqlite'
+    else:
+        make_engine, dialect = create_engine, 'sqlite'
+
+    write_engine = make_engine(f'{dialect}:///{db_file_name}',
+                               **pool_options)
+    _install_pragmas(write_engine, busy_timeout, mmap_size, cache_size)
+
+    # Open the file once through the write engine so it exists (and is in
+    # WAL mode) before any read-only connection is attempted.
+    with write_engine.connect():
+        pass
+
+    read_engine = make_engine(
+        f'{dialect}:///file:{db_file_name}?mode=ro&uri=true', **pool_options)
+    _install_pragmas(read_engine, busy_timeout, mmap_size, cache_size,
+                     read_only=True)
+    for engine in (write_engine, read_engine):
+        _dispose_after_fork(engine)
+    return write_engine, read_engine
+
+
+class LocalConnections:
+    """
+    Raw sqlite3 connections to one file, one per thread and process, for
+    the stores that do not go through SQLAlchemy (OMDb cache, page cache,
+    job queue).
+
+    Nothing is opened until the first get() of each thread, and a
+    connection is only handed out in the process that opened it: a worker
+    forked after its parent used the file (gunicorn --preload) opens its
+    own instead of sharing the parent's.
+    """
+
+    def __init__(self, db_file_name, schema=None, timeout=5):
+        """
+        :param db_file_name: Path of the SQLite database file.
+        :param schema: Optional SQL script (CREATE ... IF NOT EXISTS) run
+        by the first connection of each process.
+        :param timeout: Seconds to wait for a lock held by another
+        connection.
+        """
+        self.db_file_name = db_file_name
+        self.schema = schema
+        self.timeout = timeout
+        self._local = threading.local()
+        self._schema_pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return this thread's connection, opening it if needed."""
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.db_file_name,
+                                         timeout=self.timeout,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if self.schema and self._schema_pid != pid:
+                with self._lock:
+                    if self._schema_pid != pid:
+                        connection.executescript(self.schema)
+                        self._schema_pid = pid
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
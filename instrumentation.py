@@ -0,0 +1,362 @@
+"""
+Per-request instrumentation.
+
+Hooks the SQLAlchemy engines, the ORM sessions, Flask's request and
+template signals and the OMDb client, and records for every route its
+wall time, number of SQL statements, SQL time, sessions opened, OMDb time
+and template render time, plus the duration of the startup phases (see
+Instrumentation.record_startup). The metrics are served in the Prometheus
+text format (see Instrumentation.render, exposed at /metrics).
+
+With slow-request logging on, any request above a statement count or a
+duration is logged together with its slowest statements.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import (before_render_template, g, has_request_context,
+                   request, request_finished, request_started,
+                   template_rendered)
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                    0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"'
+                          for name, value in pairs) + '}'
+
+
+class Histogram:
+    """Prometheus histogram with cumulative buckets per label set."""
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, values in series:
+            bounds = list(self.buckets) + ['+Inf']
+            for bound, count in zip(bounds, values):
+                labels = _labels(self.labels, label_values, [('le', bound)])
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {values[-1]}')
+            lines.append(f'{self.name}_count{labels} {values[-2]}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    """Prometheus counter per label set."""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_labels(self.labels, label_values)}'
+                         f' {value}')
+        return '\n'.join(lines)
+
+
+class Gauge:
+    """Prometheus gauge (last value set) per label set."""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} gauge']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_labels(self.labels, label_values)}'
+                         f' {value}')
+        return '\n'.join(lines)
+
+
+class RequestStats:
+    """Measurements of the request being handled (stored on flask.g)."""
+
+    __slots__ = ('started', 'sql_count', 'sql_time', 'sessions',
+                 'omdb_count', 'omdb_time', 'render_time', 'render_started',
+                 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.sessions = 0
+        self.omdb_count = 0
+        self.omdb_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        # (seconds, statement), only kept for slow-request logging
+        self.statements = []
+
+
+def _current():
+    if has_request_context():
+        return g.get('_request_stats')
+    return None
+
+
+class Instrumentation:
+    """Collects the per-route metrics of one application."""
+
+    def __init__(self, slow_request_queries=None, slow_request_ms=None):
+        """
+        :param slow_request_queries: Log requests running more SQL
+        statements than this (None to disable).
+        :param slow_request_ms: Log requests taking longer than this many
+        milliseconds (None to disable).
+        """
+        self.slow_request_queries = slow_request_queries
+        self.slow_request_ms = slow_request_ms
+
+        route = ('route',)
+        self.requests = Counter(
+            'http_requests_total', 'Requests handled.', ('route', 'status'))
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Wall time per request.', route)
+        self.sql_statements = Histogram(
+            'http_request_sql_statements',
+            'SQL statements executed per request.', route, COUNT_BUCKETS)
+        self.sql_seconds = Histogram(
+            'http_request_sql_duration_seconds',
+            'Time spent in SQL statements per request.', route)
+        self.sessions = Histogram(
+            'http_request_db_sessions',
+            'Database sessions (transactions) opened per request.', route,
+            COUNT_BUCKETS)
+        self.omdb_seconds = Histogram(
+            'http_request_omdb_duration_seconds',
+            'Time spent waiting for OMDb per request.', route)
+        self.render_seconds = Histogram(
+            'http_request_template_render_seconds',
+            'Template render time per request.', route)
+        self.omdb_requests = Histogram(
+            'omdb_request_duration_seconds',
+            'Latency of individual OMDb API calls.', ('outcome',))
+        self.omdb_events = Counter(
+            'omdb_events_total',
+            'OMDb lookups coalesced, throttled, short-circuited or served '
+            'stale, and circuit breaker transitions.', ('event',))
+        self.omdb_circuit = Gauge(
+            'omdb_circuit_breaker_state',
+            '1 for the current state of the OMDb circuit breaker (set from '
+            'its first transition on).', ('state',))
+        self.startup_seconds = Gauge(
+            'app_startup_seconds',
+            'Duration of each startup phase of this process.', ('phase',))
+        self._metrics = [self.requests, self.request_seconds,
+                         self.sql_statements, self.sql_seconds,
+                         self.sessions, self.omdb_seconds,
+                         self.render_seconds, self.omdb_requests,
+                         self.omdb_events, self.omdb_circuit,
+                         self.startup_seconds]
+        self._first_request = True
+        self._first_request_lock = threading.Lock()
+
+    @property
+    def logs_slow_requests(self):
+        return self.slow_request_queries is not None or \
+            self.slow_request_ms is not None
+
+    # --- Hooks ---
+
+    def init_app(self, app):
+        """Subscribe to the app's request and template signals."""
+        request_started.connect(self._request_started, app, weak=False)
+        request_finished.connect(self._request_finished, app, weak=False)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._template_rendered, app, weak=False)
+        app.extensions['instrumentation'] = self
+
+    def instrument_engine(self, engine):
+        """Count and time the SQL statements executed through `engine`."""
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._execute_failed)
+
+    def instrument_sessions(self, session_factory):
+        """Count the sessions opened from a sessionmaker."""
+        event.listen(session_factory, 'after_begin', self._after_begin)
+
+    def instrument_data_manager(self, data_manager):
+        for engine in (data_manager.engine, data_manager.read_engine):
+            self.instrument_engine(engine)
+        for factory in (data_manager.Session, data_manager.ReadSession):
+            self.instrument_sessions(factory)
+
+    def record_omdb_request(self, seconds, outcome):
+        """
+        Listener for OMDbClient.add_request_listener. Calls made from
+        fetch_many's worker threads only count towards the global latency
+        histogram, not towards a route.
+        """
+        self.omdb_requests.observe(seconds, outcome)
+        stats = _current()
+        if stats is not None:
+            stats.omdb_count += 1
+            stats.omdb_time += seconds
+
+    def record_omdb_event(self, event):
+        """Listener for OMDbClient.add_event_listener."""
+        self.omdb_events.inc(event)
+        if event.startswith('circuit_'):
+            current = event[len('circuit_'):]
+            for state in ('closed', 'open', 'half_open'):
+                self.omdb_circuit.set(int(state == current), state)
+
+    def record_startup(self, phase, seconds):
+        """
+        Record and log the duration of a startup phase: "import" (of the
+        app module), "create_app", "data_layer" (opening and checking the
+        database) or "first_request".
+        """
+        self.startup_seconds.set(seconds, phase)
+        logger.debug("Startup: %s took %.1f ms", phase, seconds * 1000)
+
+    def _request_started(self, sender, **extra):
+        g._request_stats = RequestStats()
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = _current()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+    def _template_rendered(self, sender, template, context, **extra):
+        stats = _current()
+        if stats is not None and stats.render_started is not None:
+            stats.render_time += time.perf_counter() - stats.render_started
+            stats.render_started = None
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context,
+                        executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        stats = _current()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_time += elapsed
+            if self.logs_slow_requests:
+                stats.statements.append((elapsed, statement))
+
+    @staticmethod
+    def _execute_failed(context):
+        started = context.connection.info.get('query_started') \
+            if context.connection is not None else None
+        if started:
+            started.pop()
+
+    @staticmethod
+    def _after_begin(session, transaction, connection):
+        stats = _current()
+        if stats is not None:
+            stats.sessions += 1
+
+    def _request_finished(self, sender, response, **extra):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats.started
+        route = request.endpoint or '<unmatched>'
+
+        self.requests.inc(route, response.status_code)
+        self.request_seconds.observe(elapsed, route)
+        self.sql_statements.observe(stats.sql_count, route)
+        self.sql_seconds.observe(stats.sql_time, route)
+        self.sessions.observe(stats.sessions, route)
+        self.omdb_seconds.observe(stats.omdb_time, route)
+        self.render_seconds.observe(stats.render_time, route)
+        if self._first_request:
+            with self._first_request_lock:
+                first, self._first_request = self._first_request, False
+            if first:
+                self.record_startup('first_request', elapsed)
+
+        if self._is_slow(stats, elapsed):
+            slowest = sorted(stats.statements, reverse=True)[:5]
+            logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %d SQL statements in "
+                "%.1f ms, %d sessions, %d OMDb calls in %.1f ms, render "
+                "%.1f ms%s",
+                request.method, request.full_path, route, elapsed * 1000,
+                stats.sql_count, stats.sql_time * 1000, stats.sessions,
+                stats.omdb_count, stats.omdb_time * 1000,
+                stats.render_time * 1000,
+                ''.join(f'\n  {seconds * 1000:.1f} ms  {" ".join(sql.split())}'
+                        for seconds, sql in slowest))
+
+    def _is_slow(self, stats, elapsed):
+        if self.slow_request_queries is not None and \
+                stats.sql_count > self.slow_request_queries:
+            return True
+        return self.slow_request_ms is not None and \
+            elapsed * 1000 > self.slow_request_ms
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
@@ -0,0 +1,512 @@
+"""
+Background job queue.
+
+A job is a kind and a JSON-serializable payload; JobQueue runs the queued
+jobs on a pool of worker threads, calling the handler registered for
+their kind. A handler that raises is retried with exponential backoff
+until max_attempts, then dead-lettered; raising JobFailed dead-letters
+the job at once, and raising JobDeferred runs it again later without
+counting the attempt (for waits that say nothing about the job, such as
+a rate limit).
+
+MemoryBackend keeps the jobs in the process (they are lost on restart),
+SQLiteBackend in a SQLite file shared by every worker process, so queued
+jobs survive restarts. A running job is leased: JobQueue renews the
+leases of its running jobs while their handlers run, and if the process
+dies the job is handed out again once its lease expires. Delivery is
+therefore at least once: a job whose process stalled for longer than the
+lease (or died after its handler finished) runs again, so handlers have
+to be idempotent.
+"""
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+
+from datamanager.sqlite_engine import LocalConnections
+
+logger = logging.getLogger(__name__)
+
+# attempts counts the current run, enqueued_at is a Unix timestamp
+Job = namedtuple('Job', ['id', 'kind', 'payload', 'attempts', 'enqueued_at'])
+
+
+class JobFailed(Exception):
+    """Raised by a handler when retrying the job cannot help."""
+
+
+class JobDeferred(Exception):
+    """
+    Raised by a handler when the job cannot run yet: it is queued again
+    for `delay` seconds later, without counting as a failed attempt.
+    `payload`, when given, replaces the job's payload (e.g. with the part
+    of the work left).
+    """
+
+    def __init__(self, delay, reason='', payload=None):
+        super().__init__(reason or f"deferred for {delay:.0f} s")
+        self.delay = delay
+        self.payload = payload
+
+
+class MemoryBackend:
+    """In-process backend."""
+
+    # Running jobs are never handed out again, so they need no lease
+    lease = None
+
+    def __init__(self, max_dead=1000):
+        self._ids = itertools.count(1)
+        # (run_at, job ID) of the queued jobs
+        self._due = []
+        # Queued and running jobs by ID
+        self._jobs = {}
+        self._running = set()
+        # (job, error, failed_at), oldest first
+        self._dead = deque(maxlen=max_dead)
+        self._lock = threading.Lock()
+
+    def push(self, kind, payload, now):
+        with self._lock:
+            job = Job(next(self._ids), kind, payload, 0, now)
+            self._jobs[job.id] = job
+            heapq.heappush(self._due, (now, job.id))
+            return job.id
+
+    def claim(self, now):
+        with self._lock:
+            if not self._due or self._due[0][0] > now:
+                return None
+            _, job_id = heapq.heappop(self._due)
+            job = self._jobs[job_id]
+            job = self._jobs[job_id] = job._replace(attempts=job.attempts + 1)
+            self._running.add(job_id)
+            return job
+
+    def next_run_at(self):
+        with self._lock:
+            return self._due[0][0] if self._due else None
+
+    def renew(self, jobs, now):
+        pass
+
+    def complete(self, job):
+        with self._lock:
+            self._running.discard(job.id)
+            self._jobs.pop(job.id, None)
+
+    def retry(self, job, run_at, error):
+        with self._lock:
+            self._running.discard(job.id)
+            heapq.heappush(self._due, (run_at, job.id))
+
+    def defer(self, job, run_at, payload):
+        with self._lock:
+            self._running.discard(job.id)
+            self._jobs[job.id] = job._replace(
+                attempts=job.attempts - 1,
+                payload=job.payload if payload is None else payload)
+            heapq.heappush(self._due, (run_at, job.id))
+
+    def bury(self, job, error, now):
+        with self._lock:
+            self._running.discard(job.id)
+            self._jobs.pop(job.id, None)
+            self._dead.append((job, error, now))
+
+    def requeue_dead(self, now):
+        with self._lock:
+            dead = list(self._dead)
+            self._dead.clear()
+            for job, _, _ in dead:
+                self._jobs[job.id] = job._replace(attempts=0)
+                heapq.heappush(self._due, (now, job.id))
+            return len(dead)
+
+    def counts(self):
+        with self._lock:
+            queued = [job.enqueued_at for job_id, job in self._jobs.items()
+                      if job_id not in self._running]
+            return {'queued': len(queued), 'running': len(self._running),
+                    'dead': len(self._dead),
+                    'oldest_enqueued_at': min(queued, default=None)}
+
+    def dead_jobs(self, limit=20):
+        with self._lock:
+            dead = list(self._dead)[-limit:]
+        return [{'id': job.id, 'kind': job.kind, 'payload': job.payload,
+                 'attempts': job.attempts, 'error': error,
+                 'failed_at': failed_at}
+                for job, error, failed_at in reversed(dead)]
+
+
+class SQLiteBackend:
+    """
+    Durable backend in a SQLite file. Finished jobs are deleted, dead ones
+    are kept (status 'dead') until requeued.
+    """
+
+    def __init__(self, db_file_name, lease=300):
+        """
+        :param db_file_name: SQLite file holding the jobs table.
+        :param lease: Seconds a claimed job may go without its lease
+        being renewed before it is handed out again (its worker is then
+        assumed dead). JobQueue renews it every third of that while the
+        job runs.
+        """
+        self.db_file_name = db_file_name
+        self.lease = lease
+        # Opened on first use, per thread and process
+        self._connections = LocalConnections(
+            db_file_name,
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id INTEGER PRIMARY KEY, kind TEXT NOT NULL,'
+            ' payload TEXT NOT NULL,'
+            " status TEXT NOT NULL DEFAULT 'queued',"
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            # Due time while queued, lease expiry while running
+            ' run_at REAL NOT NULL, enqueued_at REAL NOT NULL,'
+            ' error TEXT, failed_at REAL);'
+            'CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at'
+            ' ON jobs (status, run_at);')
+
+    def _connection(self):
+        return self._connections.get()
+
+    def push(self, kind, payload, now):
+        return self._connection().execute(
+            'INSERT INTO jobs (kind, payload, run_at, enqueued_at)'
+            ' VALUES (?, ?, ?, ?)',
+            (kind, json.dumps(payload), now, now)).lastrowid
+
+    def claim(self, now):
+        # One statement, so two workers can never claim the same job
+        row = self._connection().execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1,"
+            " run_at = ? WHERE id = ("
+            "  SELECT id FROM jobs WHERE status IN ('queued', 'running')"
+            "  AND run_at <= ? ORDER BY run_at LIMIT 1)"
+            " RETURNING id, kind, payload, attempts, enqueued_at",
+            (now + self.lease, now)).fetchone()
+        if row is None:
+            return None
+        job_id, kind, payload, attempts, enqueued_at = row
+        return Job(job_id, kind, json.loads(payload), attempts, enqueued_at)
+
+    def next_run_at(self):
+        return self._connection().execute(
+            "SELECT min(run_at) FROM jobs"
+            " WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def renew(self, jobs, now):
+        # Only while this run still holds the job: once its lease expired
+        # and another worker claimed it, attempts has moved on
+        self._connection().executemany(
+            "UPDATE jobs SET run_at = ? WHERE id = ? AND attempts = ?"
+            " AND status = 'running'",
+            [(now + self.lease, job.id, job.attempts) for job in jobs])
+
+    def complete(self, job):
+        self._connection().execute('DELETE FROM jobs WHERE id = ?',
+                                   (job.id,))
+
+    def retry(self, job, run_at, error):
+        self._connection().execute(
+            "UPDATE jobs SET status = 'queued', run_at = ?, error = ?"
+            " WHERE id = ?", (run_at, error, job.id))
+
+    def defer(self, job, run_at, payload):
+        self._connection().execute(
+            "UPDATE jobs SET status = 'queued', run_at = ?,"
+            " attempts = attempts - 1, payload = coalesce(?, payload)"
+            " WHERE id = ?",
+            (run_at, None if payload is None else json.dumps(payload),
+             job.id))
+
+    def bury(self, job, error, now):
+        self._connection().execute(
+            "UPDATE jobs SET status = 'dead', error = ?, failed_at = ?"
+            " WHERE id = ?", (error, now, job.id))
+
+    def requeue_dead(self, now):
+        return self._connection().execute(
+            "UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?"
+            " WHERE status = 'dead'", (now,)).rowcount
+
+    def counts(self):
+        connection = self._connection()
+        counts = {'queued': 0, 'running': 0, 'dead': 0}
+        counts.update(connection.execute(
+            'SELECT status, count(*) FROM jobs GROUP BY status'))
+        counts['oldest_enqueued_at'] = connection.execute(
+            "SELECT min(enqueued_at) FROM jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+        return counts
+
+    def dead_jobs(self, limit=20):
+        rows = self._connection().execute(
+            "SELECT id, kind, payload, attempts, error, failed_at FROM jobs"
+            " WHERE status = 'dead' ORDER BY failed_at DESC LIMIT ?",
+            (limit,))
+        return [{'id': job_id, 'kind': kind, 'payload': json.loads(payload),
+                 'attempts': attempts, 'error': error,
+                 'failed_at': failed_at}
+                for job_id, kind, payload, attempts, error, failed_at
+                in rows]
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None
+
+    def at(fraction):
+        return round(values[min(len(values) - 1,
+                                int(fraction * len(values)))] * 1000, 2)
+
+    return {'p50': at(0.5), 'p95': at(0.95), 'max': at(1.0)}
+
+
+class JobQueue:
+    """Runs the jobs of a MemoryBackend or SQLiteBackend on worker
+    threads."""
+
+    def __init__(self, backend, workers=4, max_attempts=10, retry_delay=30,
+                 max_retry_delay=3600, poll_interval=1.0):
+        """
+        :param backend: MemoryBackend or SQLiteBackend.
+        :param workers: Number of worker threads.
+        :param max_attempts: Runs of a failing job before it is
+        dead-lettered.
+        :param retry_delay: Delay before the first retry, doubled for
+        every further one (up to max_retry_delay seconds). The defaults
+        keep retrying for about three hours, so jobs outlive an outage of
+        the service they call.
+        :param poll_interval: Seconds between checks for jobs queued by
+        other processes (SQLiteBackend).
+        """
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.poll_interval = poll_interval
+        self._handlers = {}
+        self._threads = []
+        self._stopping = False
+        # Jobs being run by this process's workers, by ID, whose leases
+        # the heartbeat thread renews
+        self._running = {}
+        self._running_lock = threading.Lock()
+        self._heartbeat = None
+        self._stopped = threading.Event()
+        # Bumped on every enqueue so idle workers do not miss a wakeup
+        self._signals = 0
+        self._wakeup = threading.Condition()
+        # Per kind: outcome counts and recent queue waits / run times
+        self._outcomes = defaultdict(lambda: defaultdict(int))
+        self._waits = defaultdict(lambda: deque(maxlen=1000))
+        self._run_times = defaultdict(lambda: deque(maxlen=1000))
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Start the workers with the app's first request."""
+        app.extensions['job_queue'] = self
+        app.before_request(self.start)
+
+    def register(self, kind, handler, on_dead=None):
+        """
+        Register the handler of a job kind.
+
+        :param handler: Callable receiving the job payload.
+        :param on_dead: Optional callable(payload, error) run when a job
+        of this kind is dead-lettered.
+        """
+        self._handlers[kind] = (handler, on_dead)
+
+    def enqueue(self, kind, payload):
+        """
+        Queue a job and wake up an idle worker.
+
+        :return: The job ID.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for {kind!r} jobs")
+        job_id = self.backend.push(kind, payload, time.time())
+        self.start()
+        with self._wakeup:
+            self._signals += 1
+            self._wakeup.notify()
+        return job_id
+
+    def start(self):
+        """Start the worker threads (once)."""
+        if self._threads:
+            return
+        with self._wakeup:
+            if self._threads or self._stopping:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name=f'job-worker-{number}')
+                thread.start()
+                self._threads.append(thread)
+            if self.backend.lease:
+                self._heartbeat = threading.Thread(
+                    target=self._renew_leases, daemon=True,
+                    name='job-heartbeat')
+                self._heartbeat.start()
+
+    def stop(self, timeout=None):
+        """Let the workers finish their current job and exit."""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout)
+            self._heartbeat = None
+
+    def join(self, timeout=None):
+        """
+        Wait until no job is queued or running (jobs waiting for a retry
+        count as queued).
+
+        :return: True if the queue drained within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            counts = self.backend.counts()
+            if not counts['queued'] and not counts['running']:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def requeue_dead(self):
+        """
+        Queue every dead-lettered job again with a fresh attempt count.
+        Does not start workers, so it can be run from a maintenance
+        command against a SQLiteBackend used by the app.
+
+        :return: The number of requeued jobs.
+        """
+        count = self.backend.requeue_dead(time.time())
+        if count:
+            with self._wakeup:
+                self._signals += count
+                self._wakeup.notify_all()
+        return count
+
+    def _work(self):
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+                signals = self._signals
+            try:
+                job = self.backend.claim(time.time())
+            except Exception:
+                logger.exception("Could not claim a job")
+                job = None
+            if job is not None:
+                self._run(job)
+                continue
+
+            timeout = self.poll_interval
+            next_run_at = self.backend.next_run_at()
+            if next_run_at is not None:
+                timeout = max(0.0, min(timeout, next_run_at - time.time()))
+            with self._wakeup:
+                if self._signals == signals and not self._stopping:
+                    self._wakeup.wait(timeout)
+
+    def _renew_leases(self):
+        # Every third of the lease, so a renewal may fail twice before
+        # another worker takes the job over
+        while not self._stopped.wait(self.backend.lease / 3):
+            with self._running_lock:
+                jobs = list(self._running.values())
+            if not jobs:
+                continue
+            try:
+                self.backend.renew(jobs, time.time())
+            except Exception:
+                logger.exception("Could not renew the leases of %d job(s)",
+                                 len(jobs))
+
+    def _run(self, job):
+        handler, on_dead = self._handlers.get(job.kind, (None, None))
+        started = time.time()
+        outcome = 'done'
+        with self._running_lock:
+            self._running[job.id] = job
+        try:
+            if handler is None:
+                raise JobFailed(f"No handler registered for {job.kind!r}")
+            handler(job.payload)
+            self.backend.complete(job)
+        except JobDeferred as e:
+            outcome = 'deferred'
+            # At least a second, so a deferred job never spins
+            delay = max(1.0, e.delay)
+            logger.info("Job %s %s deferred for %.0f s: %s", job.id,
+                        job.kind, delay, e)
+            self.backend.defer(job, time.time() + delay, e.payload)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            if isinstance(e, JobFailed) or job.attempts >= self.max_attempts:
+                outcome = 'dead'
+                logger.error("Job %s %s %r failed for good after %d "
+                             "attempt(s): %s", job.id, job.kind,
+                             job.payload, job.attempts, error)
+                self.backend.bury(job, error, time.time())
+                if on_dead is not None:
+                    try:
+                        on_dead(job.payload, error)
+                    except Exception:
+                        logger.exception("on_dead of job %s failed", job.id)
+            else:
+                outcome = 'retried'
+                delay = min(self.max_retry_delay,
+                            self.retry_delay * 2 ** (job.attempts - 1))
+                logger.warning("Job %s %s %r failed (attempt %d), retrying "
+                               "in %.0f s: %s", job.id, job.kind,
+                               job.payload, job.attempts, delay, error)
+                self.backend.retry(job, time.time() + delay, error)
+        finally:
+            with self._running_lock:
+                self._running.pop(job.id, None)
+
+        with self._stats_lock:
+            self._outcomes[job.kind][outcome] += 1
+            if job.attempts == 1:
+                self._waits[job.kind].append(started - job.enqueued_at)
+            self._run_times[job.kind].append(time.time() - started)
+
+    def stats(self):
+        """
+        Return the queue depth, the age of the oldest queued job, and per
+        job kind the outcome counts and the queue wait / run time
+        percentiles (milliseconds, over the last 1000 jobs) of this
+        process, plus the most recent dead letters.
+        """
+        counts = self.backend.counts()
+        oldest = counts.pop('oldest_enqueued_at')
+        with self._stats_lock:
+            kinds = {
+                kind: {**outcomes,
+                       'wait_ms': _percentiles(self._waits[kind]),
+                       'run_ms': _percentiles(self._run_times[kind])}
+                for kind, outcomes in self._outcomes.items()}
+        return {'workers': len(self._threads), **counts,
+                'oldest_queued_seconds':
+                    None if oldest is None else time.time() - oldest,
+                'kinds': kinds,
+                'dead_letters': self.backend.dead_jobs(10)}
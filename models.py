@@ -1,17 +1,98 @@
-from sqlalchemy import Column, Text, Integer, String, ForeignKey, Float, Table
-from sqlalchemy.orm import relationship, declarative_base
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Text, Integer, String, ForeignKey, Float, \
+    Table, Index, DateTime, literal_column, text
+from sqlalchemy.orm import relationship, declarative_base, backref, \
+    query_expression
+
+from datamanager.normalize import name_key
 
 Base = declarative_base()
 
+
+def _utcnow():
+    # Stored as naive UTC, which is what SQLite's DATETIME holds
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def version_columns():
+    """
+    Return the (version, updated_at) columns of a model whose pages are
+    served with ETag/Last-Modified validators.
+
+    Both change on every UPDATE of the row, whether issued by the ORM or
+    by a Core update(); SQLiteDataManager also bumps the rows whose pages
+    show data of other tables (see SQLiteDataManager._touch).
+    """
+    version = Column(Integer, nullable=False, default=1, server_default='1',
+                     onupdate=literal_column('version') + 1)
+    updated_at = Column(DateTime, nullable=False, default=_utcnow,
+                        server_default=text('CURRENT_TIMESTAMP'),
+                        onupdate=_utcnow)
+    return version, updated_at
+
+
+# Deleting a movie or user cascades to the rows referring to it in SQLite
+# itself (foreign keys are enforced, see datamanager.sqlite_engine), so
+# the relationships below leave deletes to the database (passive_deletes)
+# instead of loading the related rows first.
 movie_genre_table = Table('movie_genre', Base.metadata,
                           Column('movie_id', Integer,
-                                 ForeignKey('movies.id'),
+                                 ForeignKey('movies.id',
+                                            ondelete='CASCADE'),
                                  primary_key=True),
                           Column('genre_id', Integer,
-                                 ForeignKey('genres.id'),
-                                 primary_key=True)
+                                 ForeignKey('genres.id',
+                                            ondelete='CASCADE'),
+                                 primary_key=True),
+                          # Movies of a genre (the primary key only serves
+                          # genres of a movie)
+                          Index('ix_movie_genre_genre_movie', 'genre_id',
+                                'movie_id')
                           )
 
+# Users' libraries over the shared movie catalog: one row per movie a
+# user added, with the per-user fields (the ID gives the order added).
+# The catalog columns are shared by every library and only change with
+# OMDb's details; what a user edits lives here.
+user_movie_table = Table(
+    'user_movies', Base.metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'),
+           nullable=False),
+    Column('movie_id', Integer, ForeignKey('movies.id', ondelete='CASCADE'),
+           nullable=False),
+    Column('added_at', DateTime, nullable=False, default=_utcnow,
+           server_default=text('CURRENT_TIMESTAMP')),
+    # The user's own rating (0-10) and notes, None until set
+    Column('user_rating', Float),
+    Column('notes', Text),
+    Index('ix_user_movies_user_movie', 'user_id', 'movie_id', unique=True),
+    # Libraries holding a movie
+    Index('ix_user_movies_movie', 'movie_id')
+)
+
+# Precomputed "similar movies": the top neighbours of every reviewed movie
+# by review-rating similarity (see static.recommendations)
+movie_similarity_table = Table(
+    'movie_similarities', Base.metadata,
+    Column('movie_id', Integer, ForeignKey('movies.id', ondelete='CASCADE'),
+           primary_key=True),
+    Column('similar_movie_id', Integer,
+           ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True),
+    Column('score', Float, nullable=False),
+    # Movies listing a movie, refreshed when its ratings change
+    Index('ix_movie_similarities_similar', 'similar_movie_id')
+)
+
+# Movies whose review ratings changed since movie_similarities was last
+# refreshed, appended to by the review write methods
+similarity_change_table = Table(
+    'similarity_changes', Base.metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('movie_id', Integer, nullable=False)
+)
+
 
 class Genre(Base):
     """
@@ -19,15 +100,18 @@ class Genre(Base):
 
     Attributes:
         id (int): Unique identifier for the genre.
-        name (str): Name of the genre.
+        name (str): Name of the genre (unique, as spelled by OMDb).
     """
     __tablename__ = 'genres'
+    __table_args__ = (
+        Index('ix_genres_name', 'name', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=False)
 
     movies = relationship('Movie', secondary=movie_genre_table,
-                          back_populates='genres')
+                          back_populates='genres', passive_deletes=True)
 
     def __repr__(self):
         return f"Genre(id={self.id}, name={self.name})"
@@ -40,15 +124,33 @@ class User(Base):
     Attributes:
         id (int): Unique identifier for the user.
         name (str): Name of the user.
-        movies (list): List of movies associated with the user.
+        movies (list): Catalog movies in the user's library.
+        review_count (int): Number of reviews written by the user.
+        avg_rating (float): Average rating the user gives.
+        version (int): Incremented whenever the user or their library
+        changes.
+        updated_at (datetime): Time of the last change (UTC).
     """
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_name', 'name'),
+        Index('ix_users_updated_at', 'updated_at'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=False)
     lastname = Column(String, nullable=False)
-    movies = relationship('Movie', backref='user',
-                          cascade='all, delete-orphan')
+    # Aggregates over the reviews written by the user, kept up to date by
+    # the SQLiteDataManager review write methods
+    review_count = Column(Integer, nullable=False, default=0,
+                          server_default='0')
+    rating_sum = Column(Float, nullable=False, default=0,
+                        server_default='0')
+    avg_rating = Column(Float, nullable=False, default=0,
+                        server_default='0')
+    version, updated_at = version_columns()
+    movies = relationship('Movie', secondary=user_movie_table,
+                          back_populates='users', passive_deletes=True)
 
     def __repr__(self):
         return f"User(id={self.id}, name={self.name})"
@@ -56,30 +158,78 @@ class User(Base):
 
 class Movie(Base):
     """
-    Movie model representing a movie in the database.
+    Movie model representing a movie of the shared catalog: one row per
+    movie, whichever users have it in their library.
 
     Attributes:
         id (int): Unique identifier for the movie.
+        imdb_id (str): OMDb's imdbID, unique (None for placeholders and
+        movies added before it was stored).
         title (str): Name of the movie.
         director (str): Director of the movie.
-        year (int): Year of release.
-        rating (float): Rating of the movie.
-        user_id (int): ID of the user who added the movie.
+        year (str): Year of release as returned by OMDb.
+        rating (str): IMDb rating as returned by OMDb.
+        year_start (int): First year of release (None if unknown).
+        year_end (int): Last year for series (None while running).
+        imdb_rating (float): IMDb rating (None for "N/A").
+        users (list): Users having the movie in their library.
+        review_count (int): Number of reviews of the movie.
+        avg_rating (float): Average review rating (0 without reviews).
+        enrichment_status (str): 'pending' while the OMDb details of a
+        movie added by title are being fetched (director, year and rating
+        are None until then), 'done' once filled in, 'failed' when the
+        lookup gave up.
+        version (int): Incremented whenever the movie, its reviews or its
+        director change.
+        updated_at (datetime): Time of the last change (UTC).
     """
     __tablename__ = 'movies'
+    __table_args__ = (
+        Index('ix_movies_imdb_id', 'imdb_id', unique=True),
+        # Movies added before imdbIDs were stored are matched on these
+        Index('ix_movies_title', 'title'),
+        Index('ix_movies_year_start', 'year_start'),
+        Index('ix_movies_imdb_rating', 'imdb_rating'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    imdb_id = Column(String)
     title = Column(String, nullable=False)
-    director_id = Column(Integer, ForeignKey('directors.id'), nullable=False)
-    year = Column(String, nullable=False)
-    rating = Column(String, nullable=False)
+    # NULL only while the movie is a placeholder (see enrichment_status)
+    director_id = Column(Integer,
+                         ForeignKey('directors.id', ondelete='SET NULL'),
+                         index=True)
+    year = Column(String)
+    rating = Column(String)
+    # Typed copies of year/rating for sorting and range filters, NULL when
+    # OMDb had no usable value ("N/A"); see datamanager.normalize
+    year_start = Column(Integer)
+    year_end = Column(Integer)
+    imdb_rating = Column(Float)
     poster = Column(String)
+    # SHA-256 of the locally mirrored poster (see static.posters)
+    poster_hash = Column(String(64))
     plot = Column(String)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    # Community rating aggregates over the movie's reviews, kept up to
+    # date by the SQLiteDataManager review write methods
+    review_count = Column(Integer, nullable=False, default=0,
+                          server_default='0')
+    rating_sum = Column(Float, nullable=False, default=0,
+                        server_default='0')
+    avg_rating = Column(Float, nullable=False, default=0,
+                        server_default='0')
+    enrichment_status = Column(String, nullable=False, default='done',
+                               server_default='done')
+    version, updated_at = version_columns()
+    # Position of the movie in the library a query reads it from (see
+    # SQLiteDataManager.get_user_movies_page)
+    added_order = query_expression()
 
     director = relationship('Director', back_populates='movies')
+    users = relationship('User', secondary=user_movie_table,
+                         back_populates='movies', passive_deletes=True)
     genres = relationship('Genre', secondary=movie_genre_table,
-                          back_populates='movies')
+                          back_populates='movies', passive_deletes=True)
 
     def __repr__(self):
         director_name = self.director.name if self.director else "Unknown"
@@ -98,23 +248,34 @@ class Review(Base):
         movie_id (int): ID of the movie being reviewed.
         review_text (str): Text of the review.
         rating (float): Rating given by the user.
+        version (int): Incremented on every edit.
+        updated_at (datetime): Time of the last edit (UTC).
     """
     __tablename__ = 'reviews'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    movie_id = Column(Integer, ForeignKey('movies.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'),
+                     nullable=False, index=True)
+    movie_id = Column(Integer, ForeignKey('movies.id', ondelete='CASCADE'),
+                      nullable=False, index=True)
     review_text = Column(Text, nullable=False)
     rating = Column(Float, nullable=False)
+    version, updated_at = version_columns()
 
-    user = relationship('User', backref='reviews')
-    movie = relationship('Movie', backref='reviews')
+    user = relationship('User', backref=backref('reviews',
+                                                passive_deletes=True))
+    movie = relationship('Movie', backref=backref('reviews',
+                                                  passive_deletes=True))
 
     def __repr__(self):
         return (f"Review(id={self.id}, user_id={self.user_id}, "
                 f"movie_id={self.movie_id}, rating={self.rating})")
 
 
+def _default_name_key(context):
+    return name_key(context.get_current_parameters()['name'])
+
+
 class Director(Base):
     """
     Director model representing a movie director in the database.
@@ -122,14 +283,61 @@ class Director(Base):
     Attributes:
         id (int): Unique identifier for the director.
         name (str): Name of the director.
+        name_key (str): Normalized name, unique (see normalize.name_key).
     """
     __tablename__ = 'directors'
+    __table_args__ = (
+        Index('ix_directors_name_key', 'name_key', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, unique=True, index=True)
+    name_key = Column(String, nullable=False, default=_default_name_key)
 
-    movies = relationship('Movie',
-                          back_populates='director')  # Relationship to Movie
+    movies = relationship('Movie', back_populates='director',
+                          passive_deletes=True)  # Relationship to Movie
 
     def __repr__(self):
         return f"Director(id={self.id}, name={self.name})"
+
+
+class LibraryImport(Base):
+    """
+    Progress and report of a library import run by a background job (see
+    static.library_import.enqueue_import).
+
+    Attributes:
+        id (int): Unique identifier for the import.
+        user_id (int): ID of the user whose library is extended.
+        status (str): 'queued', 'running', 'waiting' (for OMDb), 'done'
+        or 'failed'.
+        total (int): Number of titles to import.
+        done (int): Titles handled so far, imported or not.
+        imported (int): Titles added to the library.
+        failures (str): JSON list of {'title', 'error'} of the titles
+        that could not be imported.
+        created_at (datetime): Time the import was queued (UTC).
+        updated_at (datetime): Time of the last progress update (UTC).
+    """
+    __tablename__ = 'library_imports'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'),
+                     nullable=False, index=True)
+    status = Column(String, nullable=False, default='queued',
+                    server_default='queued')
+    total = Column(Integer, nullable=False)
+    done = Column(Integer, nullable=False, default=0, server_default='0')
+    imported = Column(Integer, nullable=False, default=0,
+                      server_default='0')
+    failures = Column(Text, nullable=False, default='[]',
+                      server_default='[]')
+    created_at = Column(DateTime, nullable=False, default=_utcnow,
+                        server_default=text('CURRENT_TIMESTAMP'))
+    updated_at = Column(DateTime, nullable=False, default=_utcnow,
+                        server_default=text('CURRENT_TIMESTAMP'),
+                        onupdate=_utcnow)
+
+    def __repr__(self):
+        return (f"LibraryImport(id={self.id}, user_id={self.user_id}, "
+                f"status={self.status})")
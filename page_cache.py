@@ -0,0 +1,283 @@
+"""
+Cache of rendered HTML pages with tag-based invalidation.
+
+Read routes are wrapped with PageCache.cached and tag their pages with
+the entities they show ("user:3", "movie:7", ...). SQLiteDataManager
+reports the tags touched by every write (see
+SQLiteDataManager.add_invalidation_listener) and the cache drops exactly
+the pages carrying them.
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+
+from flask import Response, current_app, make_response, request, session
+
+from datamanager.sqlite_engine import LocalConnections
+
+# Invalidating this tag clears the whole cache
+ALL = '*'
+
+
+class LRUBackend:
+    """In-process backend, evicting least recently used pages above a
+    byte budget."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._keys_by_tag = defaultdict(set)
+        self._size = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, body, tags, generation):
+        with self._lock:
+            # Skip pages rendered while a write invalidated the cache
+            if generation != self._generation or len(body) > self.max_bytes:
+                return
+            self._remove(key)
+            self._entries[key] = (body, tags)
+            self._size += len(body)
+            for tag in tags:
+                self._keys_by_tag[tag].add(key)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= len(entry[0])
+        for tag in entry[1]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._generation += 1
+            if ALL in tags:
+                self._entries.clear()
+                self._keys_by_tag.clear()
+                self._size = 0
+                return
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+
+    def usage(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries),
+                    'bytes': self._size, 'max_bytes': self.max_bytes}
+
+
+class SQLiteBackend:
+    """
+    Backend shared by every worker through a SQLite file, so a write in
+    one worker invalidates the pages cached by all of them.
+    """
+
+    def __init__(self, db_file_name, max_bytes=256 * 1024 * 1024):
+        self.db_file_name = db_file_name
+        self.max_bytes = max_bytes
+        # Opened on first use, per thread and process
+        self._connections = LocalConnections(
+            db_file_name,
+            'CREATE TABLE IF NOT EXISTS page_cache ('
+            ' key TEXT PRIMARY KEY, body BLOB NOT NULL,'
+            ' size INTEGER NOT NULL, accessed REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS ix_page_cache_accessed'
+            ' ON page_cache (accessed);'
+            'CREATE TABLE IF NOT EXISTS page_cache_tags ('
+            ' tag TEXT NOT NULL, key TEXT NOT NULL,'
+            ' PRIMARY KEY (tag, key)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS ix_page_cache_tags_key'
+            ' ON page_cache_tags (key);'
+            'CREATE TABLE IF NOT EXISTS page_cache_generation ('
+            ' id INTEGER PRIMARY KEY CHECK (id = 1),'
+            ' generation INTEGER NOT NULL);'
+            'INSERT OR IGNORE INTO page_cache_generation VALUES (1, 0);')
+
+    def _connection(self):
+        return self._connections.get()
+
+    def generation(self):
+        return self._connection().execute(
+            'SELECT generation FROM page_cache_generation').fetchone()[0]
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT body FROM page_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE page_cache SET accessed = ? WHERE key = ?',
+                           (time.time(), key))
+        return bytes(row[0])
+
+    @staticmethod
+    def _delete(connection, keys):
+        connection.executemany('DELETE FROM page_cache_tags WHERE key = ?',
+                               [(key,) for key in keys])
+        connection.executemany('DELETE FROM page_cache WHERE key = ?',
+                               [(key,) for key in keys])
+
+    def set(self, key, body, tags, generation):
+        if len(body) > self.max_bytes:
+            return
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            current = connection.execute(
+                'SELECT generation FROM page_cache_generation').fetchone()[0]
+            if current != generation:
+                connection.execute('ROLLBACK')
+                return
+            self._delete(connection, [key])
+            connection.execute(
+                'INSERT INTO page_cache (key, body, size, accessed)'
+                ' VALUES (?, ?, ?, ?)', (key, body, len(body), time.time()))
+            connection.executemany(
+                'INSERT INTO page_cache_tags (tag, key) VALUES (?, ?)',
+                [(tag, key) for tag in set(tags)])
+            # Evict least recently used pages until under the size cap
+            total = connection.execute(
+                'SELECT coalesce(sum(size), 0) FROM page_cache').fetchone()[0]
+            while total > self.max_bytes:
+                oldest, size = connection.execute(
+                    'SELECT key, size FROM page_cache'
+                    ' ORDER BY accessed LIMIT 1').fetchone()
+                self._delete(connection, [oldest])
+                total -= size
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def invalidate(self, tags):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('UPDATE page_cache_generation'
+                               ' SET generation = generation + 1')
+            if ALL in tags:
+                connection.execute('DELETE FROM page_cache_tags')
+                connection.execute('DELETE FROM page_cache')
+            else:
+                placeholders = ', '.join('?' * len(tags))
+                keys = [row[0] for row in connection.execute(
+                    f'SELECT DISTINCT key FROM page_cache_tags'
+                    f' WHERE tag IN ({placeholders})', list(tags))]
+                self._delete(connection, keys)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def usage(self):
+        entries, size = self._connection().execute(
+            'SELECT count(*), coalesce(sum(size), 0) FROM page_cache'
+        ).fetchone()
+        return {'backend': 'sqlite', 'entries': entries, 'bytes': size,
+                'max_bytes': self.max_bytes}
+
+
+class PageCache:
+    """Rendered-page cache in front of a LRUBackend or SQLiteBackend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def invalidate(self, tags):
+        """Drop every cached page carrying one of `tags`."""
+        if tags:
+            self.backend.invalidate(set(tags))
+
+    def cached(self, tags):
+        """
+        Decorator caching the HTML of a GET view.
+
+        :param tags: Callable receiving the view arguments and returning
+        the tags of the rendered page.
+        """
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # Pages with pending flash messages are rendered per user
+                if request.method != 'GET' or session.get('_flashes'):
+                    return view(**kwargs)
+
+                key = request.full_path
+                body = self.backend.get(key)
+                with self._lock:
+                    if body is not None:
+                        self._hits[request.endpoint] += 1
+                    else:
+                        self._misses[request.endpoint] += 1
+                if body is not None:
+                    return Response(body, mimetype='text/html')
+
+                generation = self.backend.generation()
+                response = make_response(view(**kwargs))
+                if response.status_code == 200 and \
+                        response.mimetype == 'text/html':
+                    self.backend.set(key, response.get_data(),
+                                     list(tags(**kwargs)), generation)
+                return response
+
+            return wrapper
+
+        return decorator
+
+    def stats(self):
+        """Return per-route hit/miss counts and the backend usage."""
+        with self._lock:
+            routes = {}
+            for endpoint in set(self._hits) | set(self._misses):
+                hits, misses = self._hits[endpoint], self._misses[endpoint]
+                routes[endpoint] = {
+                    'hits': hits, 'misses': misses,
+                    'hit_rate': hits / (hits + misses)}
+            hits = sum(self._hits.values())
+            misses = sum(self._misses.values())
+        return {'routes': routes, 'hits': hits, 'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                **self.backend.usage()}
+
+
+def cached_page(tags):
+    """
+    Decorator for blueprint views, caching through the application's
+    PageCache (app.extensions['page_cache']) when one is configured.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            page_cache = current_app.extensions.get('page_cache')
+            if page_cache is None:
+                return view(**kwargs)
+            return page_cache.cached(tags)(view)(**kwargs)
+
+        return wrapper
+
+    return decorator
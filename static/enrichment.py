@@ -0,0 +1,54 @@
+"""
+Background enrichment of movies added by title.
+
+Adding a movie only stores a placeholder row (SQLiteDataManager
+add_pending_movie) and queues an ENRICH_MOVIE job; the job looks the
+title up on OMDb, fills in the director, year, rating, plot, poster and
+genres, and mirrors the poster. Lookups held back by the OMDb quota or
+circuit breaker are deferred without using up the job's attempts, and
+failed lookups are retried with the JobQueue's backoff; the movie stays
+'pending' meanwhile. Titles OMDb does not know fail at once, and the
+movie is marked 'failed'.
+"""
+from jobs import JobDeferred, JobFailed
+from static.library_import import movie_details
+from static.omdb_client import OMDbUnavailable
+
+ENRICH_MOVIE = 'enrich_movie'
+
+
+def register_enrichment(job_queue, data_manager, omdb_client,
+                        poster_store):
+    """Register the ENRICH_MOVIE job handler on a JobQueue."""
+
+    def enrich(payload):
+        try:
+            movie_data = omdb_client.fetch(payload['title'],
+                                           raise_errors=True)
+        except OMDbUnavailable as e:
+            # Until the quota has a token / the breaker probes again
+            raise JobDeferred(e.retry_after, str(e)) from e
+        if not movie_data:
+            raise JobFailed("Movie not found")
+        details = movie_details(movie_data)
+        if not details['director']:
+            raise JobFailed("Director not found")
+        # The placeholder may have been merged into the catalog movie
+        movie_id = data_manager.enrich_movie(payload['movie_id'], details)
+        if movie_id is None:
+            # Deleted before its details arrived
+            return
+        digest = poster_store.mirror(details['poster'])
+        if digest:
+            data_manager.set_poster_hash([movie_id], digest)
+
+    def give_up(payload, error):
+        data_manager.set_enrichment_status(payload['movie_id'], 'failed')
+
+    job_queue.register(ENRICH_MOVIE, enrich, on_dead=give_up)
+
+
+def enqueue_enrichment(job_queue, movie_id, title):
+    """Queue the OMDb lookup of a movie added by add_pending_movie."""
+    return job_queue.enqueue(ENRICH_MOVIE,
+                             {'movie_id': movie_id, 'title': title})
@@ -0,0 +1,205 @@
+import csv
+import io
+import json
+
+from jobs import JobDeferred
+from static.omdb_cache import cache_key
+from static.omdb_client import OMDbError, OMDbUnavailable
+
+# Job kind of the imports started from the web (see enqueue_import)
+IMPORT_LIBRARY = 'import_library'
+
+# Column names used for the title by the exports we accept
+# (Letterboxd uses "Name", IMDb lists use "Title" and carry "Const").
+TITLE_COLUMNS = ('title', 'Title', 'Name', 'name')
+IMDB_ID_COLUMNS = ('imdbID', 'imdb_id', 'Const', 'const')
+
+
+def read_titles(stream, filename=''):
+    """
+    Read the titles to import from a CSV or JSON export.
+
+    JSON may be a list of strings or of objects with a title or imdbID.
+    CSV files need a header with one of TITLE_COLUMNS or IMDB_ID_COLUMNS;
+    IMDb IDs are preferred over titles when both are present.
+
+    :param stream: Binary or text file object.
+    :param filename: Original file name, used to pick the format.
+    :return: A list of titles / IMDb IDs in file order.
+    """
+    text = stream.read()
+    if isinstance(text, bytes):
+        text = text.decode('utf-8-sig')
+
+    if filename.lower().endswith('.json') or text.lstrip().startswith('['):
+        entries = json.loads(text)
+        if isinstance(entries, dict):
+            entries = entries.get('titles') or entries.get('movies') or []
+        rows = [entry if isinstance(entry, dict) else {'title': entry}
+                for entry in entries]
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    titles = []
+    for row in rows:
+        value = next((row.get(column) for column in IMDB_ID_COLUMNS
+                      if row.get(column)), None) or \
+            next((row.get(column) for column in TITLE_COLUMNS
+                  if row.get(column)), None)
+        if value and str(value).strip():
+            titles.append(str(value).strip())
+    return titles
+
+
+def split_genres(value):
+    """Split OMDb's comma-separated Genre field into a list of names."""
+    if not value or value == 'N/A':
+        return []
+    return [genre.strip() for genre in value.split(',') if genre.strip()]
+
+
+def movie_details(movie_data):
+    """
+    Map an OMDb response to the movie dict taken by
+    SQLiteDataManager.bulk_add_movies and enrich_movie; the director is
+    None when OMDb does not know it.
+    """
+    director_name = movie_data.get('Director')
+    return {
+        'imdb_id': movie_data.get('imdbID'),
+        'title': movie_data.get('Title'),
+        'director': director_name if director_name != 'N/A' else None,
+        'year': movie_data.get('Year'),
+        'rating': movie_data.get('imdbRating'),
+        'poster': movie_data.get('Poster'),
+        'plot': movie_data.get('Plot'),
+        'genres': split_genres(movie_data.get('Genre')),
+    }
+
+
+def import_library(data_manager, omdb_client, user_id, titles,
+                   chunk_size=200, progress=None, report=None):
+    """
+    Resolve titles on OMDb concurrently and bulk insert the found movies.
+
+    IMDb IDs the catalog already has are linked to the library directly,
+    without an OMDb lookup. Titles whose lookup the OMDb quota or circuit
+    breaker held back are not failures: they are returned as 'deferred',
+    for the caller to import once OMDbClient.retry_after has passed.
+
+    :param data_manager: SQLiteDataManager to write to.
+    :param omdb_client: OMDbClient used for the lookups.
+    :param user_id: ID of the user whose library is extended.
+    :param titles: List of titles / IMDb IDs.
+    :param chunk_size: Titles resolved and inserted per round.
+    :param progress: Optional callable receiving the report so far after
+    each round.
+    :param report: Report of an earlier call to continue, `titles` being
+    its deferred titles.
+    :return: A dict with the total, the number of titles done and
+    imported, a list of {'title', 'error'} failures ("Movie not found"
+    when OMDb does not know the title, otherwise why the lookup failed)
+    and the list of deferred titles.
+    """
+    if report is None:
+        report = {'total': len(titles), 'done': 0, 'imported': 0,
+                  'failures': []}
+    report['deferred'] = []
+    for start in range(0, len(titles), chunk_size):
+        chunk = titles[start:start + chunk_size]
+        handled = len(chunk)
+        imdb_ids = {title: cache_key(title)[len('imdb:'):]
+                    for title in chunk
+                    if cache_key(title).startswith('imdb:')}
+        known = data_manager.get_movie_ids_by_imdb_id(imdb_ids.values())
+        if known:
+            report['imported'] += data_manager.add_user_movies(
+                user_id, [known[imdb_ids[title]] for title in chunk
+                          if imdb_ids.get(title) in known])
+        chunk = [title for title in chunk if imdb_ids.get(title) not in known]
+        resolved = omdb_client.fetch_many(chunk, return_errors=True)
+
+        movies = []
+        for title in chunk:
+            movie_data = resolved.get(title)
+            if isinstance(movie_data, OMDbUnavailable):
+                report['deferred'].append(title)
+                handled -= 1
+                continue
+            if isinstance(movie_data, OMDbError):
+                report['failures'].append({'title': title,
+                                           'error': str(movie_data)})
+                continue
+            if not movie_data:
+                report['failures'].append({'title': title,
+                                           'error': 'Movie not found'})
+                continue
+            details = movie_details(movie_data)
+            if not details['director']:
+                report['failures'].append({'title': title,
+                                           'error': 'Director not found'})
+                continue
+            movies.append(details)
+
+        if movies:
+            report['imported'] += len(
+                data_manager.bulk_add_movies(user_id, movies))
+        report['done'] += handled
+        if progress:
+            progress(report)
+
+    return report
+
+
+def register_import(job_queue, data_manager, omdb_client):
+    """
+    Register the IMPORT_LIBRARY job handler on a JobQueue; it runs
+    import_library and stores its progress on the import's
+    LibraryImport row. Titles held back by the OMDb quota or circuit
+    breaker are imported by the same job, deferred until lookups may go
+    out again, without using up its attempts.
+    """
+
+    def run_import(payload):
+        import_id = payload['import_id']
+
+        def progress(report):
+            data_manager.update_library_import(
+                import_id, done=report['done'], imported=report['imported'],
+                failures=report['failures'])
+
+        data_manager.update_library_import(import_id, status='running')
+        report = import_library(data_manager, omdb_client,
+                                payload['user_id'], payload['titles'],
+                                progress=progress,
+                                report=payload.get('report'))
+        if report['deferred']:
+            data_manager.update_library_import(import_id, status='waiting')
+            raise JobDeferred(
+                omdb_client.retry_after(),
+                f"{len(report['deferred'])} titles waiting for OMDb",
+                payload=dict(payload, titles=report['deferred'],
+                             report=report))
+        data_manager.update_library_import(
+            import_id, status='done', done=report['done'],
+            imported=report['imported'], failures=report['failures'])
+
+    def give_up(payload, error):
+        data_manager.update_library_import(payload['import_id'],
+                                           status='failed')
+
+    job_queue.register(IMPORT_LIBRARY, run_import, on_dead=give_up)
+
+
+def enqueue_import(job_queue, data_manager, user_id, titles):
+    """
+    Queue the import of titles into a user's library.
+
+    :return: The ID of the import, whose progress get_library_import
+    reports.
+    """
+    import_id = data_manager.add_library_import(user_id, len(titles))
+    job_queue.enqueue(IMPORT_LIBRARY, {'import_id': import_id,
+                                       'user_id': user_id,
+                                       'titles': titles})
+    return import_id
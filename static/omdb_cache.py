@@ -0,0 +1,189 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from datamanager.sqlite_engine import LocalConnections
+
+# Returned by OMDbCache.get when nothing (not even a negative entry) is
+# cached for the lookup.
+MISS = object()
+
+_IMDB_ID = re.compile(r'^tt\d+$')
+
+
+def cache_key(title):
+    """
+    Normalize a lookup into a cache key.
+
+    IMDb IDs ("tt1375666") are keyed as such, titles are case-folded and
+    whitespace-collapsed so "  the  Matrix" and "The Matrix" share an entry.
+    """
+    normalized = ' '.join(str(title).split()).casefold()
+    if _IMDB_ID.match(normalized):
+        return f'imdb:{normalized}'
+    return f'title:{normalized}'
+
+
+class OMDbCache:
+    """
+    Two-tier cache for OMDb responses.
+
+    Lookups hit a per-process LRU first and then an on-disk SQLite table
+    that is shared by every worker using the same file. Successful
+    responses are stored under both the requested title and the movie's
+    imdbID; "Movie not found" answers are cached as None for a shorter
+    negative TTL. Expired entries are kept until purge_expired (or LRU
+    eviction) so get_stale can answer when OMDb is unavailable.
+    """
+
+    def __init__(self, db_file_name=None, max_entries=1024,
+                 ttl=7 * 24 * 3600, negative_ttl=3600):
+        """
+        :param db_file_name: SQLite file for the shared tier, or None to
+        keep the cache in memory only.
+        :param max_entries: Size of the in-memory LRU tier.
+        :param ttl: Seconds a found movie stays cached.
+        :param negative_ttl: Seconds a "not found" answer stays cached.
+        """
+        self.db_file_name = db_file_name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Opened on first use, per thread and process
+        self._connections = LocalConnections(
+            db_file_name,
+            'CREATE TABLE IF NOT EXISTS omdb_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' payload TEXT,'
+            ' expires_at REAL NOT NULL)') if db_file_name else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def _connection(self):
+        return self._connections.get()
+
+    def _remember(self, key, data, expires_at):
+        with self._lock:
+            self._memory[key] = (data, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, title):
+        """
+        Look up a title or IMDb ID.
+
+        :return: The cached response dict, None for a cached "not found",
+        or MISS when the lookup has to go to OMDb.
+        """
+        key = cache_key(title)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    if entry[0] is None:
+                        self.negative_hits += 1
+                    return entry[0]
+
+        if self.db_file_name:
+            row = self._connection().execute(
+                'SELECT payload, expires_at FROM omdb_cache WHERE key = ?',
+                (key,)).fetchone()
+            if row and row[1] > now:
+                data = json.loads(row[0]) if row[0] is not None else None
+                self._remember(key, data, row[1])
+                with self._lock:
+                    self.disk_hits += 1
+                    if data is None:
+                        self.negative_hits += 1
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return MISS
+
+    def get_stale(self, title):
+        """
+        Look up a title or IMDb ID, expired entries included.
+
+        :return: The cached response dict, None for a cached "not found",
+        or MISS when nothing is stored for the lookup.
+        """
+        key = cache_key(title)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self.stale_hits += 1
+                return entry[0]
+
+        if self.db_file_name:
+            row = self._connection().execute(
+                'SELECT payload FROM omdb_cache WHERE key = ?',
+                (key,)).fetchone()
+            if row:
+                with self._lock:
+                    self.stale_hits += 1
+                return json.loads(row[0]) if row[0] is not None else None
+        return MISS
+
+    def set(self, title, data):
+        """
+        Store an OMDb answer for a title.
+
+        :param title: The title (or IMDb ID) that was looked up.
+        :param data: The response dict, or None for "not found".
+        """
+        if data is None:
+            expires_at = time.time() + self.negative_ttl
+            keys = [cache_key(title)]
+        else:
+            expires_at = time.time() + self.ttl
+            keys = [cache_key(title)]
+            if data.get('imdbID'):
+                keys.append(cache_key(data['imdbID']))
+
+        for key in keys:
+            self._remember(key, data, expires_at)
+        if self.db_file_name:
+            payload = json.dumps(data) if data is not None else None
+            self._connection().executemany(
+                'INSERT OR REPLACE INTO omdb_cache (key, payload, expires_at)'
+                ' VALUES (?, ?, ?)',
+                [(key, payload, expires_at) for key in keys])
+
+    def purge_expired(self):
+        """Drop expired entries from both tiers."""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, entry in self._memory.items()
+                        if entry[1] <= now]:
+                del self._memory[key]
+        if self.db_file_name:
+            self._connection().execute(
+                'DELETE FROM omdb_cache WHERE expires_at <= ?', (now,))
+
+    def stats(self):
+        """Return the hit/miss counters and the size of the memory tier."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+            }
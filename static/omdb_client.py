@@ -0,0 +1,333 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from static.omdb_cache import MISS, cache_key
+from static.omdb_guard import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Counted by OMDbClient.stats and reported to its event listeners
+EVENTS = ('coalesced', 'throttled', 'short_circuited', 'stale_served',
+          'circuit_open', 'circuit_half_open', 'circuit_closed')
+
+
+class OMDbError(Exception):
+    """OMDb could not be reached or refused the lookup."""
+
+
+class OMDbUnavailable(OMDbError):
+    """The lookup was not sent: the daily quota is used up or the circuit
+    breaker is open. `retry_after` is the number of seconds until a
+    lookup may go out again."""
+
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Unavailable:
+    """
+    Result of fetch(raise_errors=False) for a lookup held back by the
+    quota or the circuit breaker. It is falsy like the None of a movie
+    OMDb does not know, but tells the two apart and keeps the reason.
+    """
+
+    def __init__(self, error):
+        self.reason = str(error)
+        self.retry_after = error.retry_after
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f'Unavailable({self.reason!r})'
+
+
+class OMDbClient:
+    """
+    Client for the OMDb API.
+
+    Keeps one pooled keep-alive session, bounds every request with
+    connect/read timeouts, retries transient failures with exponential
+    backoff and can resolve many titles concurrently with fetch_many.
+
+    Concurrent lookups of the same title share one request. An optional
+    TokenBucket keeps the requests within the key's quota and an optional
+    CircuitBreaker stops sending them while OMDb is failing or slow (see
+    static.omdb_guard); lookups that could not get a fresh answer are
+    served from expired cache entries when there are any.
+    """
+
+    def __init__(self, api_key, base_url='http://www.omdbapi.com/',
+                 cache=None, connect_timeout=3.05, read_timeout=10,
+                 retries=2, backoff_factor=0.3, pool_size=16,
+                 max_workers=8, quota=None, circuit_breaker=None):
+        """
+        :param api_key: OMDb API key.
+        :param base_url: OMDb endpoint (overridable for stub servers).
+        :param cache: Optional OMDbCache consulted before each request.
+        :param connect_timeout: Seconds to wait for the TCP/TLS connect.
+        :param read_timeout: Seconds to wait for the response.
+        :param retries: Retries for connection errors and 429/5xx answers.
+        :param backoff_factor: Base of the exponential retry backoff.
+        :param pool_size: Keep-alive connections kept open to OMDb.
+        :param max_workers: Default concurrency of fetch_many.
+        :param quota: Optional TokenBucket taken a token from per request.
+        :param circuit_breaker: Optional CircuitBreaker guarding the
+        requests.
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.cache = cache
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_workers = max_workers
+        self.quota = quota
+        self.circuit_breaker = circuit_breaker
+
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._request_listeners = []
+        self._event_listeners = []
+        self._flights = SingleFlight(
+            on_shared=lambda key: self._event('coalesced'))
+        self._events = dict.fromkeys(EVENTS, 0)
+        self._events_lock = threading.Lock()
+        if circuit_breaker is not None:
+            circuit_breaker.add_state_listener(
+                lambda state: self._event(f'circuit_{state}'))
+        # Threads of fetch_async, started on demand
+        self._async_executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix='omdb')
+
+    def add_request_listener(self, listener):
+        """
+        Register a callable notified after every call to the OMDb API
+        (cache hits are not reported) with the latency in seconds and the
+        outcome: "found", "not_found" or "error".
+        """
+        self._request_listeners.append(listener)
+
+    def add_event_listener(self, listener):
+        """
+        Register a callable notified with the name of every event of
+        EVENTS: lookups sharing another caller's request ("coalesced"),
+        not sent because of the quota ("throttled") or the open circuit
+        breaker ("short_circuited"), answered from an expired cache entry
+        ("stale_served"), and circuit breaker transitions.
+        """
+        self._event_listeners.append(listener)
+
+    def _event(self, name):
+        with self._events_lock:
+            self._events[name] += 1
+        for listener in self._event_listeners:
+            listener(name)
+
+    def _report(self, started, outcome):
+        elapsed = time.perf_counter() - started
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(outcome != 'error', elapsed)
+        for listener in self._request_listeners:
+            listener(elapsed, outcome)
+
+    def stats(self):
+        """Return the event counters, the circuit breaker state and the
+        quota tokens left."""
+        with self._events_lock:
+            stats = dict(self._events)
+        stats['in_flight'] = self._flights.in_flight()
+        stats['circuit_state'] = self.circuit_breaker.state \
+            if self.circuit_breaker is not None else None
+        stats['quota_available'] = self.quota.available() \
+            if self.quota is not None else None
+        return stats
+
+    def _request(self, title):
+        params = {'apikey': self.api_key}
+        if cache_key(title).startswith('imdb:'):
+            params['i'] = title.strip()
+        else:
+            params['t'] = title
+        response = self.session.get(self.base_url, params=params,
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch(self, title, raise_errors=False):
+        """
+        Look up a movie by title or IMDb ID.
+
+        :param title: Title (or IMDb ID) to look up.
+        :param raise_errors: Raise OMDbError when OMDb cannot be reached
+        or answers with an error other than "not found" (e.g. its request
+        limit), or OMDbUnavailable when the lookup was held back, instead
+        of returning None or Unavailable, so callers can retry later.
+        Either way an expired cache entry is returned instead when there
+        is one.
+        :return: The OMDb response dict, None if the movie was not found
+        or OMDb could not be reached, or an Unavailable (falsy) if the
+        quota or the circuit breaker held the lookup back.
+        """
+        if self.cache is not None:
+            cached = self.cache.get(title)
+            if cached is not MISS:
+                return cached
+
+        try:
+            return self._flights.run(cache_key(title), self._lookup, title)
+        except OMDbUnavailable as e:
+            if raise_errors:
+                raise
+            return Unavailable(e)
+        except OMDbError:
+            if raise_errors:
+                raise
+            return None
+
+    def retry_after(self):
+        """Seconds until a lookup may go out: until the quota has a token
+        and the circuit breaker lets calls through (0 if now)."""
+        waits = [0.0]
+        if self.quota is not None:
+            waits.append(self.quota.wait_time())
+        if self.circuit_breaker is not None:
+            waits.append(self.circuit_breaker.retry_after())
+        return max(waits)
+
+    def _lookup(self, title):
+        """
+        Request a title from OMDb, unless the circuit breaker or the quota
+        hold it back, falling back on the expired cache entry.
+
+        :raise OMDbError: When neither OMDb nor the cache could answer.
+        """
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow():
+            self._event('short_circuited')
+            return self._stale(title, OMDbUnavailable(
+                f"OMDb lookup of {title!r} skipped: circuit breaker open",
+                breaker.retry_after()))
+        if self.quota is not None and not self.quota.acquire():
+            if breaker is not None:
+                breaker.release()
+            self._event('throttled')
+            return self._stale(title, OMDbUnavailable(
+                f"OMDb lookup of {title!r} skipped: daily quota used up",
+                self.quota.wait_time()))
+
+        started = time.perf_counter()
+        try:
+            data = self._request(title)
+        except (requests.RequestException, ValueError) as e:
+            self._report(started, 'error')
+            logger.warning("OMDb lookup of %r failed: %s", title, e)
+            error = OMDbError(f"OMDb lookup of {title!r} failed: {e}")
+            error.__cause__ = e
+            return self._stale(title, error)
+
+        if data.get('Response') == 'True':
+            self._report(started, 'found')
+            if self.cache is not None:
+                self.cache.set(title, data)
+            return data
+
+        self._report(started, 'not_found')
+        logger.info("OMDb lookup of %r: %s", title, data.get('Error'))
+        if data.get('Error') == 'Movie not found!':
+            if self.cache is not None:
+                self.cache.set(title, None)
+            return None
+        return self._stale(title, OMDbError(
+            data.get('Error') or 'Unexpected OMDb response'))
+
+    def _stale(self, title, error):
+        stale = self.cache.get_stale(title) \
+            if self.cache is not None else MISS
+        if stale is MISS:
+            raise error
+        self._event('stale_served')
+        return stale
+
+    def fetch_many(self, titles, max_workers=None, return_errors=False):
+        """
+        Resolve many titles concurrently through a bounded thread pool.
+
+        Duplicate titles are only looked up once.
+
+        :param titles: Iterable of titles (or IMDb IDs).
+        :param max_workers: Concurrency, defaults to the client setting.
+        :param return_errors: Map the titles whose lookup failed to the
+        OMDbError that fetch(raise_errors=True) raised for them, so only
+        titles OMDb does not know map to None.
+        :return: A dict mapping each title to its response dict, None or
+        Unavailable (see fetch).
+        """
+        unique_titles = list(dict.fromkeys(titles))
+        if not unique_titles:
+            return {}
+
+        def fetch(title):
+            if not return_errors:
+                return self.fetch(title)
+            try:
+                return self.fetch(title, raise_errors=True)
+            except OMDbError as e:
+                return e
+
+        workers = min(max_workers or self.max_workers, len(unique_titles))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(fetch, unique_titles)
+            return dict(zip(unique_titles, results))
+
+    async def fetch_async(self, title, raise_errors=False):
+        """
+        Coroutine counterpart of fetch, for asyncio callers.
+
+        This is not native async I/O: the blocking lookup (requests
+        session, SQLite cache tier, retries, quota and circuit breaker)
+        runs on one of the client's threads, at most as many as pooled
+        connections. The event loop keeps serving other requests
+        meanwhile, but every lookup in flight still holds a thread for
+        its whole OMDb round trip, and lookups beyond pool_size wait for
+        one. Sharing the threaded client keeps the coalescing, quota and
+        breaker state common to sync and async callers.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._async_executor, self.fetch, title, raise_errors)
+
+    async def fetch_many_async(self, titles, max_workers=None):
+        """
+        Coroutine counterpart of fetch_many: at most `max_workers` (the
+        client setting by default) lookups in flight at once, each on a
+        thread (see fetch_async).
+
+        :return: A dict mapping each title to its response dict, None or
+        Unavailable.
+        """
+        unique_titles = list(dict.fromkeys(titles))
+        in_flight = asyncio.Semaphore(max_workers or self.max_workers)
+
+        async def fetch(title):
+            async with in_flight:
+                return await self.fetch_async(title)
+
+        results = await asyncio.gather(*map(fetch, unique_titles))
+        return dict(zip(unique_titles, results))
+
+    def close(self):
+        """Close the pooled connections."""
+        self._async_executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,225 @@
+"""
+Protection of the OMDb API and of the requests waiting on it, used by
+OMDbClient:
+
+* SingleFlight: concurrent lookups of the same title share one upstream
+  call instead of each sending its own;
+* TokenBucket: keeps the lookups of all threads within the API key's
+  daily quota;
+* CircuitBreaker: stops calling OMDb for a while when too many calls
+  fail or are slow, so lookups fail fast (or are answered from stale
+  cache entries) instead of waiting on timeouts.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class SingleFlight:
+    """Runs one call per key at a time, sharing its outcome with the
+    callers that asked for the same key meanwhile."""
+
+    def __init__(self, on_shared=None):
+        """
+        :param on_shared: Optional callable notified (with the key) every
+        time a caller waits for another caller's call.
+        """
+        self.on_shared = on_shared
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, function, *args):
+        """
+        Call `function(*args)`, or wait for the call already running for
+        `key` and return (or raise) its outcome.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            if self.on_shared is not None:
+                self.on_shared(key)
+            return future.result()
+
+        try:
+            result = function(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `capacity` tokens, refilled continuously at
+    `rate` tokens per second.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def daily(cls, quota, burst):
+        """
+        Bucket for a quota of `quota` calls per day: up to `burst` calls at
+        once, refilled so that a full bucket plus a day of refill never
+        exceeds the quota.
+        """
+        if not 0 < burst < quota:
+            raise ValueError(
+                f"The burst ({burst}) must be positive and below the daily "
+                f"quota ({quota})")
+        return cls((quota - burst) / 86400, burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take a token if one is left; never waits."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return int(self._tokens)
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is now)."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                return 0.0
+            if not self.rate:
+                return float('inf')
+            return (1 - self._tokens) / self.rate
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker over the outcomes of the last `window`
+    calls.
+
+    Once at least `min_calls` were recorded, the breaker opens when the
+    share of failed calls (errors, and calls slower than `slow_call_seconds`)
+    reaches `failure_rate`. It stays open `reset_seconds`, then lets a
+    single probe call through: the breaker closes if it succeeds and opens
+    again otherwise.
+    """
+
+    def __init__(self, window=20, min_calls=10, failure_rate=0.5,
+                 slow_call_seconds=5.0, reset_seconds=30.0):
+        """
+        :param window: Number of recent calls the failure rate is taken
+        over.
+        :param min_calls: Calls needed before the breaker can open.
+        :param failure_rate: Share of failed calls opening the breaker.
+        :param slow_call_seconds: Calls taking longer count as failed
+        (None to only count errors).
+        :param reset_seconds: Time the breaker stays open before probing.
+        """
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def add_state_listener(self, listener):
+        """Register a callable notified with the new state on every
+        transition."""
+        self._listeners.append(listener)
+
+    def _transition(self, state):
+        # Called with the lock held; listeners must not call back
+        self.state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        self._probing = False
+        self._outcomes.clear()
+        for listener in self._listeners:
+            listener(state)
+
+    def allow(self):
+        """
+        Whether a call may go out now. In the half-open state only one
+        probe is let through; pass its outcome to record (or call release
+        if it was not sent after all).
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def retry_after(self):
+        """Seconds until the open breaker lets a probe through (0 when
+        calls may go out now or a probe is on its way)."""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_seconds -
+                       time.monotonic())
+
+    def release(self):
+        """Give back a probe allowed by allow() but never sent."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok, seconds):
+        """
+        Record the outcome of a call allowed by allow().
+
+        :param ok: False when the call failed.
+        :param seconds: Latency of the call.
+        """
+        failed = not ok or (self.slow_call_seconds is not None and
+                            seconds > self.slow_call_seconds)
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(OPEN if failed else CLOSED)
+                return
+            if self.state == OPEN:
+                # A call allowed before the breaker opened
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) >= \
+                    self.failure_rate * len(self._outcomes):
+                self._transition(OPEN)
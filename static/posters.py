@@ -0,0 +1,130 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+
+import requests
+from PIL import Image
+
+# Thumbnail widths generated for every poster, each as WebP and JPEG
+THUMBNAIL_WIDTHS = (92, 185, 342)
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+logger = logging.getLogger(__name__)
+
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+_VARIANT = re.compile(r'^(original|w\d+\.(webp|jpg))$')
+
+
+class PosterStore:
+    """
+    Content-addressed local mirror of poster images.
+
+    A poster is downloaded once, stored under the SHA-256 of its bytes and
+    resized into THUMBNAIL_WIDTHS. Because the digest names the content,
+    files never change and can be served with immutable cache headers.
+    """
+
+    def __init__(self, root_dir, widths=THUMBNAIL_WIDTHS, timeout=(3.05, 15),
+                 max_bytes=10 * 1024 * 1024):
+        """
+        :param root_dir: Directory the posters are stored in.
+        :param widths: Thumbnail widths to generate.
+        :param timeout: (connect, read) timeout of the downloads.
+        :param max_bytes: Largest image accepted.
+        """
+        self.root_dir = root_dir
+        self.widths = widths
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+
+    def directory(self, digest):
+        return os.path.join(self.root_dir, digest[:2], digest)
+
+    def path(self, digest, variant):
+        """
+        Return the file path of a stored variant ("original",
+        "w185.webp", ...), or None if the names are not valid.
+        """
+        if not _DIGEST.match(digest) or not _VARIANT.match(variant):
+            return None
+        return os.path.join(self.directory(digest), variant)
+
+    @staticmethod
+    def mimetype(path):
+        """Return the MIME type of a stored file."""
+        if path.endswith('.webp'):
+            return 'image/webp'
+        if path.endswith('.jpg'):
+            return 'image/jpeg'
+        with Image.open(path) as image:
+            return image.get_format_mimetype()
+
+    def variants(self):
+        """Return the thumbnail file names generated for each poster."""
+        return [f'w{width}.{extension}' for width in self.widths
+                for extension in FORMATS]
+
+    def mirror(self, url):
+        """
+        Download a poster and store it with its thumbnails.
+
+        :param url: Poster URL (OMDb's "N/A" and empty values are skipped).
+        :return: The poster's digest, or None if it could not be mirrored.
+        """
+        if not url or url == 'N/A':
+            return None
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning("Error downloading poster %s: %s", url, e)
+            return None
+        if len(response.content) > self.max_bytes:
+            logger.warning("Poster %s exceeds %d bytes", url, self.max_bytes)
+            return None
+        return self.store(response.content)
+
+    def store(self, data):
+        """
+        Store image bytes and their thumbnails.
+
+        :return: The digest, or None if the bytes are not a readable image.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        directory = self.directory(digest)
+        if all(os.path.exists(os.path.join(directory, name))
+               for name in ['original'] + self.variants()):
+            return digest
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        except (OSError, Image.DecompressionBombError) as e:
+            logger.warning("Poster is not a readable image: %s", e)
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        self._write(os.path.join(directory, 'original'), data)
+        image = image.convert('RGB')
+        for width in self.widths:
+            height = max(1, round(image.height * width / image.width))
+            thumbnail = image.resize((width, height), Image.LANCZOS)
+            for extension, image_format in FORMATS.items():
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, image_format, quality=82)
+                self._write(os.path.join(directory, f'w{width}.{extension}'),
+                            buffer.getvalue())
+        return digest
+
+    @staticmethod
+    def _write(path, data):
+        # Write to a temporary name first so concurrent readers never see
+        # a partial file
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
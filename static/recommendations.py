@@ -0,0 +1,325 @@
+"""
+"Similar movies" from the review ratings (item-item collaborative
+filtering).
+
+Every movie is a vector of its reviewers' ratings, centred on the movie's
+mean rating, and two movies are as similar as the cosine of their
+vectors. The TOP_K most similar movies of each movie are stored in
+movie_similarities (SQLiteDataManager.replace_similarities), so the movie
+page reads them with one indexed lookup.
+
+The review write methods log the movies whose ratings changed. With
+item-mean centring only the similarities involving one of them move, and
+the rows of the changed movies hold all of those. refresh_similarities
+recomputes the changed movies and merges their new scores into the
+stored lists of the other movies, recomputing only the lists that may now
+let in a movie they left out (see _patch_neighbours). A refresh that
+would recompute more than FULL_REFRESH_SHARE of the movies recomputes
+them all instead. Either way every review is read to build the rating
+matrix, since the similarities need the whole vectors of the co-rated
+movies: the incremental refresh saves the neighbour computations and the
+writes, not the read.
+
+The similarities are computed with sparse NumPy/SciPy matrix products
+when both are installed, and with plain Python dictionaries otherwise
+(fine for small databases).
+"""
+import heapq
+import itertools
+import time
+from collections import defaultdict, namedtuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+# Whether the NumPy/SciPy backend can be used (see requirements-optional.txt)
+SPARSE_AVAILABLE = sparse is not None
+
+# Neighbours stored per movie
+TOP_K = 20
+
+# Similarities are rounded to this many decimals, so that rounding noise
+# does not decide between equally similar movies
+SCORE_DECIMALS = 12
+
+# Similarities at or below this are not worth listing
+MIN_SCORE = 1e-9
+
+# An incremental refresh recomputing more than this share of the reviewed
+# movies recomputes all of them, which then costs about the same
+FULL_REFRESH_SHARE = 0.5
+
+RefreshResult = namedtuple('RefreshResult', ['movies', 'patched',
+                                             'neighbours', 'seconds',
+                                             'backend'])
+
+
+class _SparseRatings:
+    """The movie x user rating matrix as SciPy CSR matrices."""
+
+    backend = 'numpy'
+
+    def __init__(self, ratings, block_size=256):
+        # At most 512 movies per block, so that the sort key of
+        # top_neighbours (below 2 ** 11) still tells rounded scores apart
+        self.block_size = block_size
+        table = np.fromiter(itertools.chain.from_iterable(ratings),
+                            dtype=np.float64).reshape(-1, 3)
+        users = table[:, 0].astype(np.int64)
+        movies = table[:, 1].astype(np.int64)
+        width = int(users.max()) + 1 if len(users) else 1
+
+        # One value per (movie, user): the mean of repeated reviews
+        pairs, inverse = np.unique(movies * width + users,
+                                   return_inverse=True)
+        values = (np.bincount(inverse, weights=table[:, 2])
+                  / np.bincount(inverse))
+        movies, users = pairs // width, pairs % width
+        height = int(movies.max()) + 1 if len(movies) else 1
+        means = (np.bincount(movies, weights=values, minlength=height)
+                 / np.maximum(np.bincount(movies, minlength=height), 1))
+
+        # Explicit zeros (ratings equal to the mean) are kept, so the
+        # structure still tells which users reviewed which movies
+        self.matrix = sparse.csr_matrix(
+            (values - means[movies], (movies, users)), shape=(height, width))
+        self.by_user = self.matrix.T.tocsr()
+        norms = np.sqrt(np.asarray(
+            self.matrix.multiply(self.matrix).sum(axis=1)).ravel())
+        inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms),
+                                  where=norms > 0)
+        self.normalized = (sparse.diags(inverse_norms)
+                           @ self.matrix).tocsr()
+        self.normalized_by_user = self.normalized.T.tocsr()
+
+    def _rows(self, movie_ids):
+        return np.array([movie_id for movie_id in movie_ids
+                         if 0 <= movie_id < self.matrix.shape[0]],
+                        dtype=np.int64)
+
+    def movie_ids(self):
+        """The IDs of every reviewed movie."""
+        return set(np.flatnonzero(np.diff(self.matrix.indptr)).tolist())
+
+    def _similarities(self, movie_ids):
+        """
+        Yield the positive similarities of `movie_ids` to every other
+        movie, `block_size` movies per sparse matrix product, as arrays
+        (block of movie IDs, position in the block, similar movie IDs,
+        scores) grouped by position.
+        """
+        rows = np.sort(self._rows(movie_ids))
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            scores = self.normalized[block] @ self.normalized_by_user
+            positions = np.repeat(np.arange(len(block)),
+                                  np.diff(scores.indptr))
+            values = np.round(scores.data, SCORE_DECIMALS)
+            keep = (values > MIN_SCORE) & (scores.indices != block[positions])
+            yield (block, positions[keep], scores.indices[keep],
+                   values[keep])
+
+    def scores_with(self, movie_ids):
+        """
+        Map every movie similar to any of `movie_ids` to its similarities
+        with them ({movie ID: score}).
+        """
+        scores = defaultdict(dict)
+        for block, positions, similar, values in self._similarities(
+                movie_ids):
+            for movie_id, other_id, score in zip(
+                    block[positions].tolist(), similar.tolist(),
+                    values.tolist()):
+                scores[other_id][movie_id] = score
+        return scores
+
+    def top_neighbours(self, movie_ids, top_k=TOP_K):
+        """
+        Compute the `top_k` most similar movies of each of `movie_ids`,
+        equal scores listing the lower movie ID first.
+
+        :return: A list of (movie ID, similar movie ID, score) tuples.
+        """
+        neighbours = []
+        for block, positions, similar, values in self._similarities(
+                movie_ids):
+            if not len(values):
+                continue
+            # The top_k-th score of each movie, from one (unstable) sort:
+            # scores are at most 1, so the movies' key ranges are apart
+            order = np.argsort(positions * 4.0 - values)
+            counts = np.bincount(positions, minlength=len(block))
+            starts = np.cumsum(counts) - counts
+            last = starts + np.minimum(counts, top_k) - 1
+            cutoff = values[order][np.maximum(last, 0)]
+            # Everything scoring that much, ties included, sorted exactly
+            chosen = values >= cutoff[positions]
+            positions, similar = positions[chosen], similar[chosen]
+            values = values[chosen]
+            order = np.lexsort((similar, -values, positions))
+            positions, similar = positions[order], similar[order]
+            values = values[order]
+            counts = np.bincount(positions, minlength=len(block))
+            ranks = np.arange(len(positions)) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            best = ranks < top_k
+            neighbours.extend(zip(block[positions[best]].tolist(),
+                                  similar[best].tolist(),
+                                  values[best].tolist()))
+        return neighbours
+
+
+class _PythonRatings:
+    """The same computations as _SparseRatings over dictionaries."""
+
+    backend = 'python'
+
+    def __init__(self, ratings):
+        totals = defaultdict(lambda: [0.0, 0])
+        for user_id, movie_id, rating in ratings:
+            total = totals[movie_id, user_id]
+            total[0] += rating
+            total[1] += 1
+
+        by_movie = defaultdict(dict)
+        for (movie_id, user_id), (rating_sum, count) in totals.items():
+            by_movie[movie_id][user_id] = rating_sum / count
+
+        self.by_movie = {}
+        self.by_user = defaultdict(dict)
+        self.norms = {}
+        for movie_id, ratings_by_user in by_movie.items():
+            mean = sum(ratings_by_user.values()) / len(ratings_by_user)
+            centred = {user_id: rating - mean
+                       for user_id, rating in ratings_by_user.items()}
+            self.by_movie[movie_id] = centred
+            for user_id, value in centred.items():
+                self.by_user[user_id][movie_id] = value
+            self.norms[movie_id] = sum(
+                value * value for value in centred.values()) ** 0.5
+
+    def movie_ids(self):
+        return set(self.by_movie)
+
+    def _similarities(self, movie_id):
+        """Yield (other movie ID, similarity) for the co-rated movies."""
+        norm = self.norms.get(movie_id)
+        if not norm:
+            return
+        dots = defaultdict(float)
+        for user_id, value in self.by_movie[movie_id].items():
+            for other_id, other_value in self.by_user[user_id].items():
+                dots[other_id] += value * other_value
+        for other_id, dot in dots.items():
+            if other_id != movie_id and self.norms[other_id]:
+                yield other_id, round(dot / (norm * self.norms[other_id]),
+                                      SCORE_DECIMALS)
+
+    def scores_with(self, movie_ids):
+        scores = defaultdict(dict)
+        for movie_id in movie_ids:
+            for other_id, score in self._similarities(movie_id):
+                if score > MIN_SCORE:
+                    scores[other_id][movie_id] = score
+        return scores
+
+    def top_neighbours(self, movie_ids, top_k=TOP_K):
+        neighbours = []
+        for movie_id in sorted(movie_ids):
+            neighbours.extend(
+                (movie_id, other_id, score) for other_id, score in
+                heapq.nlargest(top_k, self._similarities(movie_id),
+                               key=lambda item: (item[1], -item[0]))
+                if score > MIN_SCORE)
+        return neighbours
+
+
+def rating_matrix(ratings):
+    """
+    Load (user ID, movie ID, rating) rows into the fastest available
+    implementation.
+    """
+    if np is not None:
+        return _SparseRatings(ratings)
+    return _PythonRatings(ratings)
+
+
+def refresh_similarities(data_manager, full=False, top_k=TOP_K):
+    """
+    Bring movie_similarities up to date with the reviews.
+
+    :param data_manager: The SQLiteDataManager to read and store through.
+    :param full: Recompute every movie instead of only those affected by
+    the logged rating changes.
+    :param top_k: Neighbours stored per movie.
+    :return: A RefreshResult with the number of movies recomputed, of
+    stored lists updated in place and of neighbours stored.
+    """
+    started = time.perf_counter()
+    last_change_id, changed = data_manager.get_similarity_changes()
+    if not full and not changed:
+        return RefreshResult(0, 0, 0, time.perf_counter() - started, None)
+
+    ratings = rating_matrix(data_manager.iter_reviews(
+        ['user_id', 'movie_id', 'rating'], batch_size=10000))
+    patched = {}
+    if not full:
+        movie_ids, patched = _patch_neighbours(data_manager, ratings,
+                                               changed, top_k)
+        full = len(movie_ids) > FULL_REFRESH_SHARE * len(
+            ratings.movie_ids())
+    if full:
+        movie_ids, patched = ratings.movie_ids(), {}
+    neighbours = ratings.top_neighbours(movie_ids, top_k)
+    for movie_id, similar in patched.items():
+        neighbours.extend((movie_id, other_id, score)
+                          for other_id, score in similar)
+    data_manager.replace_similarities(
+        neighbours, None if full else movie_ids | set(patched),
+        last_change_id)
+    return RefreshResult(len(movie_ids), len(patched), len(neighbours),
+                         time.perf_counter() - started, ratings.backend)
+
+
+def _patch_neighbours(data_manager, ratings, changed, top_k):
+    """
+    Sort the movies affected by the rating changes of `changed` into those
+    whose neighbours have to be recomputed and those whose stored list
+    can be updated from the rows of the changed movies.
+
+    Only the similarities with a changed movie moved. A stored list
+    shorter than top_k held every similar movie, so it is updated exactly;
+    so is a full list whose last entry is still the old one or scores
+    above it, since every movie it left out ranked below that. Any other
+    list may now let in a movie it left out and is recomputed.
+
+    :return: A tuple (set of the movie IDs to recompute, the changed ones
+    included; dict of movie ID -> new list of (similar movie ID, score)
+    of the lists updated in place).
+    """
+    scores = ratings.scores_with(changed)
+    affected = (set(scores) | data_manager.get_movies_listing_similar(
+        changed)) - changed
+    stored = data_manager.get_similarities(affected)
+    recompute, patched = set(changed), {}
+    for movie_id in affected:
+        old = stored.get(movie_id, [])
+        similar = {other_id: score for other_id, score in old
+                   if other_id not in changed}
+        similar.update(scores.get(movie_id, {}))
+        new = sorted(similar.items(),
+                     key=lambda item: (-item[1], item[0]))[:top_k]
+        if new == old:
+            continue
+        # The old last entry kept, or beaten by more than sim(a, b) and
+        # sim(b, a) can round apart
+        if len(old) < top_k or len(new) == top_k and (
+                new[-1] == old[-1]
+                or new[-1][1] > old[-1][1] + 10 ** -SCORE_DECIMALS):
+            patched[movie_id] = new
+        else:
+            recompute.add(movie_id)
+    return recompute, patched